@@ -1,17 +1,8 @@
-from fastapi import FastAPI
-from mangum import Mangum
+import os
+import sys
 
-# Create a minimal FastAPI app
-app = FastAPI()
-
-@app.get("/")
-async def root():
-    return {"message": "API is working!"}
-
-@app.get("/api/hello")
-async def hello():
-    return {"message": "Hello from FastAPI on Vercel!"}
-
-# Create handler for Vercel
-handler = Mangum(app)
+# Vercel runs this file from api/; make the repo root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Serve the full auth service; it is imported when the function initializes
+from auth_service.serverless import app, handler  # noqa: E402,F401
@@ -0,0 +1,92 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Optional
+import logging
+
+from auth_service.core.config import settings
+from auth_service.core.exceptions import AuthException
+from auth_service.core.responses import NDJSONStreamingResponse, render_ndjson
+from auth_service.api.api_v1.endpoints.auth import auth_service
+from auth_service.api.api_v1.endpoints.users import user_service
+from auth_service.services.user_import import UserImporter, iter_csv_rows, iter_jsonl_rows, iter_lines
+from auth_service.dependencies.auth import verify_internal_api_key
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(dependencies=[Depends(verify_internal_api_key)])
+
+@router.post("/users/import")
+async def import_users(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(jsonl|csv)$"),
+    concurrency: Optional[int] = Query(None, ge=1, le=64),
+) -> Any:
+    """
+    Sign up users from a JSONL or CSV body (header row, same fields as signup).
+
+    The body is read as it arrives and one NDJSON line is streamed back per
+    row, with progress lines along the way and a summary at the end.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "csv" if "csv" in content_type else "jsonl"
+
+    lines = iter_lines(request.stream(), settings.ADMIN_IMPORT_MAX_LINE_BYTES)
+    rows = iter_csv_rows(lines) if format == "csv" else iter_jsonl_rows(lines)
+    importer = UserImporter(
+        auth_service,
+        user_service,
+        concurrency=concurrency or settings.ADMIN_IMPORT_CONCURRENCY,
+        progress_every=settings.ADMIN_IMPORT_PROGRESS_EVERY,
+    )
+
+    async def body() -> AsyncIterator[bytes]:
+        try:
+            async for item in importer.run(rows):
+                yield render_ndjson(item)
+        except Exception as e:
+            # Headers are already sent, so the error is reported in-band
+            logger.error("User import aborted: %s", e)
+            yield render_ndjson({"error": f"Import aborted: {str(e)}"})
+
+    logger.info("Starting %s user import", format)
+    return NDJSONStreamingResponse(body())
+
+@router.get("/users/export")
+async def export_users(page_size: Optional[int] = Query(None, ge=1, le=10000)) -> Any:
+    """
+    Stream every user profile as NDJSON, one row per line, in id order.
+    """
+    pages = user_service.iter_profile_pages(page_size or settings.ADMIN_EXPORT_PAGE_SIZE)
+    
+    # Fetch the first page before answering so upstream errors get a real status
+    try:
+        first_page = await pages.__anext__()
+    except StopAsyncIteration:
+        first_page = []
+    except AuthException as e:
+        logger.error("Auth exception in export_users: %s", e.detail)
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers=e.headers
+        )
+    
+    async def body() -> AsyncIterator[bytes]:
+        exported = len(first_page)
+        try:
+            if first_page:
+                yield b"".join(render_ndjson(row) for row in first_page)
+            async for page in pages:
+                exported += len(page)
+                yield b"".join(render_ndjson(row) for row in page)
+        except Exception as e:
+            logger.error("User export aborted after %s rows: %s", exported, e)
+            yield render_ndjson({"error": f"Export aborted: {str(e)}"})
+        finally:
+            await pages.aclose()
+        logger.info("Exported %s user profiles", exported)
+    
+    # Nothing to read from the request, so Starlette can watch for the client
+    # leaving and stop fetching pages
+    return StreamingResponse(body(), media_type=NDJSONStreamingResponse.media_type)
@@ -1,18 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import Any
+from jose import JWTError, jwt as jose_jwt
+from typing import Any, Dict
 from datetime import timedelta
 
 from auth_service.core.config import settings
 from auth_service.core.security import create_access_token
-from auth_service.core.exceptions import AuthException
+from auth_service.core.rate_limit import enforce_rate_limit
+from auth_service.core.revocation import get_revocation_list
+from auth_service.core.refresh_tokens import get_refresh_token_manager, InvalidRefreshTokenError
+from auth_service.core.responses import respond, token_adapter
+from auth_service.core.exceptions import AuthException, UpstreamUnavailableException
 from auth_service.schemas.auth import (
     Token, UserSignUp, MagicLinkRequest, PhoneLoginRequest, 
     PhoneVerifyRequest, PasswordResetRequest, PasswordResetConfirm,
-    GoogleAuthRequest, GoogleAuthUrlRequest
+    GoogleAuthRequest, GoogleAuthUrlRequest, RefreshTokenRequest,
+    IntrospectionRequest, IntrospectionResponse
 )
 from auth_service.services.auth import AuthService
-from auth_service.dependencies.auth import get_current_user
+from auth_service.dependencies.auth import get_current_user, verify_token, verify_internal_api_key
 import logging
 import jwt
 
@@ -21,6 +27,22 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 auth_service = AuthService()
 
+async def _issue_tokens(user_id: str, refresh_token: str = None) -> Any:
+    """Mint an access token, plus a new refresh token unless one is given"""
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        subject=user_id, expires_delta=access_token_expires
+    )
+    if refresh_token is None:
+        refresh_token = await get_refresh_token_manager().issue(user_id)
+    
+    return respond(token_adapter, {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": int(access_token_expires.total_seconds()),
+        "refresh_token": refresh_token
+    })
+
 @router.post("/signup", response_model=dict)
 async def signup(user_data: UserSignUp) -> Any:
     """
@@ -29,6 +51,8 @@ async def signup(user_data: UserSignUp) -> Any:
     try:
         result = await auth_service.signup(user_data)
         return {"message": "User registered successfully", "user": result}
+    except UpstreamUnavailableException:
+        raise
     except Exception as e:
         raise AuthException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -36,10 +60,11 @@ async def signup(user_data: UserSignUp) -> Any:
         )
 
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()) -> Any:
+async def login(http_request: Request, form_data: OAuth2PasswordRequestForm = Depends()) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests.
     """
+    await enforce_rate_limit("login", http_request, email=form_data.username)
     try:
         user = await auth_service.authenticate(
             email=form_data.username,
@@ -52,15 +77,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()) -> Any:
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            subject=user["id"], expires_delta=access_token_expires
-        )
-        
-        return {
-            "access_token": access_token,
-            "token_type": "bearer"
-        }
+        return await _issue_tokens(user["id"])
     except AuthException as e:
         raise e
     except Exception as e:
@@ -69,14 +86,34 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()) -> Any:
             detail=str(e)
         )
 
+@router.post("/refresh", response_model=Token)
+async def refresh_access_token(request: RefreshTokenRequest, http_request: Request) -> Any:
+    """
+    Exchange a refresh token for a new access token and a rotated refresh token.
+    """
+    await enforce_rate_limit("refresh", http_request)
+    try:
+        user_id, refresh_token = await get_refresh_token_manager().rotate(request.refresh_token)
+    except InvalidRefreshTokenError as e:
+        raise AuthException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    return await _issue_tokens(user_id, refresh_token)
+
 @router.post("/magic-link", response_model=dict)
-async def send_magic_link(request: MagicLinkRequest) -> Any:
+async def send_magic_link(request: MagicLinkRequest, http_request: Request) -> Any:
     """
     Send a magic link to the user's email.
     """
+    await enforce_rate_limit("magic_link", http_request, email=request.email)
     try:
         await auth_service.send_magic_link(request.email, request.redirect_to)
         return {"message": "Magic link sent to your email"}
+    except UpstreamUnavailableException:
+        raise
     except Exception as e:
         raise AuthException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -84,13 +121,16 @@ async def send_magic_link(request: MagicLinkRequest) -> Any:
         )
 
 @router.post("/phone/login", response_model=dict)
-async def phone_login(request: PhoneLoginRequest) -> Any:
+async def phone_login(request: PhoneLoginRequest, http_request: Request) -> Any:
     """
     Start phone number authentication.
     """
+    await enforce_rate_limit("phone_login", http_request, phone=request.phone)
     try:
         await auth_service.send_phone_otp(request.phone)
         return {"message": "Verification code sent to your phone"}
+    except UpstreamUnavailableException:
+        raise
     except Exception as e:
         raise AuthException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -98,22 +138,16 @@ async def phone_login(request: PhoneLoginRequest) -> Any:
         )
 
 @router.post("/phone/verify", response_model=Token)
-async def verify_phone(request: PhoneVerifyRequest) -> Any:
+async def verify_phone(request: PhoneVerifyRequest, http_request: Request) -> Any:
     """
     Verify phone number with token.
     """
+    await enforce_rate_limit("phone_verify", http_request, phone=request.phone)
     try:
         user = await auth_service.verify_phone_otp(request.phone, request.token)
-        
-        access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            subject=user["id"], expires_delta=access_token_expires
-        )
-        
-        return {
-            "access_token": access_token,
-            "token_type": "bearer"
-        }
+        return await _issue_tokens(user["id"])
+    except UpstreamUnavailableException:
+        raise
     except Exception as e:
         raise AuthException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -121,13 +155,16 @@ async def verify_phone(request: PhoneVerifyRequest) -> Any:
         )
 
 @router.post("/reset-password", response_model=dict)
-async def reset_password(request: PasswordResetRequest) -> Any:
+async def reset_password(request: PasswordResetRequest, http_request: Request) -> Any:
     """
     Request password reset.
     """
+    await enforce_rate_limit("reset_password", http_request, email=request.email)
     try:
         await auth_service.request_password_reset(request.email)
         return {"message": "Password reset instructions sent to your email"}
+    except UpstreamUnavailableException:
+        raise
     except Exception as e:
         raise AuthException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -142,6 +179,8 @@ async def reset_password_confirm(request: PasswordResetConfirm) -> Any:
     try:
         await auth_service.confirm_password_reset(request.token, request.password)
         return {"message": "Password has been reset successfully"}
+    except UpstreamUnavailableException:
+        raise
     except Exception as e:
         raise AuthException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -154,31 +193,83 @@ async def logout(current_user: dict = Depends(get_current_user)) -> Any:
     Logout user.
     """
     try:
-        await auth_service.logout(current_user["id"])
+        await get_refresh_token_manager().revoke_user(current_user["id"])
+        
+        # Our own access tokens would stay valid until they expire
+        claims = jose_jwt.get_unverified_claims(current_user["token"])
+        if claims.get("jti") and claims.get("exp"):
+            await get_revocation_list().revoke(claims["jti"], claims["exp"])
+        
+        # Supabase tokens also end their upstream session. That is best effort:
+        # the user is logged out of this service either way.
+        if claims.get("iss") != settings.JWT_ISSUER:
+            try:
+                await auth_service.logout(current_user["token"])
+            except AuthException as e:
+                logger.warning("Upstream logout failed for user %s: %s", current_user["id"], e.detail)
         return {"message": "Successfully logged out"}
+    except UpstreamUnavailableException:
+        raise
     except Exception as e:
         raise AuthException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
     
+@router.post("/introspect", response_model=IntrospectionResponse, dependencies=[Depends(verify_internal_api_key)])
+async def introspect(request: IntrospectionRequest) -> Any:
+    """
+    Verify a batch of tokens with the same rules as get_current_user (API gateway).
+    """
+    if len(request.tokens) > settings.INTROSPECTION_MAX_TOKENS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.INTROSPECTION_MAX_TOKENS} tokens per request"
+        )
+    
+    # Each distinct token is verified once per batch
+    verified: Dict[str, Dict[str, Any]] = {}
+    results = []
+    for token in request.tokens:
+        if token.startswith("Bearer "):
+            token = token.split(" ")[1]
+        
+        result = verified.get(token)
+        if result is None:
+            try:
+                claims = await verify_token(token)
+                if claims.get("sub"):
+                    result = {"active": True, "sub": claims["sub"], "exp": claims.get("exp"), "claims": claims}
+                else:
+                    result = {"active": False, "error": "missing subject claim"}
+            except JWTError as e:
+                result = {"active": False, "error": str(e)}
+            except Exception as e:
+                # A malformed token must not fail the rest of the batch
+                logger.warning("Unexpected error introspecting a token: %r", e)
+                result = {"active": False, "error": "Malformed token"}
+            verified[token] = result
+        results.append(result)
+    
+    return {"results": results}
+
 @router.get("/google/url", response_model=dict)
 async def get_google_auth_url(redirect_uri: str = Query(...)) -> Any:
     """
     Get Google OAuth URL for client-side redirect.
     """
     try:
-        logger.info(f"Getting Google auth URL with redirect: {redirect_uri}")
+        logger.info("Getting Google auth URL with redirect: %s", redirect_uri)
         result = await auth_service.get_google_auth_url(redirect_uri)
         return result
     except AuthException as e:
-        logger.error(f"Auth exception in get_google_auth_url: {e.detail}")
+        logger.error("Auth exception in get_google_auth_url: %s", e.detail)
         raise HTTPException(
             status_code=e.status_code,
             detail=e.detail
         )
     except Exception as e:
-        logger.error(f"Unexpected error in get_google_auth_url: {str(e)}")
+        logger.error("Unexpected error in get_google_auth_url: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error getting Google auth URL: {str(e)}"
@@ -191,8 +282,8 @@ async def google_callback(request: GoogleAuthRequest) -> Any:
     """
     try:
         logger.info("Processing Google authentication callback")
-        logger.info(f"Code received: {request.code[:10]}... (truncated)")
-        logger.info(f"Redirect URI: {request.redirect_uri}")
+        logger.info("Code received: %s... (truncated)", request.code[:10])
+        logger.info("Redirect URI: %s", request.redirect_uri)
         
         # Exchange the code for tokens
         result = await auth_service.handle_google_callback(request.code, request.redirect_uri)
@@ -207,8 +298,10 @@ async def google_callback(request: GoogleAuthRequest) -> Any:
             "refresh_token": result.get("refresh_token"),
             "user": result.get("user")
         }
+    except UpstreamUnavailableException:
+        raise
     except Exception as e:
-        logger.error(f"Unexpected error in google_callback: {str(e)}")
+        logger.error("Unexpected error in google_callback: %s", e)
         # Return a valid response even in case of error to prevent hanging
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -224,7 +317,7 @@ async def debug_token(request: Request):
     
     try:
         # Log the raw header
-        logger.info(f"Raw Authorization header: {auth_header}")
+        logger.info("Raw Authorization header: %s", auth_header)
         
         # Extract token
         if " " in auth_header:
@@ -233,14 +326,14 @@ async def debug_token(request: Request):
             token_type = "Unknown"
             token = auth_header
         
-        logger.info(f"Token type: {token_type}, Token (first 20 chars): {token[:20]}...")
+        logger.info("Token type: %s, Token (first 20 chars): %s...", token_type, token[:20])
         
         # Try to decode header without verification
         try:
             header = jwt.get_unverified_header(token)
-            logger.info(f"Token header: {header}")
+            logger.info("Token header: %s", header)
         except Exception as e:
-            logger.error(f"Failed to decode token header: {str(e)}")
+            logger.error("Failed to decode token header: %s", e)
             header = {"error": str(e)}
         
         # Try to decode payload without verification
@@ -251,9 +344,9 @@ async def debug_token(request: Request):
                 key="dummy_key_for_unverified_jwt",
                 options={"verify_signature": False}
             )
-            logger.info(f"Token payload keys: {list(payload.keys())}")
+            logger.info("Token payload keys: %s", list(payload.keys()))
         except Exception as e:
-            logger.error(f"Failed to decode token payload: {str(e)}")
+            logger.error("Failed to decode token payload: %s", e)
             payload = {"error": str(e)}
         
         # Return token info
@@ -270,7 +363,7 @@ async def debug_token(request: Request):
             "issued_at": payload.get("iat") if isinstance(payload, dict) else None,
         }
     except Exception as e:
-        logger.error(f"Error in debug-token endpoint: {str(e)}")
+        logger.error("Error in debug-token endpoint: %s", e)
         return {"error": f"Failed to analyze token: {str(e)}"}
     
 
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, status
 from typing import Any
 
-from auth_service.core.exceptions import AuthException
+from auth_service.core.exceptions import AuthException, UpstreamUnavailableException
 from auth_service.schemas.auth import Token, GoogleAuthRequest
 from auth_service.services.social import SocialAuthService
 from datetime import timedelta
@@ -28,6 +28,8 @@ async def google_auth(request: GoogleAuthRequest) -> Any:
             "access_token": access_token,
             "token_type": "bearer"
         }
+    except UpstreamUnavailableException:
+        raise
     except Exception as e:
         raise AuthException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -4,14 +4,21 @@ import logging
 from jose import jwt as jose_jwt
 
 from auth_service.core.exceptions import AuthException
-from auth_service.schemas.user import UserProfile, UserResponse
+from auth_service.core.config import settings
+from auth_service.core.metrics import register_cache
+from auth_service.core.responses import respond, user_response_adapter
+from auth_service.schemas.user import (
+    UserProfile, UserResponse, ProfileWebhookPayload,
+    UserBatchRequest, UserBatchResponse
+)
 from auth_service.services.user import UserService
-from auth_service.dependencies.auth import get_current_user
+from auth_service.dependencies.auth import get_current_user, verify_internal_api_key
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 user_service = UserService()
+register_cache("profile", user_service.profile_cache.stats)
 
 @router.get("/me", response_model=UserResponse)
 async def get_user_profile(current_user: dict = Depends(get_current_user)) -> Any:
@@ -19,17 +26,18 @@ async def get_user_profile(current_user: dict = Depends(get_current_user)) -> An
     Get current user profile.
     """
     try:
-        logger.info(f"Getting profile for user ID: {current_user['id']}")
+        logger.info("Getting profile for user ID: %s", current_user['id'])
         user = await user_service.get_user_by_id(current_user["id"], current_user["token"])
-        return user
+        return respond(user_response_adapter, user)
     except AuthException as e:
-        logger.error(f"Auth exception in get_user_profile: {e.detail}")
+        logger.error("Auth exception in get_user_profile: %s", e.detail)
         raise HTTPException(
             status_code=e.status_code,
-            detail=e.detail
+            detail=e.detail,
+            headers=e.headers
         )
     except Exception as e:
-        logger.error(f"Unexpected error in get_user_profile: {str(e)}")
+        logger.error("Unexpected error in get_user_profile: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error retrieving user profile: {str(e)}"
@@ -44,22 +52,51 @@ async def update_user_profile(
     Update user profile.
     """
     try:
-        logger.info(f"Updating profile for user ID: {current_user['id']}")
+        logger.info("Updating profile for user ID: %s", current_user['id'])
         updated_user = await user_service.update_user(current_user["id"], profile, current_user["token"])
-        return updated_user
+        return respond(user_response_adapter, updated_user)
     except AuthException as e:
-        logger.error(f"Auth exception in update_user_profile: {e.detail}")
+        logger.error("Auth exception in update_user_profile: %s", e.detail)
         raise HTTPException(
             status_code=e.status_code,
-            detail=e.detail
+            detail=e.detail,
+            headers=e.headers
         )
     except Exception as e:
-        logger.error(f"Unexpected error in update_user_profile: {str(e)}")
+        logger.error("Unexpected error in update_user_profile: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error updating user profile: {str(e)}"
         )
 
+@router.post("/batch", response_model=UserBatchResponse, dependencies=[Depends(verify_internal_api_key)])
+async def get_users_batch(request: UserBatchRequest) -> Any:
+    """
+    Resolve many user IDs to profiles in one call (internal services).
+    """
+    if len(request.ids) > settings.USER_BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.USER_BATCH_MAX_IDS} ids per request"
+        )
+    
+    try:
+        users, missing = await user_service.get_users_by_ids([str(user_id) for user_id in request.ids])
+        return {"users": users, "missing": missing}
+    except AuthException as e:
+        logger.error("Auth exception in get_users_batch: %s", e.detail)
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers=e.headers
+        )
+    except Exception as e:
+        logger.error("Unexpected error in get_users_batch: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving users: {str(e)}"
+        )
+
 @router.get("/token-debug")
 async def debug_token(current_user: dict = Depends(get_current_user)) -> Dict[str, Any]:
     """
@@ -70,9 +107,23 @@ async def debug_token(current_user: dict = Depends(get_current_user)) -> Dict[st
         decoded = jose_jwt.decode(token, options={"verify_signature": False})
         return {"token_payload": decoded}
     except Exception as e:
-        logger.error(f"Error decoding token: {str(e)}")
+        logger.error("Error decoding token: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error decoding token: {str(e)}"
         )
 
+@router.post("/cache/invalidate", dependencies=[Depends(verify_internal_api_key)])
+async def invalidate_profile_cache(payload: ProfileWebhookPayload) -> Dict[str, Any]:
+    """
+    Drop cached profiles changed outside this service (Supabase database webhook).
+    """
+    user_ids = set()
+    for record in (payload.record, payload.old_record):
+        if record and record.get("id"):
+            user_ids.add(str(record["id"]))
+    
+    await user_service.invalidate_profiles(sorted(user_ids))
+    
+    logger.info("Invalidated cached profiles for %s users (%s on %s)", len(user_ids), payload.type, payload.table)
+    return {"invalidated": sorted(user_ids)}
@@ -0,0 +1,160 @@
+from collections import deque
+from typing import Deque, Dict, List, Optional
+import asyncio
+import logging
+import math
+from auth_service.core.config import settings
+from auth_service.core.exceptions import UpstreamUnavailableException
+from auth_service.core.metrics import Counter, Gauge, registry
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class AdaptiveConcurrencyLimiter:
+    """Bounds in-flight upstream calls with a limit that follows upstream latency.
+
+    The limit is adjusted after every call by the ratio between the
+    long-term average latency and the latest sample (a gradient): when the
+    upstream slows down the ratio drops below one and the limit shrinks,
+    when it recovers the limit grows back by about sqrt(limit) per call.
+    Timeouts and 5xx responses cut the limit multiplicatively. Callers over
+    the limit wait in a bounded queue for at most ``queue_timeout`` seconds
+    and are shed with a 503 after that.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int = 20,
+        min_limit: int = 2,
+        max_limit: int = 200,
+        max_queue: int = 50,
+        queue_timeout: float = 0.5,
+        smoothing: float = 0.2,
+        rtt_window: int = 500,
+        backoff: float = 0.9,
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.smoothing = smoothing
+        self.backoff = backoff
+        self.in_flight = 0
+        self.shed = 0
+        self.long_rtt: Optional[float] = None
+        self._rtt_alpha = 2.0 / (rtt_window + 1)
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _reject(self, reason: str) -> UpstreamUnavailableException:
+        self.shed += 1
+        logger.debug("Shedding %s upstream call (%s), limit %s, in flight %s", self.name, reason, int(self.limit), self.in_flight)
+        return UpstreamUnavailableException(detail=f"Upstream {self.name} is overloaded, please retry")
+
+    async def acquire(self) -> None:
+        """Take a slot, waiting briefly in the queue if none is free"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue full")
+
+        # A timer rather than wait_for: before Python 3.12, wait_for returns
+        # normally when cancelled just after the slot was granted
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        timer = loop.call_later(self.queue_timeout, self._expire, waiter)
+        try:
+            await waiter
+        except asyncio.TimeoutError:
+            raise self._reject("queue timeout")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                # Granted a slot after the caller gave up, hand it on
+                self.in_flight -= 1
+                self._wake()
+            waiter.cancel()
+            raise
+        finally:
+            timer.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    @staticmethod
+    def _expire(waiter: asyncio.Future) -> None:
+        if not waiter.done():
+            waiter.set_exception(asyncio.TimeoutError())
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def release(self, latency: Optional[float] = None, dropped: bool = False) -> None:
+        """Return a slot and adapt the limit to the observed outcome"""
+        self.in_flight -= 1
+
+        if dropped:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif latency is not None and latency > 0:
+            if self.long_rtt is None:
+                self.long_rtt = latency
+            else:
+                self.long_rtt += self._rtt_alpha * (latency - self.long_rtt)
+
+            # Don't grow the limit while it isn't being used
+            if self.in_flight * 2 >= self.limit:
+                gradient = max(0.5, min(1.0, self.long_rtt / latency))
+                new_limit = self.limit * gradient + math.sqrt(self.limit)
+                self.limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+                self.limit = max(self.min_limit, min(self.max_limit, self.limit))
+
+        self._wake()
+
+_limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+
+def get_admission_limiter(name: str) -> Optional[AdaptiveConcurrencyLimiter]:
+    """Get the limiter for an upstream endpoint class, or None when disabled"""
+    if not settings.ADMISSION_ENABLED:
+        return None
+    limiter = _limiters.get(name)
+    if limiter is None:
+        limiter = _limiters[name] = AdaptiveConcurrencyLimiter(
+            name,
+            initial_limit=settings.ADMISSION_INITIAL_LIMIT,
+            min_limit=settings.ADMISSION_MIN_LIMIT,
+            max_limit=settings.ADMISSION_MAX_LIMIT,
+            max_queue=settings.ADMISSION_MAX_QUEUE,
+            queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        )
+    return limiter
+
+def admission_limiters() -> Dict[str, AdaptiveConcurrencyLimiter]:
+    """Get all limiters created so far"""
+    return dict(_limiters)
+
+def _collect_limiters() -> List:
+    limit = Gauge("admission_limit", "Current adaptive concurrency limit", ("endpoint_class",))
+    in_flight = Gauge("admission_in_flight", "Admitted upstream calls in flight", ("endpoint_class",))
+    queued = Gauge("admission_queued", "Calls waiting for an admission slot", ("endpoint_class",))
+    shed = Counter("admission_shed_total", "Calls shed with a 503", ("endpoint_class",))
+    for name, limiter in admission_limiters().items():
+        limit.set(name, value=int(limiter.limit))
+        in_flight.set(name, value=limiter.in_flight)
+        queued.set(name, value=limiter.queued)
+        shed.inc(name, amount=limiter.shed)
+    return [limit, in_flight, queued, shed]
+
+registry.add_collector(_collect_limiters)
@@ -0,0 +1,147 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import time
+
+class TokenCache:
+    """Bounded LRU cache of verified token claims keyed by a hash of the token.
+
+    Entries expire at the token's own ``exp`` claim or after ``max_ttl``
+    seconds, whichever comes first. Only successfully verified tokens may be
+    stored; callers must never cache the result of a failed verification.
+    """
+
+    def __init__(self, max_size: int, max_ttl: float):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Get the cached claims for a token, or None on a miss"""
+        if self.max_size <= 0:
+            return None
+
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, claims = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(claims)
+
+    def set(self, token: str, claims: Dict[str, Any], exp: Optional[float] = None) -> None:
+        """Cache verified claims until min(exp, now + max_ttl)"""
+        if self.max_size <= 0:
+            return
+
+        now = time.time()
+        expires_at = now + self.max_ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        if expires_at <= now:
+            return
+
+        key = self._key(token)
+        self._entries[key] = (expires_at, dict(claims))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, token: str) -> None:
+        """Drop a token from the cache"""
+        self._entries.pop(self._key(token), None)
+
+    def clear(self) -> None:
+        """Drop all cached tokens"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Get size and hit/miss counters"""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+class ProfileCache:
+    """Bounded LRU cache of profile rows with a stale-while-revalidate window.
+
+    Entries are fresh for ``ttl`` seconds and may then be served as stale
+    for another ``stale_ttl`` seconds while the caller revalidates them.
+    """
+
+    def __init__(self, max_size: int, ttl: float, stale_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, user_id: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Get ``(profile, is_fresh)``; profile is None on a miss"""
+        if self.max_size <= 0:
+            return None, False
+
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None, False
+
+        stored_at, profile = entry
+        age = time.monotonic() - stored_at
+        if age > self.ttl + self.stale_ttl:
+            del self._entries[user_id]
+            self.misses += 1
+            return None, False
+
+        self._entries.move_to_end(user_id)
+        if age > self.ttl:
+            self.stale_hits += 1
+            return dict(profile), False
+        self.hits += 1
+        return dict(profile), True
+
+    def set(self, user_id: str, profile: Dict[str, Any], age: float = 0.0) -> None:
+        """Store a profile fetched ``age`` seconds ago"""
+        if self.max_size <= 0:
+            return
+
+        self._entries[user_id] = (time.monotonic() - age, dict(profile))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a user's profile"""
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        """Drop all cached profiles"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Get size and hit/miss counters"""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
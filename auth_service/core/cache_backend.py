@@ -0,0 +1,620 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import unquote, urlparse
+import asyncio
+import logging
+import time
+import uuid
+from auth_service.core.config import settings
+from auth_service.core.metrics import Counter, Gauge, register_cache, registry
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Tags this process's invalidation messages so it can skip its own
+instance_id = uuid.uuid4().hex
+
+class CacheBackendError(Exception):
+    """Raised when the cache backend cannot be reached"""
+
+class CacheBackend:
+    """Key/value store with TTLs, atomic counters and pub/sub.
+
+    Values are bytes. Cache operations (``get``, ``get_many``, ``set``,
+    ``set_many``, ``delete``, ``publish``) fail soft: an unreachable backend
+    behaves like an empty one, so a cache outage never fails a request.
+    Counter updates raise CacheBackendError instead, because only the
+    caller knows what a safe fallback is, and so do ``read_many`` and
+    ``write_many`` for data that isn't a cache (e.g. sessions).
+
+    Subscribers are called with each message on their channel, and with
+    None when messages may have been missed (e.g. after a reconnect).
+    """
+
+    name = "base"
+    # Whether other workers and replicas see the same data
+    shared = False
+
+    def __init__(self):
+        # Origin of this backend's invalidation messages, the process's by default
+        self.instance_id = instance_id
+        self._subscribers: Dict[str, List[Callable[[Optional[bytes]], Any]]] = {}
+        self._invalidation_handlers: Dict[str, List[Tuple[Callable[[str], Any], Optional[Callable[[], Any]]]]] = {}
+
+    async def start(self) -> None:
+        """Open background resources (e.g. the pub/sub connection)"""
+
+    async def close(self) -> None:
+        """Release connections and background tasks"""
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Get a value, or None if it is missing or expired"""
+        return (await self.get_many([key]))[0]
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """Get several values in one round trip"""
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        """Store a value, expiring after ``ttl`` seconds if given"""
+        await self.set_many([(key, value, ttl)])
+
+    async def set_many(self, items: Sequence[Tuple[str, bytes, Optional[float]]]) -> None:
+        """Store several ``(key, value, ttl)`` entries in one round trip"""
+        raise NotImplementedError
+
+    async def delete(self, *keys: str) -> None:
+        """Drop keys"""
+        raise NotImplementedError
+
+    async def read_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """Like get_many, but raise CacheBackendError if the backend can't be reached"""
+        return await self.get_many(keys)
+
+    async def write_many(self, items: Sequence[Tuple[str, bytes, Optional[float]]]) -> None:
+        """Like set_many, but raise CacheBackendError if the backend can't be reached"""
+        await self.set_many(items)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add to a counter and return its new value"""
+        return (await self.incr_many([(key, amount, ttl)]))[0]
+
+    async def incr_many(self, items: Sequence[Tuple[str, int, Optional[float]]]) -> List[int]:
+        """Atomically add to several counters; missing ones start at 0 with the given TTL"""
+        raise NotImplementedError
+
+    async def publish(self, channel: str, message: bytes) -> None:
+        """Send a message to every subscriber of a channel, in every process"""
+        raise NotImplementedError
+
+    def subscribe(self, channel: str, callback: Callable[[Optional[bytes]], Any]) -> None:
+        """Call ``callback(message)`` for messages published on a channel"""
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def _dispatch(self, channel: str, message: Optional[bytes]) -> None:
+        for callback in self._subscribers.get(channel, ()):
+            try:
+                callback(message)
+            except Exception:
+                logger.exception("Error in subscriber for channel %s", channel)
+
+    async def invalidate(self, namespace: str, *keys: str) -> None:
+        """Tell the other workers to drop their local copies of some keys"""
+        if keys:
+            message = " ".join((self.instance_id, namespace) + keys)
+            await self.publish(settings.CACHE_INVALIDATION_CHANNEL, message.encode("utf-8"))
+
+    def on_invalidate(
+        self,
+        namespace: str,
+        callback: Callable[[str], Any],
+        clear: Optional[Callable[[], Any]] = None,
+    ) -> None:
+        """Call ``callback(key)`` when another worker invalidates a key in ``namespace``.
+
+        ``clear()`` is called instead when invalidations may have been lost.
+        """
+        if not self._invalidation_handlers:
+            self.subscribe(settings.CACHE_INVALIDATION_CHANNEL, self._on_invalidation_message)
+        self._invalidation_handlers.setdefault(namespace, []).append((callback, clear))
+
+    def _on_invalidation_message(self, message: Optional[bytes]) -> None:
+        if message is None:
+            for handlers in self._invalidation_handlers.values():
+                for _, clear in handlers:
+                    if clear is not None:
+                        clear()
+            return
+
+        origin, namespace, *keys = message.decode("utf-8", "replace").split(" ")
+        if origin == self.instance_id:
+            return
+        for callback, _ in self._invalidation_handlers.get(namespace, ()):
+            for key in keys:
+                callback(key)
+
+    def stats(self) -> Dict[str, int]:
+        """Get backend counters for the metrics endpoint"""
+        return {}
+
+class MemoryBackend(CacheBackend):
+    """In-process backend: a bounded LRU of values with expiry times.
+
+    Nothing is shared between workers, which makes it the right choice for
+    a single process and the fastest L1 in front of a shared backend.
+    Counters are stored as ints and read back as their decimal bytes, like
+    Redis does.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_size: int = 10000):
+        super().__init__()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[Optional[float], Union[bytes, int]]]" = OrderedDict()
+
+    def _lookup(self, key: str, now: float) -> Union[bytes, int, None]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key: str, value: Union[bytes, int], expires_at: Optional[float]) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        now = time.monotonic()
+        values = []
+        for key in keys:
+            value = self._lookup(key, now)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                if isinstance(value, int):
+                    value = str(value).encode()
+            values.append(value)
+        return values
+
+    async def set_many(self, items: Sequence[Tuple[str, bytes, Optional[float]]]) -> None:
+        now = time.monotonic()
+        for key, value, ttl in items:
+            self._store(key, value, now + ttl if ttl else None)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.discard(key)
+
+    def discard(self, key: str) -> None:
+        """Drop a key without awaiting"""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every key"""
+        self._entries.clear()
+
+    async def incr_many(self, items: Sequence[Tuple[str, int, Optional[float]]]) -> List[int]:
+        now = time.monotonic()
+        results = []
+        for key, amount, ttl in items:
+            value = self._lookup(key, now)
+            if value is None:
+                count = amount
+                expires_at = now + ttl if ttl else None
+            else:
+                count = int(value) + amount
+                expires_at = self._entries[key][0]
+            self._store(key, count, expires_at)
+            results.append(count)
+        return results
+
+    async def publish(self, channel: str, message: bytes) -> None:
+        self._dispatch(channel, message)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+class RedisReplyError(Exception):
+    """An error reply from the Redis server"""
+
+def _encode_command(command: Sequence[Any]) -> bytes:
+    parts = [b"*%d\r\n" % len(command)]
+    for arg in command:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+async def _read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readuntil(b"\r\n")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload
+    if kind == b"-":
+        return RedisReplyError(payload.decode("utf-8", "replace"))
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        size = int(payload)
+        if size < 0:
+            return None
+        return (await reader.readexactly(size + 2))[:-2]
+    if kind == b"*":
+        size = int(payload)
+        if size < 0:
+            return None
+        return [await _read_reply(reader) for _ in range(size)]
+    raise CacheBackendError(f"Unexpected Redis reply: {line!r}")
+
+class RedisBackend(CacheBackend):
+    """Backend speaking the Redis protocol (RESP2) over asyncio streams.
+
+    Connections come from a small pool and every call sends its commands
+    as one pipelined write, so a multi-get or a batch of counter updates
+    costs a single round trip. Each counter update runs in MULTI/EXEC so a
+    new counter is always created together with its TTL. Pub/sub uses its
+    own connection, re-established in the background. After a failure the
+    backend is considered down for ``retry_interval`` seconds so requests
+    fail fast instead of each waiting out a timeout.
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(
+        self,
+        url: str,
+        key_prefix: str = "",
+        pool_size: int = 10,
+        timeout: float = 0.25,
+        retry_interval: float = 1.0,
+    ):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.strip("/") or 0)
+        self.ssl = parsed.scheme == "rediss"
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.errors = 0
+        self.connections = 0
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self.pool_size = pool_size
+        # Created on first use: before Python 3.10 it binds to the loop current
+        # at construction, and backends are built at import time
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._down_until = 0.0
+        self._listener: Optional[asyncio.Task] = None
+        self._pubsub_writer: Optional[asyncio.StreamWriter] = None
+
+    def _key(self, key: str) -> str:
+        return self.key_prefix + key
+
+    async def _roundtrip(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        writer.write(b"".join(_encode_command(command) for command in commands))
+        await writer.drain()
+        return [await _read_reply(reader) for _ in commands]
+
+    async def _connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=True if self.ssl else None),
+            self.timeout,
+        )
+        self.connections += 1
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.username, self.password) if self.username else ("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            try:
+                replies = await asyncio.wait_for(self._roundtrip(reader, writer, setup), self.timeout)
+                for reply in replies:
+                    if isinstance(reply, RedisReplyError):
+                        raise CacheBackendError(f"Redis connection setup failed: {reply}")
+            except BaseException:
+                self._disconnect(writer)
+                raise
+        return reader, writer
+
+    def _disconnect(self, writer: asyncio.StreamWriter) -> None:
+        self.connections -= 1
+        writer.close()
+
+    async def _execute(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        """Send commands as one pipelined write and read back their replies"""
+        if time.monotonic() < self._down_until:
+            raise CacheBackendError("Redis backend is unavailable")
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+            try:
+                if connection is None:
+                    connection = await self._connect()
+                replies = await asyncio.wait_for(self._roundtrip(*connection, commands), self.timeout)
+            except BaseException as e:
+                # Unread replies would be handed to the next caller, so never reuse it
+                if connection is not None:
+                    self._disconnect(connection[1])
+                if isinstance(e, (OSError, EOFError, asyncio.TimeoutError, CacheBackendError)):
+                    self.errors += 1
+                    if time.monotonic() >= self._down_until:
+                        logger.warning("Redis backend unavailable, retrying in %.1fs: %r", self.retry_interval, e)
+                    self._down_until = time.monotonic() + self.retry_interval
+                    raise CacheBackendError(f"Redis request failed: {e!r}") from e
+                raise
+            self._idle.append(connection)
+            return replies
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        try:
+            return await self.read_many(keys)
+        except CacheBackendError:
+            return [None] * len(keys)
+
+    async def read_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        (values,) = await self._execute([("MGET", *(self._key(key) for key in keys))])
+        if not isinstance(values, list):
+            raise CacheBackendError(f"Redis MGET failed: {values!r}")
+        return values
+
+    async def set_many(self, items: Sequence[Tuple[str, bytes, Optional[float]]]) -> None:
+        try:
+            await self.write_many(items)
+        except CacheBackendError:
+            pass
+
+    async def write_many(self, items: Sequence[Tuple[str, bytes, Optional[float]]]) -> None:
+        commands = []
+        for key, value, ttl in items:
+            if ttl:
+                commands.append(("SET", self._key(key), value, "PX", max(1, int(ttl * 1000))))
+            else:
+                commands.append(("SET", self._key(key), value))
+        if commands:
+            replies = await self._execute(commands)
+            for reply in replies:
+                if isinstance(reply, RedisReplyError):
+                    raise CacheBackendError(f"Redis SET failed: {reply}")
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            try:
+                await self._execute([("DEL", *(self._key(key) for key in keys))])
+            except CacheBackendError:
+                pass
+
+    async def incr_many(self, items: Sequence[Tuple[str, int, Optional[float]]]) -> List[int]:
+        commands = []
+        for key, amount, ttl in items:
+            key = self._key(key)
+            commands.append(("MULTI",))
+            if ttl:
+                commands.append(("SET", key, 0, "PX", max(1, int(ttl * 1000)), "NX"))
+            else:
+                commands.append(("SET", key, 0, "NX"))
+            commands.append(("INCRBY", key, amount))
+            commands.append(("EXEC",))
+        replies = await self._execute(commands)
+
+        results = []
+        for i in range(len(items)):
+            # MULTI, SET, INCRBY, EXEC -> [set reply, new value]
+            transaction = replies[i * 4 + 3]
+            if not isinstance(transaction, list) or not isinstance(transaction[1], int):
+                raise CacheBackendError(f"Redis counter update failed: {transaction!r}")
+            results.append(transaction[1])
+        return results
+
+    async def publish(self, channel: str, message: bytes) -> None:
+        try:
+            await self._execute([("PUBLISH", channel, message)])
+        except CacheBackendError:
+            pass
+
+    def subscribe(self, channel: str, callback: Callable[[Optional[bytes]], Any]) -> None:
+        new_channel = channel not in self._subscribers
+        super().subscribe(channel, callback)
+        if new_channel and self._pubsub_writer is not None:
+            self._pubsub_writer.write(_encode_command(("SUBSCRIBE", channel)))
+
+    async def start(self) -> None:
+        if self._listener is None and self._subscribers:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        delay = 0.1
+        connected_before = False
+        while True:
+            try:
+                reader, writer = await self._connect()
+                try:
+                    writer.write(_encode_command(("SUBSCRIBE", *self._subscribers)))
+                    await writer.drain()
+                    self._pubsub_writer = writer
+                    if connected_before:
+                        # Whatever was published while we were away is lost
+                        for channel in self._subscribers:
+                            self._dispatch(channel, None)
+                    connected_before = True
+                    delay = 0.1
+                    while True:
+                        reply = await _read_reply(reader)
+                        if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                            self._dispatch(reply[1].decode("utf-8"), reply[2])
+                finally:
+                    self._pubsub_writer = None
+                    self._disconnect(writer)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Redis subscription lost, reconnecting in %.1fs: %r", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        while self._idle:
+            _, writer = self._idle.pop()
+            self._disconnect(writer)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "connections": self.connections,
+            "idle_connections": len(self._idle),
+            "errors": self.errors,
+        }
+
+class TieredBackend(CacheBackend):
+    """Process-local L1 in front of a shared L2.
+
+    Reads are served from the L1 for up to ``l1_ttl`` seconds. Writes and
+    deletes go to the L2 and are broadcast so the other workers drop their
+    L1 copies right away; the TTL only bounds staleness when a broadcast
+    is missed. Counters bypass the L1 since they only mean anything shared.
+    """
+
+    name = "tiered"
+    shared = True
+
+    def __init__(self, l2: CacheBackend, l1_max_size: int = 10000, l1_ttl: float = 5.0):
+        super().__init__()
+        self.l1 = MemoryBackend(l1_max_size)
+        self.l2 = l2
+        self.l1_ttl = l1_ttl
+        self.on_invalidate("l1", self.l1.discard, clear=self.l1.clear)
+
+    async def start(self) -> None:
+        await self.l2.start()
+
+    async def close(self) -> None:
+        await self.l2.close()
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        values = await self.l1.get_many(keys)
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            fetched = await self.l2.get_many([keys[i] for i in missing])
+            found = []
+            for i, value in zip(missing, fetched):
+                values[i] = value
+                if value is not None:
+                    found.append((keys[i], value, self.l1_ttl))
+            await self.l1.set_many(found)
+        return values
+
+    async def read_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        values = await self.l1.get_many(keys)
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            fetched = await self.l2.read_many([keys[i] for i in missing])
+            for i, value in zip(missing, fetched):
+                values[i] = value
+        return values
+
+    async def write_many(self, items: Sequence[Tuple[str, bytes, Optional[float]]]) -> None:
+        await self.l2.write_many(items)
+        await self._written(items)
+
+    async def set_many(self, items: Sequence[Tuple[str, bytes, Optional[float]]]) -> None:
+        await self.l2.set_many(items)
+        await self._written(items)
+
+    async def _written(self, items: Sequence[Tuple[str, bytes, Optional[float]]]) -> None:
+        await self.l1.set_many([
+            (key, value, min(ttl, self.l1_ttl) if ttl else self.l1_ttl)
+            for key, value, ttl in items
+        ])
+        await self.invalidate("l1", *(key for key, _, _ in items))
+
+    async def delete(self, *keys: str) -> None:
+        await self.l2.delete(*keys)
+        await self.l1.delete(*keys)
+        await self.invalidate("l1", *keys)
+
+    async def incr_many(self, items: Sequence[Tuple[str, int, Optional[float]]]) -> List[int]:
+        return await self.l2.incr_many(items)
+
+    async def publish(self, channel: str, message: bytes) -> None:
+        await self.l2.publish(channel, message)
+
+    def subscribe(self, channel: str, callback: Callable[[Optional[bytes]], Any]) -> None:
+        self.l2.subscribe(channel, callback)
+
+    def stats(self) -> Dict[str, int]:
+        return self.l2.stats()
+
+def create_cache_backend() -> CacheBackend:
+    """Build the backend selected by CACHE_BACKEND"""
+    kind = settings.CACHE_BACKEND.lower()
+    if kind == "memory":
+        return MemoryBackend(settings.CACHE_MEMORY_MAX_SIZE)
+
+    redis = RedisBackend(
+        settings.CACHE_REDIS_URL,
+        key_prefix=settings.CACHE_KEY_PREFIX,
+        pool_size=settings.CACHE_REDIS_POOL_SIZE,
+        timeout=settings.CACHE_REDIS_TIMEOUT_SECONDS,
+        retry_interval=settings.CACHE_REDIS_RETRY_SECONDS,
+    )
+    if kind == "redis":
+        return redis
+    if kind == "tiered":
+        return TieredBackend(redis, l1_max_size=settings.CACHE_L1_MAX_SIZE, l1_ttl=settings.CACHE_L1_TTL_SECONDS)
+    raise ValueError(f"Unknown CACHE_BACKEND: {settings.CACHE_BACKEND}")
+
+_backend: Optional[CacheBackend] = None
+
+def get_cache_backend() -> CacheBackend:
+    """Get the process-wide cache backend"""
+    global _backend
+    if _backend is None:
+        _backend = create_cache_backend()
+        if isinstance(_backend, MemoryBackend):
+            register_cache("backend", _backend.stats)
+        elif isinstance(_backend, TieredBackend):
+            register_cache("backend_l1", _backend.l1.stats)
+    return _backend
+
+def _collect_cache_backend() -> List[Union[Counter, Gauge]]:
+    if _backend is None or not _backend.shared:
+        return []
+    stats = _backend.stats()
+    connections = Gauge("cache_backend_connections", "Open connections to the shared cache backend")
+    connections.set(value=stats.get("connections", 0))
+    errors = Counter("cache_backend_errors_total", "Failed requests to the shared cache backend")
+    errors.inc(amount=stats.get("errors", 0))
+    return [connections, errors]
+
+registry.add_collector(_collect_cache_backend)
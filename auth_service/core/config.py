@@ -1,5 +1,5 @@
 import os
-from typing import List, Union
+from typing import List, Optional, Union
 from pydantic import AnyHttpUrl, validator
 from pydantic_settings import BaseSettings
 
@@ -14,11 +14,161 @@ class Settings(BaseSettings):
     SUPABASE_URL: str
     SUPABASE_KEY: str
     SUPABASE_JWT_SECRET: str
+    # Defaults to f"{SUPABASE_URL}/auth/v1"
+    SUPABASE_JWT_ISSUER: Optional[str] = None
     
     # JWT
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    JWT_ISSUER: str = "wiz-auth"
+    JWT_KEY_ID: str = "wiz-auth-1"
+    # Retired signing keys still accepted for verification: "kid:secret,kid:secret"
+    JWT_ADDITIONAL_KEYS: str = ""
+    
+    # Password hashing, done in a worker pool off the event loop. Hashes made
+    # with other rounds are upgraded the next time they are verified.
+    PASSWORD_BCRYPT_ROUNDS: int = 12
+    # 0 means one worker per CPU core
+    PASSWORD_HASH_WORKERS: int = 0
+    # Calls allowed to wait for a worker before new ones are refused with a 503
+    PASSWORD_HASH_MAX_QUEUE: int = 32
+    # "process", or "thread" on runtimes without multiprocessing (e.g. AWS Lambda)
+    PASSWORD_HASH_EXECUTOR: str = "process"
+    
+    # Refresh tokens: "cache" (the shared CACHE_BACKEND), "sqlite" (workers on
+    # one host) or "memory" (a single worker only); "auto" picks cache when
+    # the cache backend is shared and memory otherwise
+    REFRESH_TOKEN_STORE: str = "auto"
+    REFRESH_TOKEN_SQLITE_PATH: str = "refresh_tokens.db"
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    
+    # Upstream HTTP client
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP2_ENABLED: bool = False
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    HTTP_TIMEOUT_AUTH_SECONDS: float = 10.0
+    HTTP_TIMEOUT_REST_SECONDS: float = 5.0
+    HTTP_TIMEOUT_OTP_SECONDS: float = 15.0
+    
+    # JWKS public keys for asymmetric (RS256/ES256) tokens
+    JWKS_URL: Optional[str] = None
+    JWKS_FILE: Optional[str] = None
+    # Defaults to the Supabase issuer
+    JWKS_ISSUER: Optional[str] = None
+    JWKS_REFRESH_INTERVAL_SECONDS: int = 600
+    JWKS_REFRESH_JITTER: float = 0.1
+    JWKS_MIN_REFETCH_INTERVAL_SECONDS: float = 30.0
+    
+    # Adaptive concurrency limits per upstream endpoint class (auth, rest, otp)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_INITIAL_LIMIT: int = 20
+    ADMISSION_MIN_LIMIT: int = 2
+    ADMISSION_MAX_LIMIT: int = 200
+    ADMISSION_MAX_QUEUE: int = 50
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 0.5
+    
+    # Circuit breakers per upstream endpoint and budgeted retries
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_BREAKER_RECOVERY_SECONDS: float = 30.0
+    RETRY_MAX_ATTEMPTS: int = 2
+    RETRY_BACKOFF_BASE_SECONDS: float = 0.05
+    RETRY_BACKOFF_MAX_SECONDS: float = 1.0
+    # Retries may add at most this fraction of extra upstream load
+    RETRY_BUDGET_RATIO: float = 0.1
+    RETRY_BUDGET_MIN_PER_SECOND: float = 1.0
+    
+    # Cache and counter backend: "memory" (per process), "redis" (shared by
+    # every worker and replica) or "tiered" (per-process L1 in front of redis)
+    CACHE_BACKEND: str = "memory"
+    CACHE_MEMORY_MAX_SIZE: int = 10000
+    CACHE_REDIS_URL: str = "redis://127.0.0.1:6379/0"
+    CACHE_REDIS_POOL_SIZE: int = 10
+    CACHE_REDIS_TIMEOUT_SECONDS: float = 0.25
+    # After a failure, skip redis for this long instead of timing out on every call
+    CACHE_REDIS_RETRY_SECONDS: float = 1.0
+    CACHE_KEY_PREFIX: str = "wiz-auth:"
+    CACHE_L1_MAX_SIZE: int = 10000
+    CACHE_L1_TTL_SECONDS: float = 5.0
+    CACHE_INVALIDATION_CHANNEL: str = "wiz-auth:invalidate"
+    
+    # Verified token cache (0 disables)
+    TOKEN_CACHE_MAX_SIZE: int = 10000
+    TOKEN_CACHE_MAX_TTL_SECONDS: int = 300
+    
+    # Revoked access tokens, kept by jti until they expire
+    REVOCATION_BLOOM_CAPACITY: int = 100000
+    REVOCATION_BLOOM_ERROR_RATE: float = 0.001
+    REVOCATION_COMPACT_INTERVAL_SECONDS: float = 300.0
+    # Restored on startup and rewritten after every compaction
+    REVOCATION_SNAPSHOT_PATH: Optional[str] = None
+    # Longest access token lifetime; starting workers load the revocations
+    # stored in a shared cache backend within it
+    REVOCATION_MAX_TOKEN_LIFETIME_SECONDS: int = 86400
+    
+    # Profile cache (0 disables)
+    PROFILE_CACHE_MAX_SIZE: int = 10000
+    PROFILE_CACHE_TTL_SECONDS: int = 60
+    PROFILE_CACHE_STALE_TTL_SECONDS: int = 600
+    
+    # Rate limits per route: "scope:limit/seconds,..." with scopes ip, email, phone
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_LOGIN: str = "ip:20/60,email:5/60"
+    RATE_LIMIT_PHONE_LOGIN: str = "ip:10/60,phone:3/300"
+    # Guesses at a 6-digit SMS code, so the per-phone limit stays tight
+    RATE_LIMIT_PHONE_VERIFY: str = "ip:20/60,phone:5/300"
+    RATE_LIMIT_REFRESH: str = "ip:60/60"
+    RATE_LIMIT_MAGIC_LINK: str = "ip:10/60,email:3/300"
+    RATE_LIMIT_RESET_PASSWORD: str = "ip:10/60,email:3/300"
+    RATE_LIMIT_SHARDS: int = 16
+    RATE_LIMIT_MAX_KEYS_PER_SHARD: int = 10000
+    # Only behind a proxy that appends the client address to X-Forwarded-For
+    # (as Render's does); otherwise clients could pick their own address
+    RATE_LIMIT_TRUST_FORWARDED_FOR: bool = False
+    
+    # Bulk token introspection
+    INTROSPECTION_MAX_TOKENS: int = 1000
+    
+    # Batch user lookups
+    USER_BATCH_MAX_IDS: int = 1000
+    USER_BATCH_CHUNK_SIZE: int = 100
+    
+    # Bulk user import (streamed JSONL or CSV)
+    ADMIN_IMPORT_CONCURRENCY: int = 8
+    ADMIN_IMPORT_PROGRESS_EVERY: int = 1000
+    ADMIN_IMPORT_MAX_LINE_BYTES: int = 65536
+    
+    # Profile export (streamed NDJSON, keyset-paginated on id)
+    ADMIN_EXPORT_PAGE_SIZE: int = 1000
+    
+    # Serialize hot responses straight from pydantic-core and render the rest with orjson
+    FAST_RESPONSES: bool = False
+    
+    # Prometheus metrics at /metrics
+    METRICS_ENABLED: bool = True
+    
+    # Request tracing: Server-Timing header and optional OTLP JSON export
+    TRACING_ENABLED: bool = True
+    SERVER_TIMING_ENABLED: bool = True
+    # File path or collector URL, e.g. "traces.jsonl" or "http://localhost:4318/v1/traces"
+    TRACE_EXPORT: Optional[str] = None
+    TRACE_EXPORT_SAMPLE_RATE: float = 1.0
+    TRACE_EXPORT_INTERVAL_SECONDS: float = 5.0
+    TRACE_EXPORT_MAX_QUEUE: int = 2048
+    # Spans kept per request; later ones only count towards Server-Timing
+    TRACE_MAX_SPANS: int = 128
+    
+    # Logging (records go through a bounded queue to a background writer)
+    LOG_LEVEL: str = "INFO"
+    LOG_JSON: bool = True
+    LOG_QUEUE_SIZE: int = 10000
+    # Fraction of requests whose hot-path INFO/DEBUG records are kept
+    LOG_HOT_PATH_SAMPLE_RATE: float = 0.01
+    
+    # Shared secret for internal callers (webhooks, gateway, admin tools)
+    INTERNAL_API_KEY: Optional[str] = None
     
     # Validators
     @validator("CORS_ORIGINS", pre=True)
@@ -15,6 +15,32 @@ class AuthException(Exception):
         self.detail = detail
         self.headers = headers
 
+class UpstreamUnavailableException(AuthException):
+    """Raised when an upstream call is refused locally to protect the service"""
+    def __init__(
+        self,
+        detail: str = "Upstream service unavailable, please retry",
+        retry_after: int = 1,
+    ):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+class ServiceOverloadedException(AuthException):
+    """Raised when local work (e.g. password hashing) is refused to protect the service"""
+    def __init__(
+        self,
+        detail: str = "Service overloaded, please retry",
+        retry_after: int = 1,
+    ):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)},
+        )
+
 async def auth_exception_handler(request: Request, exc: AuthException):
     return JSONResponse(
         status_code=exc.status_code,
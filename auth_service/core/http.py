@@ -0,0 +1,263 @@
+from typing import Any, Dict, List, Optional
+import asyncio
+import httpx
+import logging
+import time
+from auth_service.core.admission import get_admission_limiter
+from auth_service.core.config import settings
+from auth_service.core.exceptions import UpstreamUnavailableException
+from auth_service.core.metrics import (
+    Gauge,
+    observe_upstream,
+    registry,
+    upstream_requests_in_flight,
+)
+from auth_service.core.resilience import backoff_delay, get_circuit_breaker, get_retry_budget
+from auth_service.core.tracing import SPAN_KIND_CLIENT, span
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Endpoints that trigger an SMS or email on the Supabase side
+OTP_ENDPOINTS = ("otp", "verify", "recover")
+
+# Methods that may be resent after a failure mid-request
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# Upstream statuses worth retrying
+TRANSIENT_STATUSES = frozenset({502, 503, 504})
+
+_client: Optional[httpx.AsyncClient] = None
+_timeouts: Optional[Dict[str, httpx.Timeout]] = None
+
+def upstream_endpoint(endpoint: str) -> str:
+    """Normalize an endpoint to its resource path (no query string)"""
+    return endpoint.split("?", 1)[0].strip("/")
+
+def endpoint_class(endpoint: str) -> str:
+    """Classify an upstream endpoint as 'auth', 'rest' or 'otp'"""
+    path = upstream_endpoint(endpoint)
+    if path.startswith("rest/"):
+        return "rest"
+    if path.rsplit("/", 1)[-1] in OTP_ENDPOINTS:
+        return "otp"
+    return "auth"
+
+def _get_timeouts() -> Dict[str, httpx.Timeout]:
+    global _timeouts
+    if _timeouts is None:
+        connect = settings.HTTP_CONNECT_TIMEOUT_SECONDS
+        _timeouts = {
+            "auth": httpx.Timeout(settings.HTTP_TIMEOUT_AUTH_SECONDS, connect=connect),
+            "rest": httpx.Timeout(settings.HTTP_TIMEOUT_REST_SECONDS, connect=connect),
+            "otp": httpx.Timeout(settings.HTTP_TIMEOUT_OTP_SECONDS, connect=connect),
+        }
+    return _timeouts
+
+def request_timeout(endpoint: str) -> httpx.Timeout:
+    """Get the timeout configured for an upstream endpoint"""
+    return _get_timeouts()[endpoint_class(endpoint)]
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create the pooled client used for all upstream Supabase calls"""
+    http2 = settings.HTTP2_ENABLED
+    if http2 and not _http2_available():
+        logger.warning("HTTP2_ENABLED is set but the 'h2' package is not installed, using HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=limits,
+        timeout=_get_timeouts()["auth"],
+    )
+
+async def start_http_client() -> httpx.AsyncClient:
+    """Create the shared upstream client (called from the app lifespan)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+        logger.info("Upstream HTTP client started")
+    return _client
+
+async def close_http_client() -> None:
+    """Close the shared upstream client and its pooled connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("Upstream HTTP client closed")
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the shared upstream client, creating it lazily outside the lifespan"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+async def _request(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    endpoint: str,
+    headers: Optional[Dict[str, str]],
+    data: Optional[Any],
+) -> httpx.Response:
+    name = upstream_endpoint(endpoint)
+    upstream_requests_in_flight.inc(name)
+    start = time.perf_counter()
+    status_code = None
+    try:
+        response = await client.request(
+            method,
+            url,
+            headers=headers,
+            json=data,
+            timeout=request_timeout(endpoint),
+        )
+        status_code = response.status_code
+        return response
+    finally:
+        upstream_requests_in_flight.dec(name)
+        observe_upstream(name, status_code, time.perf_counter() - start)
+
+async def _send_once(
+    method: str,
+    url: str,
+    endpoint: str,
+    headers: Optional[Dict[str, str]] = None,
+    data: Optional[Any] = None,
+) -> httpx.Response:
+    client = get_http_client()
+    limiter = get_admission_limiter(endpoint_class(endpoint))
+    if limiter is None:
+        return await _request(client, method, url, endpoint, headers, data)
+    
+    # Raises UpstreamUnavailableException when the endpoint class is saturated
+    await limiter.acquire()
+    start = time.monotonic()
+    latency = None
+    dropped = False
+    try:
+        response = await _request(client, method, url, endpoint, headers, data)
+        latency = time.monotonic() - start
+        dropped = response.status_code >= 500
+        return response
+    except httpx.TimeoutException:
+        dropped = True
+        raise
+    finally:
+        limiter.release(latency, dropped)
+
+def _collect_pool() -> List[Gauge]:
+    connections = Gauge("upstream_pool_connections", "Pooled upstream connections by state", ("state",))
+    waiting = Gauge("upstream_pool_waiting_requests", "Requests waiting for a pooled connection")
+    max_connections = Gauge("upstream_pool_max_connections", "Configured upstream connection limit")
+    max_connections.set(value=settings.HTTP_MAX_CONNECTIONS)
+
+    # httpx doesn't expose pool usage publicly; read the httpcore pool when available
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    if pool is not None:
+        active = idle = 0
+        for connection in list(getattr(pool, "connections", [])):
+            if connection.is_idle():
+                idle += 1
+            else:
+                active += 1
+        connections.set("active", value=active)
+        connections.set("idle", value=idle)
+        in_pool = sum(1 for request in list(getattr(pool, "_requests", [])) if getattr(request, "connection", None) is None)
+        waiting.set(value=in_pool)
+    return [connections, waiting, max_connections]
+
+registry.add_collector(_collect_pool)
+
+def _retryable(method: str, error: Optional[Exception] = None) -> bool:
+    # Requests that never reached the upstream are safe to resend whatever the method
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    return method.upper() in IDEMPOTENT_METHODS
+
+async def send_upstream(
+    method: str,
+    url: str,
+    endpoint: str,
+    headers: Optional[Dict[str, str]] = None,
+    data: Optional[Any] = None,
+) -> httpx.Response:
+    """Send a request to Supabase over the shared connection pool.
+    
+    Calls fail fast with UpstreamUnavailableException while the endpoint's
+    circuit is open. Transient failures are retried with jittered
+    exponential backoff as long as the global retry budget allows.
+    """
+    name = upstream_endpoint(endpoint)
+    with span("upstream", SPAN_KIND_CLIENT, endpoint=name, method=method) as upstream_span:
+        response = await _send_with_retries(method, url, name, endpoint, headers, data)
+        upstream_span.set_attribute("http.status_code", response.status_code)
+        return response
+
+async def _send_with_retries(
+    method: str,
+    url: str,
+    name: str,
+    endpoint: str,
+    headers: Optional[Dict[str, str]],
+    data: Optional[Any],
+) -> httpx.Response:
+    breaker = get_circuit_breaker(name)
+    budget = get_retry_budget()
+    budget.deposit()
+    
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise UpstreamUnavailableException(
+                detail=f"Upstream {name} is unavailable, please retry",
+                retry_after=breaker.retry_after(),
+            )
+        
+        error = None
+        response = None
+        try:
+            response = await _send_once(method, url, endpoint, headers=headers, data=data)
+        except httpx.TransportError as e:
+            error = e
+            breaker.record_failure()
+        except BaseException:
+            # Shed locally or cancelled: says nothing about upstream health
+            breaker.cancel_probe()
+            raise
+        
+        if response is not None:
+            if response.status_code < 500:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if response.status_code not in TRANSIENT_STATUSES:
+                return response
+        
+        if (
+            attempt >= settings.RETRY_MAX_ATTEMPTS
+            or not _retryable(method, error)
+            or not budget.withdraw()
+        ):
+            if error is not None:
+                raise error
+            return response
+        
+        delay = backoff_delay(attempt, settings.RETRY_BACKOFF_BASE_SECONDS, settings.RETRY_BACKOFF_MAX_SECONDS)
+        attempt += 1
+        logger.warning("Retrying %s %s (attempt %s) in %.3fs", method, name, attempt, delay)
+        await asyncio.sleep(delay)
@@ -0,0 +1,174 @@
+from typing import Any, Dict, Optional, Set
+import asyncio
+import json
+import logging
+import random
+import time
+from jose import jwk, jwt
+from auth_service.core.config import settings
+from auth_service.core.http import send_upstream
+from auth_service.core.security import KeyRing, get_key_ring, supabase_issuer
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Default signing algorithm per key type/curve when a JWK has no "alg"
+DEFAULT_ALGORITHMS = {
+    "RSA": "RS256",
+    "P-256": "ES256",
+    "P-384": "ES384",
+    "P-521": "ES512",
+}
+
+def _jwk_algorithm(key_data: Dict[str, Any]) -> Optional[str]:
+    if key_data.get("alg"):
+        return key_data["alg"]
+    if key_data.get("kty") == "EC":
+        return DEFAULT_ALGORITHMS.get(key_data.get("crv"))
+    return DEFAULT_ALGORITHMS.get(key_data.get("kty"))
+
+class JWKSKeySource:
+    """Keeps public keys from a JWKS document parsed and loaded into a key ring.
+
+    Keys are fetched from a URL or read from a local file, converted to key
+    objects once and registered in the ring under their ``kid``. A
+    background task refreshes them at a jittered interval, and tokens with an
+    unknown ``kid`` trigger an immediate refetch at most once per
+    ``min_refetch_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        key_ring: KeyRing,
+        issuer: str,
+        url: Optional[str] = None,
+        path: Optional[str] = None,
+        refresh_interval: float = 600.0,
+        refresh_jitter: float = 0.1,
+        min_refetch_interval: float = 30.0,
+    ):
+        if not url and not path:
+            raise ValueError("A JWKS URL or file path is required")
+        self.key_ring = key_ring
+        self.issuer = issuer
+        self.url = url
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.refresh_jitter = refresh_jitter
+        self.min_refetch_interval = min_refetch_interval
+        self.last_loaded = 0.0
+        self._last_attempt = 0.0
+        self._kids: Set[str] = set()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _fetch(self) -> Dict[str, Any]:
+        if self.path:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        response = await send_upstream("GET", self.url, "jwks")
+        response.raise_for_status()
+        return response.json()
+
+    async def load(self) -> int:
+        """Fetch the JWKS document and sync its keys into the ring"""
+        async with self._lock:
+            self._last_attempt = time.monotonic()
+            document = await self._fetch()
+
+            kids = set()
+            for key_data in document.get("keys", []):
+                kid = key_data.get("kid")
+                algorithm = _jwk_algorithm(key_data)
+                if not kid or not algorithm or key_data.get("use", "sig") != "sig":
+                    continue
+                try:
+                    key = jwk.construct(key_data, algorithm)
+                except Exception as e:
+                    logger.warning("Skipping unusable JWK %s: %s", kid, e)
+                    continue
+                self.key_ring.add_key(key, algorithm, kid=kid, issuer=self.issuer, primary=False)
+                kids.add(kid)
+
+            for kid in self._kids - kids:
+                self.key_ring.remove_key(kid)
+            self._kids = kids
+            self.last_loaded = time.time()
+            logger.info("Loaded %s JWKS keys", len(kids))
+            return len(kids)
+
+    async def ensure_key_for(self, token: str) -> None:
+        """Refetch the JWKS if the token names a kid the ring doesn't know"""
+        kid = jwt.get_unverified_header(token).get("kid")
+        if not isinstance(kid, str) or self.key_ring.has_kid(kid):
+            return
+        if time.monotonic() - self._last_attempt < self.min_refetch_interval:
+            return
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error("JWKS refetch for unknown kid failed: %s", e)
+
+    async def refresh_if_stale(self) -> None:
+        """Reload the keys if they are older than the refresh interval.
+
+        For runtimes that freeze the process between requests, where the
+        background refresh can't be relied on to run.
+        """
+        if time.time() - self.last_loaded < self.refresh_interval:
+            return
+        if time.monotonic() - self._last_attempt < self.min_refetch_interval:
+            return
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error("JWKS refresh failed: %s", e)
+
+    def _next_delay(self) -> float:
+        jitter = self.refresh_interval * self.refresh_jitter
+        return max(1.0, self.refresh_interval + random.uniform(-jitter, jitter))
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._next_delay())
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error("JWKS refresh failed: %s", e)
+
+    async def start(self) -> None:
+        """Load keys now and keep refreshing them in the background"""
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error("Initial JWKS load failed: %s", e)
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        """Stop the background refresh"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+_jwks_source: Optional[JWKSKeySource] = None
+
+def get_jwks_source() -> Optional[JWKSKeySource]:
+    """Get the configured JWKS source, or None when JWKS is not configured"""
+    global _jwks_source
+    if _jwks_source is None and (settings.JWKS_URL or settings.JWKS_FILE):
+        _jwks_source = JWKSKeySource(
+            get_key_ring(),
+            issuer=settings.JWKS_ISSUER or supabase_issuer(),
+            url=settings.JWKS_URL,
+            path=settings.JWKS_FILE,
+            refresh_interval=settings.JWKS_REFRESH_INTERVAL_SECONDS,
+            refresh_jitter=settings.JWKS_REFRESH_JITTER,
+            min_refetch_interval=settings.JWKS_MIN_REFETCH_INTERVAL_SECONDS,
+        )
+    return _jwks_source
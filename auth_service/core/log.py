@@ -0,0 +1,174 @@
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Optional
+import json
+import logging
+import queue
+import random
+import sys
+import uuid
+from auth_service.core.config import settings
+from auth_service.core.metrics import Counter, registry
+
+# Loggers on the per-request hot path; their INFO/DEBUG records are sampled
+HOT_PATH_LOGGERS = (
+    "auth_service.dependencies.auth",
+    "auth_service.services.user",
+    "auth_service.api.api_v1.endpoints.users",
+    # httpx and mangum log every request at INFO
+    "httpx",
+    "mangum",
+)
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+log_sampled_var: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the request id attached"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the current request id before they leave the request's context"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class HotPathSamplingFilter(logging.Filter):
+    """Keep hot-path records below WARNING only for sampled requests"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if not record.name.startswith(HOT_PATH_LOGGERS):
+            return True
+        return log_sampled_var.get()
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hand records to the background writer without formatting or blocking.
+
+    Records are formatted by the listener thread. When the queue is full
+    the record is dropped and counted instead of stalling the event loop.
+    """
+
+    def __init__(self, log_queue: "queue.Queue"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_previous_handlers: List[logging.Handler] = []
+
+def _stdout_handler() -> logging.Handler:
+    handler = logging.StreamHandler(sys.stdout)
+    if settings.LOG_JSON:
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+        ))
+    return handler
+
+def start_logging() -> None:
+    """Route all logging through a bounded queue to a background stdout writer"""
+    global _listener, _queue_handler, _previous_handlers
+    if _listener is not None:
+        return
+
+    stream_handler = _stdout_handler()
+
+    log_queue: "queue.Queue" = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(HotPathSamplingFilter())
+    _queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    _previous_handlers = root.handlers[:]
+    root.handlers = [_queue_handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+def configure_direct_logging() -> None:
+    """Write records straight to stdout, for runtimes that freeze background threads"""
+    handler = _stdout_handler()
+    handler.addFilter(HotPathSamplingFilter())
+    handler.addFilter(RequestContextFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+def stop_logging() -> None:
+    """Flush queued records, stop the background writer and restore the root handlers"""
+    global _listener
+    if _listener is not None:
+        logging.getLogger().handlers = _previous_handlers[:]
+        _listener.stop()
+        _listener = None
+
+def dropped_log_records() -> int:
+    """Get the number of records dropped because the queue was full"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+def _collect_log_drops() -> List[Counter]:
+    dropped = Counter("log_records_dropped_total", "Log records dropped because the queue was full")
+    dropped.inc(amount=dropped_log_records())
+    return [dropped]
+
+registry.add_collector(_collect_log_drops)
+
+class RequestContextMiddleware:
+    """Assign a request id (X-Request-ID) and decide hot-path log sampling per request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+
+        id_token = request_id_var.set(request_id)
+        sampled_token = log_sampled_var.set(random.random() < settings.LOG_HOT_PATH_SAMPLE_RATE)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(id_token)
+            log_sampled_var.reset(sampled_token)
@@ -0,0 +1,228 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import time
+
+# Latency buckets in seconds, from a cached token check to a slow OTP send
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """A metric family: one value per label combination.
+
+    Updates are plain dict and list operations without locks. Everything
+    runs on the event loop, and a scrape that races an update is off by at
+    most one observation, which is fine for monitoring.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, *labels: str, value: float) -> None:
+        self._values[labels] = value
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last)], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, (counts, total) in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Holds metric families and scrape-time collectors"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[_Metric]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[_Metric]]) -> None:
+        """Register a callable producing metrics from existing state at scrape time"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for metric in collector():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+http_requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "Requests currently being handled", ("method",)
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Request latency per route", ("method", "route")
+)
+http_responses = registry.counter(
+    "http_responses_total", "Responses per route and status code", ("method", "route", "status")
+)
+upstream_requests_in_flight = registry.gauge(
+    "upstream_requests_in_flight", "Supabase calls currently in flight", ("endpoint",)
+)
+upstream_request_duration = registry.histogram(
+    "upstream_request_duration_seconds", "Supabase call latency per endpoint", ("endpoint",)
+)
+upstream_responses = registry.counter(
+    "upstream_responses_total",
+    "Supabase responses per endpoint and status code ('error' for transport failures)",
+    ("endpoint", "status"),
+)
+
+_cache_stats: Dict[str, Callable[[], Dict[str, int]]] = {}
+
+def register_cache(name: str, stats: Callable[[], Dict[str, int]]) -> None:
+    """Expose a cache's ``stats()`` counters under the given cache label"""
+    _cache_stats[name] = stats
+
+def _collect_caches() -> List[_Metric]:
+    entries = Gauge("cache_entries", "Entries held per cache", ("cache",))
+    requests = Counter("cache_requests_total", "Cache lookups per cache and result", ("cache", "result"))
+    hit_ratio = Gauge("cache_hit_ratio", "Fraction of lookups served from the cache", ("cache",))
+    for name, stats_fn in _cache_stats.items():
+        stats = stats_fn()
+        entries.set(name, value=stats.get("size", 0))
+        hits = stats.get("hits", 0) + stats.get("stale_hits", 0)
+        lookups = hits + stats.get("misses", 0)
+        for key, result in (("hits", "hit"), ("stale_hits", "stale_hit"), ("misses", "miss")):
+            if key in stats:
+                requests.inc(name, result, amount=stats[key])
+        hit_ratio.set(name, value=hits / lookups if lookups else 0.0)
+    return [entries, requests, hit_ratio]
+
+registry.add_collector(_collect_caches)
+
+class MetricsMiddleware:
+    """Time every HTTP request and label it with its route template"""
+
+    def __init__(self, app, exclude_paths: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.exclude_paths = frozenset(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = "500"
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = str(message["status"])
+            await send(message)
+
+        http_requests_in_flight.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec(method)
+            # The router stores the matched route in the scope; use its template, not the raw path
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            http_request_duration.observe(method, route_path, value=elapsed)
+            http_responses.inc(method, route_path, status_code)
+
+def observe_upstream(endpoint: str, status_code: Optional[int], elapsed: float) -> None:
+    """Record one Supabase call; ``status_code`` is None for transport errors"""
+    upstream_request_duration.observe(endpoint, value=elapsed)
+    upstream_responses.inc(endpoint, str(status_code) if status_code is not None else "error")
@@ -0,0 +1,236 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import math
+import threading
+import time
+from fastapi import Request, status
+from auth_service.core.cache_backend import CacheBackend, CacheBackendError, get_cache_backend
+from auth_service.core.config import settings
+from auth_service.core.exceptions import AuthException
+from auth_service.core.metrics import Gauge, registry
+
+class _Window:
+    __slots__ = ("index", "current", "previous")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.current = 0
+        self.previous = 0
+
+class SlidingWindowRateLimiter:
+    """Sliding-window counters kept in independently locked shards.
+
+    Each key costs one small record: the counts of the current and previous
+    fixed windows, weighted by how far the current window has progressed.
+    Every shard is an LRU bounded to ``max_keys_per_shard`` so memory stays
+    flat while an attacker cycles through keys.
+    """
+
+    def __init__(self, shards: int = 16, max_keys_per_shard: int = 10000):
+        self.max_keys_per_shard = max_keys_per_shard
+        self._shards: List[Tuple[threading.Lock, "OrderedDict[str, _Window]"]] = [
+            (threading.Lock(), OrderedDict()) for _ in range(shards)
+        ]
+
+    def _shard(self, key: str) -> Tuple[threading.Lock, "OrderedDict[str, _Window]"]:
+        return self._shards[hash(key) % len(self._shards)]
+
+    @staticmethod
+    def _roll(entry: _Window, index: int) -> None:
+        if entry.index == index:
+            return
+        entry.previous = entry.current if entry.index == index - 1 else 0
+        entry.current = 0
+        entry.index = index
+
+    @staticmethod
+    def _retry_after(entry: _Window, limit: int, window: float, now: float) -> float:
+        elapsed = now - entry.index * window
+        if entry.current < limit and entry.previous:
+            # Wait until the previous window's weight has decayed enough
+            needed = window * (1 - (limit - entry.current - 1) / entry.previous)
+            return max(needed - elapsed, 0.0)
+        # Wait for the next window, then for this window's weight to decay
+        return (window - elapsed) + window * max(0.0, 1 - (limit - 1) / max(entry.current, 1))
+
+    def hit(self, rules: List[Tuple[str, int, float]], now: Optional[float] = None) -> float:
+        """Count one attempt against every ``(key, limit, window)`` rule.
+
+        Returns 0 if the attempt is allowed (and counted), otherwise the
+        number of seconds until it would be. Rejected attempts are not counted.
+        """
+        now = time.time() if now is None else now
+        retry_after = 0.0
+
+        for key, limit, window in rules:
+            lock, entries = self._shard(key)
+            with lock:
+                entry = entries.get(key)
+                if entry is None:
+                    continue
+                self._roll(entry, int(now // window))
+                weight = 1 - (now - entry.index * window) / window
+                if entry.previous * weight + entry.current + 1 > limit:
+                    retry_after = max(retry_after, self._retry_after(entry, limit, window, now))
+
+        if retry_after > 0:
+            return retry_after
+
+        for key, limit, window in rules:
+            lock, entries = self._shard(key)
+            index = int(now // window)
+            with lock:
+                entry = entries.get(key)
+                if entry is None:
+                    entry = entries[key] = _Window(index)
+                    if len(entries) > self.max_keys_per_shard:
+                        entries.popitem(last=False)
+                else:
+                    self._roll(entry, index)
+                    entries.move_to_end(key)
+                entry.current += 1
+        return 0.0
+
+    def size(self) -> int:
+        """Get the number of tracked keys"""
+        return sum(len(entries) for _, entries in self._shards)
+
+class SharedRateLimiter:
+    """Sliding-window counters kept in a shared cache backend.
+
+    Same windows and weighting as SlidingWindowRateLimiter, but the counts
+    live in the backend so every worker and replica enforces one combined
+    limit. An attempt is counted first and taken back if it is rejected,
+    which costs a single round trip when allowed. Concurrent attempts may
+    see each other's provisional counts, so under contention the limiter
+    errs towards rejecting, never towards letting too many through.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    async def hit(self, rules: List[Tuple[str, int, float]], now: Optional[float] = None) -> float:
+        """Count one attempt against every rule, like SlidingWindowRateLimiter.hit"""
+        now = time.time() if now is None else now
+        counters = []
+        for key, limit, window in rules:
+            index = int(now // window)
+            # Adding 0 reads the previous window in the same round trip
+            counters.append((f"rate_limit:{key}:{index}", 1, window * 2))
+            counters.append((f"rate_limit:{key}:{index - 1}", 0, window * 2))
+        counts = await self.backend.incr_many(counters)
+
+        retry_after = 0.0
+        for i, (key, limit, window) in enumerate(rules):
+            current, previous = counts[2 * i], counts[2 * i + 1]
+            entry = _Window(int(now // window))
+            entry.current = current - 1
+            entry.previous = previous
+            weight = 1 - (now - entry.index * window) / window
+            if previous * weight + current > limit:
+                retry_after = max(retry_after, SlidingWindowRateLimiter._retry_after(entry, limit, window, now))
+
+        if retry_after > 0:
+            try:
+                await self.backend.incr_many([(key, -1, ttl) for key, amount, ttl in counters if amount])
+            except CacheBackendError:
+                # The attempt stays counted, which only makes the limit stricter
+                pass
+        return retry_after
+
+def parse_policy(spec: str) -> List[Tuple[str, int, float]]:
+    """Parse a policy like ``"ip:20/60,email:5/300"`` into (scope, limit, seconds)"""
+    rules = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        scope, _, rate = item.partition(":")
+        limit, _, window = rate.partition("/")
+        rules.append((scope.strip(), int(limit), float(window)))
+    return rules
+
+_policies: Optional[Dict[str, List[Tuple[str, int, float]]]] = None
+
+def get_policies() -> Dict[str, List[Tuple[str, int, float]]]:
+    """Get the per-route rate limit policies from settings"""
+    global _policies
+    if _policies is None:
+        _policies = {
+            "login": parse_policy(settings.RATE_LIMIT_LOGIN),
+            "phone_login": parse_policy(settings.RATE_LIMIT_PHONE_LOGIN),
+            "phone_verify": parse_policy(settings.RATE_LIMIT_PHONE_VERIFY),
+            "refresh": parse_policy(settings.RATE_LIMIT_REFRESH),
+            "magic_link": parse_policy(settings.RATE_LIMIT_MAGIC_LINK),
+            "reset_password": parse_policy(settings.RATE_LIMIT_RESET_PASSWORD),
+        }
+    return _policies
+
+rate_limiter = SlidingWindowRateLimiter(
+    shards=settings.RATE_LIMIT_SHARDS,
+    max_keys_per_shard=settings.RATE_LIMIT_MAX_KEYS_PER_SHARD,
+)
+
+def _collect_rate_limiter() -> List[Gauge]:
+    tracked = Gauge("rate_limit_tracked_keys", "Keys currently tracked by the rate limiter")
+    tracked.set(value=rate_limiter.size())
+    return [tracked]
+
+registry.add_collector(_collect_rate_limiter)
+
+_shared_rate_limiter: Optional[SharedRateLimiter] = None
+
+def get_shared_rate_limiter() -> Optional[SharedRateLimiter]:
+    """Get the limiter shared by all workers, or None when the cache backend is per-process"""
+    global _shared_rate_limiter
+    if _shared_rate_limiter is None:
+        backend = get_cache_backend()
+        if backend.shared:
+            _shared_rate_limiter = SharedRateLimiter(backend)
+    return _shared_rate_limiter
+
+def client_ip(request: Request) -> str:
+    """Get the client address, honoring the proxy's X-Forwarded-For entry"""
+    if settings.RATE_LIMIT_TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            # The last entry is the one appended by our own proxy
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+def _normalize(scope: str, value: str) -> str:
+    if scope == "phone":
+        # "+1 (555) 010-0000" and "15550100000" are the same number to GoTrue
+        return "".join(c for c in value if c.isdigit())
+    return value.strip().lower()
+
+async def enforce_rate_limit(route: str, request: Request, **identifiers: Optional[str]) -> None:
+    """Count an attempt on a route and raise 429 if any of its limits is exceeded"""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+
+    values = {"ip": client_ip(request)}
+    for scope, value in identifiers.items():
+        if value:
+            values[scope] = _normalize(scope, value)
+
+    rules = [
+        (f"{route}:{scope}:{values[scope]}", limit, window)
+        for scope, limit, window in get_policies().get(route, [])
+        if scope in values
+    ]
+    shared_rate_limiter = get_shared_rate_limiter()
+    if shared_rate_limiter is None:
+        retry_after = rate_limiter.hit(rules)
+    else:
+        try:
+            retry_after = await shared_rate_limiter.hit(rules)
+        except CacheBackendError:
+            # Fall back to this worker's own counters while the backend is down
+            retry_after = rate_limiter.hit(rules)
+    if retry_after > 0:
+        raise AuthException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, please try again later",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
@@ -0,0 +1,395 @@
+from typing import Dict, Optional, Set, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from auth_service.core.cache_backend import CacheBackend, CacheBackendError, get_cache_backend
+from auth_service.core.config import settings
+from auth_service.core.exceptions import UpstreamUnavailableException
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class InvalidRefreshTokenError(Exception):
+    """Raised for unknown, expired, revoked or reused refresh tokens"""
+
+class RefreshTokenRecord:
+    """A stored refresh token; only the SHA-256 of the token is kept"""
+
+    __slots__ = ("token_hash", "family_id", "user_id", "expires_at", "used")
+
+    def __init__(self, token_hash: bytes, family_id: bytes, user_id: str, expires_at: int, used: bool = False):
+        self.token_hash = token_hash
+        self.family_id = family_id
+        self.user_id = user_id
+        self.expires_at = expires_at
+        self.used = used
+
+class RefreshTokenStore:
+    """Storage interface for refresh token records"""
+
+    # Whether every worker and replica sees the same records
+    shared = False
+
+    async def add(self, record: RefreshTokenRecord) -> None:
+        raise NotImplementedError
+
+    async def get(self, token_hash: bytes) -> Optional[RefreshTokenRecord]:
+        raise NotImplementedError
+
+    async def mark_used(self, token_hash: bytes) -> bool:
+        """Atomically mark a record used; False if it already was"""
+        raise NotImplementedError
+
+    async def revoke_family(self, family_id: bytes) -> int:
+        raise NotImplementedError
+
+    async def revoke_user(self, user_id: str) -> int:
+        raise NotImplementedError
+
+    async def purge_expired(self, now: int) -> int:
+        raise NotImplementedError
+
+class InMemoryRefreshTokenStore(RefreshTokenStore):
+    """Process-local store for a single worker or tests.
+
+    A token only exists in the worker that issued it, so with several
+    workers refreshes would fail whenever they land on another one;
+    ``create_refresh_token_store`` refuses it when WEB_CONCURRENCY > 1.
+    """
+
+    def __init__(self):
+        self._records: Dict[bytes, RefreshTokenRecord] = {}
+        self._families: Dict[bytes, Set[bytes]] = {}
+        self._user_families: Dict[str, Set[bytes]] = {}
+        self._lock = threading.Lock()
+
+    async def add(self, record: RefreshTokenRecord) -> None:
+        with self._lock:
+            self._records[record.token_hash] = record
+            self._families.setdefault(record.family_id, set()).add(record.token_hash)
+            self._user_families.setdefault(record.user_id, set()).add(record.family_id)
+
+    async def get(self, token_hash: bytes) -> Optional[RefreshTokenRecord]:
+        return self._records.get(token_hash)
+
+    async def mark_used(self, token_hash: bytes) -> bool:
+        with self._lock:
+            record = self._records.get(token_hash)
+            if record is None or record.used:
+                return False
+            record.used = True
+            return True
+
+    def _drop_family(self, family_id: bytes) -> int:
+        hashes = self._families.pop(family_id, set())
+        for token_hash in hashes:
+            record = self._records.pop(token_hash, None)
+            if record is not None:
+                families = self._user_families.get(record.user_id)
+                if families is not None:
+                    families.discard(family_id)
+                    if not families:
+                        del self._user_families[record.user_id]
+        return len(hashes)
+
+    async def revoke_family(self, family_id: bytes) -> int:
+        with self._lock:
+            return self._drop_family(family_id)
+
+    async def revoke_user(self, user_id: str) -> int:
+        with self._lock:
+            return sum(self._drop_family(family_id) for family_id in list(self._user_families.get(user_id, ())))
+
+    async def purge_expired(self, now: int) -> int:
+        with self._lock:
+            expired = [record for record in self._records.values() if record.expires_at <= now]
+            for record in expired:
+                del self._records[record.token_hash]
+                family = self._families.get(record.family_id)
+                if family is not None:
+                    family.discard(record.token_hash)
+                    if not family:
+                        del self._families[record.family_id]
+                        families = self._user_families.get(record.user_id)
+                        if families is not None:
+                            families.discard(record.family_id)
+                            if not families:
+                                del self._user_families[record.user_id]
+            return len(expired)
+
+class SQLiteRefreshTokenStore(RefreshTokenStore):
+    """SQLite-backed store that survives restarts and is shared by workers on one host.
+
+    sqlite3 blocks, so every call runs in a worker thread rather than on
+    the event loop; one connection is shared under a lock.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS refresh_tokens ("
+                " token_hash BLOB PRIMARY KEY,"
+                " family_id BLOB NOT NULL,"
+                " user_id TEXT NOT NULL,"
+                " expires_at INTEGER NOT NULL,"
+                " used INTEGER NOT NULL DEFAULT 0"
+                ") WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_refresh_tokens_family ON refresh_tokens (family_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_refresh_tokens_user ON refresh_tokens (user_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_refresh_tokens_expires ON refresh_tokens (expires_at)")
+
+    def _add(self, record: RefreshTokenRecord) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO refresh_tokens (token_hash, family_id, user_id, expires_at, used) VALUES (?, ?, ?, ?, ?)",
+                (record.token_hash, record.family_id, record.user_id, record.expires_at, int(record.used)),
+            )
+
+    def _get(self, token_hash: bytes) -> Optional[RefreshTokenRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT token_hash, family_id, user_id, expires_at, used FROM refresh_tokens WHERE token_hash = ?",
+                (token_hash,),
+            ).fetchone()
+        if row is None:
+            return None
+        return RefreshTokenRecord(row[0], row[1], row[2], row[3], bool(row[4]))
+
+    def _mark_used(self, token_hash: bytes) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE refresh_tokens SET used = 1 WHERE token_hash = ? AND used = 0",
+                (token_hash,),
+            )
+            return cursor.rowcount == 1
+
+    def _revoke_family(self, family_id: bytes) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM refresh_tokens WHERE family_id = ?", (family_id,)).rowcount
+
+    def _revoke_user(self, user_id: str) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM refresh_tokens WHERE user_id = ?", (user_id,)).rowcount
+
+    def _purge_expired(self, now: int) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM refresh_tokens WHERE expires_at <= ?", (now,)).rowcount
+
+    async def add(self, record: RefreshTokenRecord) -> None:
+        await asyncio.to_thread(self._add, record)
+
+    async def get(self, token_hash: bytes) -> Optional[RefreshTokenRecord]:
+        return await asyncio.to_thread(self._get, token_hash)
+
+    async def mark_used(self, token_hash: bytes) -> bool:
+        return await asyncio.to_thread(self._mark_used, token_hash)
+
+    async def revoke_family(self, family_id: bytes) -> int:
+        return await asyncio.to_thread(self._revoke_family, family_id)
+
+    async def revoke_user(self, user_id: str) -> int:
+        return await asyncio.to_thread(self._revoke_user, user_id)
+
+    async def purge_expired(self, now: int) -> int:
+        return await asyncio.to_thread(self._purge_expired, now)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class CacheRefreshTokenStore(RefreshTokenStore):
+    """Store in the shared cache backend, seen by every worker and replica.
+
+    Records are written once and expire with their token. Everything that
+    changes afterwards is an atomic counter next to them: marking a token
+    used is the increment that returns 1, revoking a family bumps the
+    family's counter, and revoking a user bumps a generation number that
+    records issued before it no longer match. Backend failures surface as
+    a 503 instead of being mistaken for unknown or unused tokens.
+    """
+
+    shared = True
+
+    def __init__(self, backend: CacheBackend, ttl_seconds: int):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def _record_key(token_hash: bytes) -> str:
+        return f"refresh:{token_hash.hex()}"
+
+    @staticmethod
+    def _used_key(token_hash: bytes) -> str:
+        return f"refresh_used:{token_hash.hex()}"
+
+    @staticmethod
+    def _family_key(family_id: bytes) -> str:
+        return f"refresh_family:{family_id.hex()}"
+
+    @staticmethod
+    def _user_key(user_id: str) -> str:
+        return f"refresh_user:{user_id}"
+
+    @staticmethod
+    def _unavailable(e: CacheBackendError) -> UpstreamUnavailableException:
+        logger.error("Refresh token store unavailable: %s", e)
+        return UpstreamUnavailableException("Session store unavailable, please retry")
+
+    async def _counters(self, items) -> list:
+        try:
+            return await self.backend.incr_many(items)
+        except CacheBackendError as e:
+            raise self._unavailable(e)
+
+    async def add(self, record: RefreshTokenRecord) -> None:
+        # Adding 0 reads the user's generation; it lives as long as the user has sessions
+        (generation,) = await self._counters([(self._user_key(record.user_id), 0, None)])
+        value = json.dumps({
+            "family_id": record.family_id.hex(),
+            "user_id": record.user_id,
+            "expires_at": record.expires_at,
+            "generation": generation,
+        })
+        ttl = max(1, record.expires_at - int(time.time()))
+        try:
+            await self.backend.write_many([(self._record_key(record.token_hash), value.encode("utf-8"), ttl)])
+        except CacheBackendError as e:
+            raise self._unavailable(e)
+
+    async def get(self, token_hash: bytes) -> Optional[RefreshTokenRecord]:
+        try:
+            (value,) = await self.backend.read_many([self._record_key(token_hash)])
+        except CacheBackendError as e:
+            raise self._unavailable(e)
+        if value is None:
+            return None
+        data = json.loads(value)
+        family_id = bytes.fromhex(data["family_id"])
+        used, family_revoked, generation = await self._counters([
+            (self._used_key(token_hash), 0, self.ttl_seconds),
+            (self._family_key(family_id), 0, self.ttl_seconds),
+            (self._user_key(data["user_id"]), 0, None),
+        ])
+        if family_revoked or generation != data["generation"]:
+            return None
+        return RefreshTokenRecord(token_hash, family_id, data["user_id"], data["expires_at"], bool(used))
+
+    async def mark_used(self, token_hash: bytes) -> bool:
+        (used,) = await self._counters([(self._used_key(token_hash), 1, self.ttl_seconds)])
+        return used == 1
+
+    async def revoke_family(self, family_id: bytes) -> int:
+        # Outlives every token of the family, all issued before it
+        await self._counters([(self._family_key(family_id), 1, self.ttl_seconds)])
+        return 1
+
+    async def revoke_user(self, user_id: str) -> int:
+        await self._counters([(self._user_key(user_id), 1, None)])
+        return 1
+
+    async def purge_expired(self, now: int) -> int:
+        # Records and counters expire on their own
+        return 0
+
+class RefreshTokenManager:
+    """Issues opaque refresh tokens and rotates them on every use.
+
+    Tokens issued by rotation belong to the same family as their parent.
+    Presenting a token that was already rotated is treated as theft and
+    revokes the whole family.
+    """
+
+    # Expired records are purged once every this many issued tokens
+    PURGE_EVERY = 1000
+
+    def __init__(self, store: RefreshTokenStore, ttl_seconds: int):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self._issued = 0
+
+    @staticmethod
+    def _hash(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    async def issue(self, user_id: str, family_id: Optional[bytes] = None) -> str:
+        """Issue a new refresh token, starting a new family unless one is given"""
+        token = secrets.token_urlsafe(32)
+        now = int(time.time())
+        await self.store.add(RefreshTokenRecord(
+            self._hash(token),
+            family_id or secrets.token_bytes(16),
+            str(user_id),
+            now + self.ttl_seconds,
+        ))
+
+        self._issued += 1
+        if self._issued % self.PURGE_EVERY == 0:
+            await self.store.purge_expired(now)
+        return token
+
+    async def rotate(self, token: str) -> Tuple[str, str]:
+        """Consume a refresh token and return ``(user_id, new_refresh_token)``"""
+        token_hash = self._hash(token)
+        record = await self.store.get(token_hash)
+        if record is None or record.expires_at <= time.time():
+            raise InvalidRefreshTokenError("Invalid or expired refresh token")
+
+        if record.used or not await self.store.mark_used(token_hash):
+            revoked = await self.store.revoke_family(record.family_id)
+            logger.warning("Refresh token reuse detected for user %s, revoked %s tokens", record.user_id, revoked)
+            raise InvalidRefreshTokenError("Refresh token has already been used")
+
+        return record.user_id, await self.issue(record.user_id, record.family_id)
+
+    async def revoke_user(self, user_id: str) -> int:
+        """Revoke every refresh token of a user"""
+        return await self.store.revoke_user(str(user_id))
+
+def refresh_token_store_kind() -> str:
+    """Get the store REFRESH_TOKEN_STORE selects, with "auto" resolved"""
+    kind = settings.REFRESH_TOKEN_STORE.lower()
+    if kind == "auto":
+        kind = "cache" if get_cache_backend().shared else "memory"
+    return kind
+
+def create_refresh_token_store() -> RefreshTokenStore:
+    """Create the store selected by REFRESH_TOKEN_STORE"""
+    kind = refresh_token_store_kind()
+    backend = get_cache_backend()
+    if kind == "cache":
+        if not backend.shared:
+            raise ValueError("REFRESH_TOKEN_STORE=cache needs a shared CACHE_BACKEND (redis or tiered)")
+        return CacheRefreshTokenStore(backend, settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600)
+    if kind == "sqlite":
+        return SQLiteRefreshTokenStore(settings.REFRESH_TOKEN_SQLITE_PATH)
+    if kind == "memory":
+        # uvicorn and gunicorn both take their default worker count from here
+        if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+            raise ValueError("REFRESH_TOKEN_STORE=memory only works with a single worker; use cache or sqlite")
+        return InMemoryRefreshTokenStore()
+    raise ValueError(f"Unknown REFRESH_TOKEN_STORE: {settings.REFRESH_TOKEN_STORE}")
+
+_manager: Optional[RefreshTokenManager] = None
+
+def get_refresh_token_manager() -> RefreshTokenManager:
+    """Get the process-wide refresh token manager"""
+    global _manager
+    if _manager is None:
+        _manager = RefreshTokenManager(
+            create_refresh_token_store(),
+            ttl_seconds=settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600,
+        )
+    return _manager
@@ -0,0 +1,147 @@
+from typing import Dict, List, Optional
+import logging
+import math
+import random
+import time
+from auth_service.core.config import settings
+from auth_service.core.metrics import Gauge, registry
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one upstream endpoint.
+
+    ``closed``: calls flow and failures are counted. ``open``: calls fail
+    fast until ``recovery_timeout`` has passed. ``half_open``: a single
+    probe call is let through; its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Check whether a call may be attempted now"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def retry_after(self) -> int:
+        """Seconds until the breaker will let a probe through"""
+        remaining = self.recovery_timeout - (time.monotonic() - self.opened_at)
+        return max(1, math.ceil(remaining))
+
+    def cancel_probe(self) -> None:
+        """Release a half-open probe slot whose call ended without an outcome"""
+        self._probing = False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("Circuit for %s closed", self.name)
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Circuit for %s opened after %s failures", self.name, self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+class RetryBudget:
+    """Caps retries to a fraction of recent requests.
+
+    Every original request deposits ``ratio`` tokens and every retry spends
+    one, so retries can add at most ``ratio`` extra load. A small
+    time-based allowance keeps retries possible at very low traffic.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        # Start with ten seconds' worth of the time-based allowance
+        self.tokens = min(max_tokens, 10 * min_per_second)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self) -> None:
+        """Record an original (non-retry) request"""
+        self._refill()
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Spend a token for a retry; False when the budget is exhausted"""
+        self._refill()
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_retry_budget: Optional[RetryBudget] = None
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Get the breaker for an upstream endpoint"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(
+            name,
+            failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout=settings.CIRCUIT_BREAKER_RECOVERY_SECONDS,
+        )
+    return breaker
+
+def circuit_breakers() -> Dict[str, CircuitBreaker]:
+    """Get all breakers created so far"""
+    return dict(_breakers)
+
+def get_retry_budget() -> RetryBudget:
+    """Get the process-wide retry budget"""
+    global _retry_budget
+    if _retry_budget is None:
+        _retry_budget = RetryBudget(
+            ratio=settings.RETRY_BUDGET_RATIO,
+            min_per_second=settings.RETRY_BUDGET_MIN_PER_SECOND,
+        )
+    return _retry_budget
+
+def _collect_resilience() -> List[Gauge]:
+    state = Gauge("circuit_breaker_open", "1 while an upstream endpoint's circuit is open or half-open", ("endpoint",))
+    for name, breaker in circuit_breakers().items():
+        state.set(name, value=0 if breaker.state == CircuitBreaker.CLOSED else 1)
+    tokens = Gauge("retry_budget_tokens", "Retries currently affordable from the budget")
+    if _retry_budget is not None:
+        tokens.set(value=_retry_budget.tokens)
+    return [state, tokens]
+
+registry.add_collector(_collect_resilience)
@@ -0,0 +1,65 @@
+from typing import Any
+import json
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
+from pydantic import TypeAdapter
+from auth_service.core.config import settings
+from auth_service.schemas.auth import Token
+from auth_service.schemas.user import UserResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Built once at import instead of per request by FastAPI's response_model handling
+token_adapter = TypeAdapter(Token)
+user_response_adapter = TypeAdapter(UserResponse)
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when installed, compact stdlib JSON otherwise"""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """Newline-delimited JSON streamed while the request body is still being read.
+
+    Starlette's StreamingResponse watches for a disconnect by reading the
+    request, which would swallow a body the endpoint streams in parallel.
+    Here a gone client is only noticed when reading the body fails or, on
+    servers that report it (ASGI 2.4), when a send fails; older servers
+    drop the sends silently. Responses without a request body to read
+    should use a plain StreamingResponse.
+    """
+
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+def render_ndjson(content: Any) -> bytes:
+    """One NDJSON line"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+def respond(adapter: TypeAdapter, data: Any, status_code: int = 200) -> Any:
+    """Return ``data`` for the endpoint's response_model, or a pre-serialized response.
+
+    With FAST_RESPONSES the data is validated once against the schema and
+    dumped straight to JSON bytes by pydantic-core. FastAPI then skips its
+    own validate/jsonable_encoder/json.dumps round trip for this response.
+    """
+    if not settings.FAST_RESPONSES:
+        return data
+    body = adapter.dump_json(adapter.validate_python(data))
+    return Response(content=body, status_code=status_code, media_type="application/json")
@@ -0,0 +1,304 @@
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from auth_service.core.cache_backend import CacheBackend, CacheBackendError, get_cache_backend
+from auth_service.core.config import settings
+from auth_service.core.exceptions import UpstreamUnavailableException
+from auth_service.core.metrics import Counter, Gauge, registry
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings.
+
+    Sized for ``capacity`` items at a false positive rate of ``error_rate``.
+    The ``k`` bit positions are derived by double hashing from the two
+    halves of Python's own string hash: it is salted per process (so keys
+    can't be crafted to collide) and cached on the string, which makes a
+    lookup a handful of integer operations. The bits are therefore only
+    meaningful inside one process; persist the items, not the filter.
+    Items can't be removed, so the owner rebuilds the filter to forget them.
+    """
+
+    __slots__ = ("capacity", "error_rate", "size", "hashes", "_bits")
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @staticmethod
+    def _hash(item: str) -> Tuple[int, int]:
+        value = hash(item) & 0xFFFFFFFFFFFFFFFF
+        return value & 0xFFFFFFFF, (value >> 32) | 1
+
+    def add(self, item: str) -> None:
+        h1, h2 = self._hash(item)
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % self.size
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        h1, h2 = self._hash(item)
+        bits = self._bits
+        size = self.size
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+class RevocationList:
+    """Revoked token ids (``jti``) kept until the tokens would have expired.
+
+    The exact set lives in a dict of ``jti -> exp``; a Bloom filter in
+    front of it answers "not revoked" for almost every token without
+    touching the dict, and an empty list skips even that. Expired entries
+    are dropped by ``compact()``, which also rebuilds the filter (grown if
+    the list outgrew it). The list can be snapshotted to a JSON file and
+    restored on startup. With a shared cache backend, revocations are also
+    stored there and broadcast, so every worker and replica rejects the
+    token: running ones hear the broadcast, and ones that start later, or
+    lose their subscription, load the stored entries. Entries are grouped
+    by the time they were revoked, so loading them reads a bounded range of
+    counters and keys instead of scanning the keyspace.
+    """
+
+    # Namespace of revocation broadcasts on the cache backend
+    NAMESPACE = "revoked"
+    # Stored entries are grouped into buckets of this many seconds
+    BUCKET_SECONDS = 300
+    # Keys read per round trip when loading stored entries
+    LOAD_BATCH = 1000
+
+    def __init__(
+        self,
+        capacity: int = 100000,
+        error_rate: float = 0.001,
+        snapshot_path: Optional[str] = None,
+        compact_interval: float = 300.0,
+        backend: Optional[CacheBackend] = None,
+        max_token_lifetime: int = 86400,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.snapshot_path = snapshot_path
+        self.compact_interval = compact_interval
+        self.max_token_lifetime = max_token_lifetime
+        self.backend = backend if backend is not None and backend.shared else None
+        self.checks = 0
+        self.filter_hits = 0
+        self.false_positives = 0
+        self._revoked: Dict[str, int] = {}
+        self._filter = BloomFilter(capacity, error_rate)
+        self._task: Optional[asyncio.Task] = None
+        self._reload: Optional[asyncio.Task] = None
+        if self.backend is not None:
+            self.backend.on_invalidate(self.NAMESPACE, self._on_broadcast, clear=self._on_lost_broadcasts)
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def is_revoked(self, jti: str) -> bool:
+        """Check a token id; revoked entries whose token has expired don't count"""
+        if not self._revoked:
+            return False
+        self.checks += 1
+        if jti not in self._filter:
+            return False
+        self.filter_hits += 1
+        exp = self._revoked.get(jti)
+        if exp is None:
+            self.false_positives += 1
+            return False
+        return exp > time.time()
+
+    def _add(self, jti: str, exp: int) -> None:
+        if exp <= time.time():
+            return
+        if jti not in self._revoked:
+            self._revoked[jti] = exp
+            self._filter.add(jti)
+            if len(self._revoked) > self._filter.capacity:
+                self._rebuild()
+        else:
+            self._revoked[jti] = max(self._revoked[jti], exp)
+
+    def _bucket_counter(self, bucket: int) -> Tuple[str, int, float]:
+        # Adding 0 reads the count; it outlives every entry of the bucket
+        return (f"revoked_count:{bucket}", 0, self.max_token_lifetime + 2 * self.BUCKET_SECONDS)
+
+    async def revoke(self, jti: str, exp: int) -> None:
+        """Revoke a token id until ``exp`` in this and every other worker"""
+        exp = int(exp)
+        self._add(jti, exp)
+        if self.backend is None:
+            return
+        now = int(time.time())
+        if exp <= now:
+            return
+        bucket = now // self.BUCKET_SECONDS
+        key, _, ttl = self._bucket_counter(bucket)
+        try:
+            (index,) = await self.backend.incr_many([(key, 1, ttl)])
+            await self.backend.write_many([(f"revoked:{bucket}:{index}", f"{jti}:{exp}".encode("utf-8"), exp - now)])
+        except CacheBackendError as e:
+            logger.error("Could not store revocation: %s", e)
+            raise UpstreamUnavailableException("Revocation store unavailable, please retry")
+        await self.backend.invalidate(self.NAMESPACE, f"{jti}:{exp}")
+
+    def _on_broadcast(self, key: str) -> None:
+        jti, _, exp = key.rpartition(":")
+        if jti and exp.isdigit():
+            self._add(jti, int(exp))
+
+    def _on_lost_broadcasts(self) -> None:
+        if self._reload is None or self._reload.done():
+            self._reload = asyncio.ensure_future(self._load_logged())
+
+    async def load_shared(self) -> int:
+        """Load the revocations stored in the shared backend by any worker"""
+        if self.backend is None:
+            return 0
+        now = int(time.time())
+        last = now // self.BUCKET_SECONDS
+        first = (now - self.max_token_lifetime) // self.BUCKET_SECONDS
+        buckets = list(range(first, last + 1))
+        counts = await self.backend.incr_many([self._bucket_counter(bucket) for bucket in buckets])
+        keys = [
+            f"revoked:{bucket}:{index}"
+            for bucket, count in zip(buckets, counts)
+            for index in range(1, count + 1)
+        ]
+        before = len(self._revoked)
+        for start in range(0, len(keys), self.LOAD_BATCH):
+            for value in await self.backend.read_many(keys[start:start + self.LOAD_BATCH]):
+                if value is not None:
+                    self._on_broadcast(value.decode("utf-8", "replace"))
+        return len(self._revoked) - before
+
+    async def _load_logged(self) -> None:
+        try:
+            loaded = await self.load_shared()
+            if loaded:
+                logger.info("Loaded %s revoked tokens from the cache backend", loaded)
+        except CacheBackendError as e:
+            logger.error("Could not load revoked tokens: %s", e)
+
+    def _rebuild(self) -> None:
+        capacity = self.capacity
+        while capacity < len(self._revoked) * 2:
+            capacity *= 2
+        bloom = BloomFilter(capacity, self.error_rate)
+        for jti in self._revoked:
+            bloom.add(jti)
+        self._filter = bloom
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """Drop entries whose tokens have expired and rebuild the filter"""
+        now = time.time() if now is None else now
+        expired = [jti for jti, exp in self._revoked.items() if exp <= now]
+        for jti in expired:
+            del self._revoked[jti]
+        if expired:
+            self._rebuild()
+        return len(expired)
+
+    def snapshot(self, path: Optional[str] = None) -> None:
+        """Write the live entries to a JSON file, atomically replacing it"""
+        path = path or self.snapshot_path
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "revoked": self._revoked}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def restore(self, path: Optional[str] = None) -> int:
+        """Load a snapshot, keeping entries that haven't expired yet"""
+        path = path or self.snapshot_path
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            document = json.load(f)
+        before = len(self._revoked)
+        for jti, exp in document.get("revoked", {}).items():
+            self._add(jti, int(exp))
+        return len(self._revoked) - before
+
+    async def _compact_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.compact_interval)
+            try:
+                removed = self.compact()
+                self.snapshot()
+                logger.info("Compacted revocation list: %s expired, %s live", removed, len(self._revoked))
+            except Exception as e:
+                logger.error("Revocation list compaction failed: %s", e)
+
+    async def start(self) -> None:
+        """Restore the snapshot and compact it periodically in the background"""
+        try:
+            restored = self.restore()
+            if restored:
+                logger.info("Restored %s revoked tokens", restored)
+        except Exception as e:
+            logger.error("Could not restore revocation snapshot: %s", e)
+        await self._load_logged()
+        if self._task is None:
+            self._task = asyncio.create_task(self._compact_loop())
+
+    async def stop(self) -> None:
+        """Stop compacting and write a final snapshot"""
+        if self._reload is not None:
+            self._reload.cancel()
+            self._reload = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            self.snapshot()
+        except Exception as e:
+            logger.error("Could not write revocation snapshot: %s", e)
+
+_revocation_list: Optional[RevocationList] = None
+
+def get_revocation_list() -> RevocationList:
+    """Get the process-wide revocation list"""
+    global _revocation_list
+    if _revocation_list is None:
+        _revocation_list = RevocationList(
+            capacity=settings.REVOCATION_BLOOM_CAPACITY,
+            error_rate=settings.REVOCATION_BLOOM_ERROR_RATE,
+            snapshot_path=settings.REVOCATION_SNAPSHOT_PATH,
+            compact_interval=settings.REVOCATION_COMPACT_INTERVAL_SECONDS,
+            backend=get_cache_backend(),
+            max_token_lifetime=settings.REVOCATION_MAX_TOKEN_LIFETIME_SECONDS,
+        )
+    return _revocation_list
+
+def _collect_revocations() -> List[Counter]:
+    if _revocation_list is None:
+        return []
+    revoked = Gauge("revoked_tokens", "Revoked access tokens that have not expired yet")
+    revoked.set(value=len(_revocation_list))
+    checks = Counter("revocation_checks_total", "Revocation checks by outcome of the Bloom filter", ("result",))
+    checks.inc("negative", amount=_revocation_list.checks - _revocation_list.filter_hits)
+    checks.inc("false_positive", amount=_revocation_list.false_positives)
+    checks.inc("positive", amount=_revocation_list.filter_hits - _revocation_list.false_positives)
+    return [revoked, checks]
+
+registry.add_collector(_collect_revocations)
@@ -1,10 +1,183 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Dict, Optional
-from jose import jwt
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import multiprocessing
+import os
+import uuid
+from jose import jwk, jwt, JWTError
+from jose.backends.base import Key
 from passlib.context import CryptContext
 from auth_service.core.config import settings
+from auth_service.core.exceptions import ServiceOverloadedException
+from auth_service.core.metrics import Counter, Gauge, registry
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Set up logging
+logger = logging.getLogger(__name__)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.PASSWORD_BCRYPT_ROUNDS)
+
+class KeyNotFoundError(JWTError):
+    """Raised when no key in the ring can verify a token"""
+
+class VerificationKey:
+    """A parsed verification key and the issuer it belongs to"""
+
+    __slots__ = ("kid", "issuer", "algorithm", "key")
+
+    def __init__(self, kid: Optional[str], issuer: Optional[str], algorithm: str, key: Key):
+        self.kid = kid
+        self.issuer = issuer
+        self.algorithm = algorithm
+        self.key = key
+
+class KeyRing:
+    """Verification keys indexed by ``kid`` and ``iss``.
+
+    Each token is routed to exactly one key: by its ``kid`` header when the
+    ring knows it, otherwise by the primary key of its ``iss`` claim. Tokens
+    carrying neither fall back to the default key. Several keys may share an
+    issuer so that tokens signed with a retired key keep verifying until
+    they expire.
+    """
+
+    def __init__(self):
+        self._by_kid: Dict[str, VerificationKey] = {}
+        self._by_issuer: Dict[str, VerificationKey] = {}
+        self._default: Optional[VerificationKey] = None
+
+    def add_key(
+        self,
+        key: Any,
+        algorithm: str,
+        kid: Optional[str] = None,
+        issuer: Optional[str] = None,
+        primary: bool = True,
+        default: bool = False,
+    ) -> VerificationKey:
+        """Parse and register a key; ``primary`` makes it the issuer's key"""
+        if not isinstance(key, Key):
+            key = jwk.construct(key, algorithm)
+        entry = VerificationKey(kid, issuer, algorithm, key)
+        if kid is not None:
+            self._by_kid[kid] = entry
+        if issuer is not None and (primary or issuer not in self._by_issuer):
+            self._by_issuer[issuer] = entry
+        if default:
+            self._default = entry
+        return entry
+
+    def remove_key(self, kid: str) -> None:
+        """Remove a key from the ring"""
+        entry = self._by_kid.pop(kid, None)
+        if entry is None:
+            return
+        if entry.issuer is not None and self._by_issuer.get(entry.issuer) is entry:
+            del self._by_issuer[entry.issuer]
+            for other in self._by_kid.values():
+                if other.issuer == entry.issuer:
+                    self._by_issuer[entry.issuer] = other
+                    break
+        if self._default is entry:
+            self._default = None
+
+    @property
+    def default_key(self) -> Optional[VerificationKey]:
+        """The key used for tokens without ``kid`` or ``iss`` (our own signing key)"""
+        return self._default
+
+    def has_kid(self, kid: str) -> bool:
+        """Check whether a key id is registered"""
+        return kid in self._by_kid
+
+    def kids(self) -> List[str]:
+        """Get the ids of all registered keys"""
+        return list(self._by_kid)
+
+    def select(self, token: str) -> VerificationKey:
+        """Pick the single key that may verify this token"""
+        header = jwt.get_unverified_header(token)
+        kid = header.get("kid")
+        if kid is not None:
+            if not isinstance(kid, str):
+                raise KeyNotFoundError("Malformed token key id")
+            entry = self._by_kid.get(kid)
+            if entry is not None:
+                return entry
+
+        issuer = jwt.get_unverified_claims(token).get("iss")
+        if issuer is not None:
+            if not isinstance(issuer, str):
+                raise KeyNotFoundError("Malformed token issuer")
+            entry = self._by_issuer.get(issuer)
+            if entry is None:
+                raise KeyNotFoundError(f"Unknown token issuer: {issuer}")
+            return entry
+
+        if kid is None and self._default is not None:
+            return self._default
+        raise KeyNotFoundError("No verification key for token")
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        """Verify a token with its routed key and return its claims"""
+        entry = self.select(token)
+        return jwt.decode(
+            token,
+            entry.key,
+            algorithms=[entry.algorithm],
+            options={"verify_aud": False},
+        )
+
+def _parse_additional_keys(value: str) -> Dict[str, str]:
+    keys = {}
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        kid, _, secret = item.partition(":")
+        if not secret:
+            raise ValueError("JWT_ADDITIONAL_KEYS entries must be 'kid:secret'")
+        keys[kid.strip()] = secret.strip()
+    return keys
+
+def supabase_issuer() -> str:
+    """Get the issuer claim of Supabase-minted tokens"""
+    return settings.SUPABASE_JWT_ISSUER or f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1"
+
+def build_key_ring() -> KeyRing:
+    """Build the key ring from settings"""
+    ring = KeyRing()
+    ring.add_key(
+        settings.JWT_SECRET_KEY,
+        settings.JWT_ALGORITHM,
+        kid=settings.JWT_KEY_ID,
+        issuer=settings.JWT_ISSUER,
+        default=True,
+    )
+    for kid, secret in _parse_additional_keys(settings.JWT_ADDITIONAL_KEYS).items():
+        ring.add_key(
+            secret,
+            settings.JWT_ALGORITHM,
+            kid=kid,
+            issuer=settings.JWT_ISSUER,
+            primary=False,
+        )
+    ring.add_key(
+        settings.SUPABASE_JWT_SECRET,
+        settings.JWT_ALGORITHM,
+        issuer=supabase_issuer(),
+    )
+    return ring
+
+_key_ring: Optional[KeyRing] = None
+
+def get_key_ring() -> KeyRing:
+    """Get the process-wide key ring, building it on first use"""
+    global _key_ring
+    if _key_ring is None:
+        _key_ring = build_key_ring()
+    return _key_ring
 
 def create_access_token(subject: str, expires_delta: Optional[timedelta] = None) -> str:
     if expires_delta:
@@ -13,9 +186,14 @@ def create_access_token(subject: str, expires_delta: Optional[timedelta] = None)
         expire = datetime.utcnow() + timedelta(
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
-    to_encode = {"exp": expire, "sub": str(subject)}
+    # jti identifies the token for revocation
+    to_encode = {"exp": expire, "sub": str(subject), "iss": settings.JWT_ISSUER, "jti": uuid.uuid4().hex}
+    signing_key = get_key_ring().default_key
     encoded_jwt = jwt.encode(
-        to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM
+        to_encode,
+        signing_key.key,
+        algorithm=signing_key.algorithm,
+        headers={"kid": signing_key.kid},
     )
     return encoded_jwt
 
@@ -25,3 +203,119 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+class PasswordHasher:
+    """Runs bcrypt off the event loop in a bounded worker pool.
+
+    Each hash or verification takes hundreds of milliseconds of CPU, so it
+    runs in a process pool with one worker per core by default. At most
+    ``workers`` calls run at once and up to ``max_queue`` more wait for a
+    worker; calls beyond that are refused immediately with a 503 rather
+    than queueing behind seconds of work. Workers are spawned rather than
+    forked, so they don't inherit the event loop, sockets or locks held by
+    other threads. Where processes can't be created the pool falls back to
+    threads, which only helps if the bcrypt backend releases the GIL. The
+    libcrypt backend passlib uses without the bcrypt package doesn't, and
+    threads still showed about 125 ms of loop lag (benchmarks/loop_lag.py).
+    """
+
+    def __init__(self, workers: int, max_queue: int, executor: str = "process"):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor_kind = executor
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                try:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                except (OSError, NotImplementedError, ImportError) as e:
+                    logger.warning("Process pool unavailable (%s), hashing passwords in threads", e)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+
+    def _on_done(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            # The loop closed first, e.g. close() cancelled calls during shutdown
+            pass
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn(*args)`` in the pool, or raise ServiceOverloadedException if the queue is full"""
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise ServiceOverloadedException(detail="Password hashing is overloaded, please retry")
+
+        loop = asyncio.get_running_loop()
+        future = self._get_executor().submit(fn, *args)
+        self.in_flight += 1
+        # Released when the worker finishes, even if the caller stopped waiting
+        future.add_done_callback(lambda _: self._on_done(loop))
+        return await asyncio.wrap_future(future)
+
+    def close(self) -> None:
+        """Shut the pool down, dropping calls that haven't started"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+_password_hasher: Optional[PasswordHasher] = None
+
+def get_password_hasher() -> PasswordHasher:
+    """Get the process-wide password hashing pool"""
+    global _password_hasher
+    if _password_hasher is None:
+        _password_hasher = PasswordHasher(
+            workers=settings.PASSWORD_HASH_WORKERS or os.cpu_count() or 1,
+            max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+            executor=settings.PASSWORD_HASH_EXECUTOR,
+        )
+    return _password_hasher
+
+def close_password_hasher() -> None:
+    """Shut down the password hashing pool if it was started"""
+    global _password_hasher
+    if _password_hasher is not None:
+        _password_hasher.close()
+        _password_hasher = None
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password without blocking the loop.
+
+    Returns ``(valid, new_hash)``; ``new_hash`` is set when the stored hash
+    uses outdated parameters (e.g. fewer bcrypt rounds) and should replace it.
+    """
+    return await get_password_hasher().run(_verify_and_update, plain_password, hashed_password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password without blocking the loop"""
+    valid, _ = await verify_and_update_password_async(plain_password, hashed_password)
+    return valid
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password without blocking the loop"""
+    return await get_password_hasher().run(get_password_hash, password)
+
+def _collect_password_hasher() -> List[Counter]:
+    if _password_hasher is None:
+        return []
+    in_flight = Gauge("password_hash_in_flight", "Password hashing calls running or waiting for a worker")
+    in_flight.set(value=_password_hasher.in_flight)
+    rejected = Counter("password_hash_rejected_total", "Password hashing calls refused because the queue was full")
+    rejected.inc(amount=_password_hasher.rejected)
+    return [in_flight, rejected]
+
+registry.add_collector(_collect_password_hasher)
@@ -0,0 +1,56 @@
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+import asyncio
+
+T = TypeVar("T")
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it
+    runs await the same task and receive the same result or exception.
+    Cancelling one caller does not cancel the shared work unless it was the
+    last one waiting. Nothing is remembered once the task finishes.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def _discard(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        self._discard(key, call)
+        # Mark the exception as retrieved when every caller has gone away
+        if not call.task.cancelled():
+            call.task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run ``fn()`` once per key among concurrent callers"""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _, key=key, call=call: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller gave up, nobody needs the result. The task may
+                # take a while to unwind, so new callers start afresh meanwhile.
+                self._discard(key, call)
+                call.task.cancel()
+
+    def in_flight(self) -> int:
+        """Get the number of keys currently in flight"""
+        return len(self._calls)
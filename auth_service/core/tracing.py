@@ -0,0 +1,338 @@
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+import asyncio
+import httpx
+import json
+import logging
+import random
+import time
+from auth_service.core.config import settings
+from auth_service.core.log import request_id_var
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+class Span:
+    """One timed operation within a request trace"""
+
+    __slots__ = ("name", "span_id", "parent_id", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, span_id: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error = False
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns or time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+class Trace:
+    """All spans recorded while handling one request.
+
+    At most ``max_spans`` spans are kept for export; a long-running request
+    (a streamed bulk import makes two upstream calls per row) would
+    otherwise hold every span until it ends. Spans past the cap are still
+    timed and counted in the Server-Timing totals, which are accumulated as
+    spans finish rather than recomputed from the kept ones.
+    """
+
+    __slots__ = ("trace_id", "parent_id", "spans", "max_spans", "dropped_spans", "_totals")
+
+    def __init__(self, trace_id: Optional[str] = None, parent_id: Optional[str] = None, max_spans: int = 128):
+        self.trace_id = trace_id or f"{random.getrandbits(128):032x}"
+        self.parent_id = parent_id
+        self.spans: List[Span] = []
+        self.max_spans = max_spans
+        self.dropped_spans = 0
+        self._totals: Dict[str, List[float]] = {}
+
+    def start_span(
+        self,
+        name: str,
+        kind: int = SPAN_KIND_INTERNAL,
+        parent: Optional[Span] = None,
+        **attributes: Any,
+    ) -> Span:
+        parent_id = parent.span_id if parent is not None else self.parent_id
+        span = Span(name, f"{random.getrandbits(64):016x}", parent_id, kind, attributes)
+        if len(self.spans) < self.max_spans:
+            self.spans.append(span)
+        else:
+            self.dropped_spans += 1
+        return span
+
+    def end_span(self, span: Span, error: bool = False) -> None:
+        """Finish a span and add it to the Server-Timing totals"""
+        span.end_ns = time.time_ns()
+        span.error = span.error or error
+        if span.kind != SPAN_KIND_SERVER:
+            entry = self._totals.setdefault(span.name, [0.0, 0])
+            entry[0] += span.duration_ms
+            entry[1] += 1
+
+    def server_timing(self) -> str:
+        """Summarize finished spans as a Server-Timing header value, one entry per span name"""
+        parts = []
+        for name, (duration, count) in self._totals.items():
+            desc = f';desc="{count} calls"' if count > 1 else ""
+            parts.append(f"{name}{desc};dur={duration:.2f}")
+        if self.spans:
+            parts.append(f"total;dur={self.spans[0].duration_ms:.2f}")
+        return ", ".join(parts)
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class span:
+    """Time a block as a child span of the current request's trace.
+
+    Outside a traced request this costs one context variable lookup.
+    Usage: ``with span("upstream", endpoint=name) as s: ...``
+    """
+
+    __slots__ = ("_name", "_kind", "_attributes", "_trace", "_span", "_token")
+
+    def __init__(self, name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any):
+        self._name = name
+        self._kind = kind
+        self._attributes = attributes
+        self._span = None
+
+    def __enter__(self):
+        trace = _current_trace.get()
+        if trace is None:
+            return _NOOP_SPAN
+        self._trace = trace
+        self._span = trace.start_span(self._name, self._kind, _current_span.get(), **self._attributes)
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is not None:
+            self._trace.end_span(self._span, error=exc_type is not None)
+            _current_span.reset(self._token)
+        return False
+
+def _parse_traceparent(value: str):
+    # W3C trace context: version-traceid-parentid-flags
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def to_otlp(traces: List[Trace]) -> Dict[str, Any]:
+    """Build an OTLP/HTTP JSON ExportTraceServiceRequest body"""
+    spans = []
+    for trace in traces:
+        for s in trace.spans:
+            entry = {
+                "traceId": trace.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": s.kind,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                # 1 = OK, 2 = ERROR
+                "status": {"code": 2 if s.error else 1},
+            }
+            if s.parent_id:
+                entry["parentSpanId"] = s.parent_id
+            spans.append(entry)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": settings.PROJECT_NAME}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "auth_service"}, "spans": spans}],
+        }]
+    }
+
+class TraceExporter:
+    """Batches finished traces and writes them as OTLP JSON in the background.
+
+    ``target`` is either a file path (one JSON document per line, optionally
+    as ``file://...``) or an http(s) collector URL such as
+    ``http://localhost:4318/v1/traces``. When the buffer is full new traces
+    are dropped rather than slowing requests down.
+    """
+
+    def __init__(self, target: str, interval: float = 5.0, max_queue: int = 2048):
+        parsed = urlparse(target)
+        self.url = target if parsed.scheme in ("http", "https") else None
+        self.path = parsed.path if parsed.scheme == "file" else (None if self.url else target)
+        self.interval = interval
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._buffer: List[Trace] = []
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def submit(self, trace: Trace) -> None:
+        if len(self._buffer) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._buffer.append(trace)
+
+    def _write(self, body: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(body + "\n")
+
+    async def flush(self) -> None:
+        """Export everything buffered so far"""
+        if not self._buffer:
+            return
+        traces, self._buffer = self._buffer, []
+        body = json.dumps(to_otlp(traces), separators=(",", ":"))
+        try:
+            if self.url:
+                # Own client, so exports never compete with Supabase calls for the pool
+                if self._client is None:
+                    self._client = httpx.AsyncClient(timeout=10.0)
+                response = await self._client.post(
+                    self.url,
+                    content=body,
+                    headers={"Content-Type": "application/json"},
+                )
+                response.raise_for_status()
+            else:
+                await asyncio.to_thread(self._write, body)
+        except Exception as e:
+            logger.warning("Exporting %s traces failed: %s", len(traces), e)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+_exporter: Optional[TraceExporter] = None
+
+def get_trace_exporter() -> Optional[TraceExporter]:
+    """Get the configured exporter, or None when TRACE_EXPORT is unset"""
+    global _exporter
+    if _exporter is None and settings.TRACE_EXPORT:
+        _exporter = TraceExporter(
+            settings.TRACE_EXPORT,
+            interval=settings.TRACE_EXPORT_INTERVAL_SECONDS,
+            max_queue=settings.TRACE_EXPORT_MAX_QUEUE,
+        )
+    return _exporter
+
+class TracingMiddleware:
+    """Trace each HTTP request and report its phases in a Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace_id = parent_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"traceparent":
+                trace_id, parent_id = _parse_traceparent(value.decode("latin-1"))
+                break
+
+        trace = Trace(trace_id, parent_id, max_spans=settings.TRACE_MAX_SPANS)
+        root = trace.start_span(
+            f"{scope['method']} {scope['path']}",
+            SPAN_KIND_SERVER,
+            request_id=request_id_var.get(),
+        )
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(root)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                if settings.SERVER_TIMING_ENABLED:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", trace.server_timing().encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except Exception:
+            root.error = True
+            raise
+        finally:
+            trace.end_span(root)
+            if trace.dropped_spans:
+                root.set_attribute("spans.dropped", trace.dropped_spans)
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            route = scope.get("route")
+            if route is not None:
+                root.name = f"{scope['method']} {route.path}"
+            exporter = get_trace_exporter()
+            if exporter is not None and random.random() < settings.TRACE_EXPORT_SAMPLE_RATE:
+                exporter.submit(trace)
+
+def instrument_response_validation() -> None:
+    """Time FastAPI's response model validation as a ``validate`` span.
+
+    FastAPI has no hook around it, so the module-level helper its route
+    handlers call is wrapped once.
+    """
+    import fastapi.routing
+
+    original = fastapi.routing.serialize_response
+    if getattr(original, "_traced", False):
+        return
+
+    async def serialize_response(*args, **kwargs):
+        with span("validate"):
+            return await original(*args, **kwargs)
+
+    serialize_response._traced = True
+    fastapi.routing.serialize_response = serialize_response
@@ -1,65 +1,69 @@
+from typing import Any, Dict, Optional
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
+from jose import JWTError
+from auth_service.core.cache import TokenCache
 from auth_service.core.config import settings
+from auth_service.core.jwks import get_jwks_source
+from auth_service.core.metrics import register_cache
+from auth_service.core.revocation import get_revocation_list
+from auth_service.core.security import get_key_ring
+from auth_service.core.tracing import span
 from auth_service.schemas.auth import TokenPayload
 import logging
+import secrets
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
+internal_api_key_header = APIKeyHeader(name="X-Internal-Api-Key", auto_error=False)
+
+# Claims of recently verified tokens
+token_cache = TokenCache(
+    max_size=settings.TOKEN_CACHE_MAX_SIZE,
+    max_ttl=settings.TOKEN_CACHE_MAX_TTL_SECONDS,
+)
+register_cache("token", token_cache.stats)
+
+async def verify_token(token: str) -> Dict[str, Any]:
+    """Verify a token's signature, expiry and revocation and return its claims"""
+    # Repeat tokens skip verification entirely, but not the revocation check
+    payload = token_cache.get(token)
+    if payload is not None:
+        _check_not_revoked(payload)
+        return payload
+    
+    # Pick up rotated JWKS keys before verifying
+    jwks_source = get_jwks_source()
+    if jwks_source is not None:
+        await jwks_source.ensure_key_for(token)
+    
+    # Verify with the one key routed by the token's kid/iss
+    payload = get_key_ring().decode(token)
+    token_cache.set(token, payload, payload.get("exp"))
+    _check_not_revoked(payload)
+    return payload
+
+def _check_not_revoked(payload: Dict[str, Any]) -> None:
+    jti = payload.get("jti")
+    if jti is not None and get_revocation_list().is_revoked(jti):
+        raise JWTError("Token has been revoked")
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """Get current user from token"""
+    with span("auth"):
+        return await _get_current_user(token)
+
+async def _get_current_user(token: str):
     try:
-        logger.info("Verifying JWT token")
-        logger.info(f"Token (first 20 chars): {token[:20]}...")
+        logger.debug("Verifying JWT token")
         
         # Extract token if it's in "Bearer <token>" format
         if token.startswith("Bearer "):
             token = token.split(" ")[1]
-            logger.info("Extracted token from Bearer format")
-        
-        # Log token header for debugging
-        try:
-            header = jwt.get_unverified_header(token)
-            logger.info(f"Token header: {header}")
-        except Exception as e:
-            logger.error(f"Failed to decode token header: {str(e)}")
-        
-        # First try with the configured secret key
-        try:
-            payload = jwt.decode(
-                token, 
-                settings.JWT_SECRET_KEY, 
-                algorithms=[settings.JWT_ALGORITHM],
-                options={"verify_audience": False, "verify_iss": False}  # More lenient verification
-            )
-            logger.info("Token decoded with JWT_SECRET_KEY")
-        except Exception as e:
-            logger.warning(f"Failed to decode with JWT_SECRET_KEY: {str(e)}")
-            # Try with Supabase JWT secret as fallback
-            try:
-                payload = jwt.decode(
-                    token, 
-                    settings.SUPABASE_JWT_SECRET, 
-                    algorithms=[settings.JWT_ALGORITHM],
-                    options={"verify_audience": False, "verify_iss": False}  # More lenient verification
-                )
-                logger.info("Token decoded with SUPABASE_JWT_SECRET")
-            except Exception as e2:
-                logger.warning(f"Failed to decode with SUPABASE_JWT_SECRET: {str(e2)}")
-                # As a last resort, decode without verification
-                payload = jwt.decode(
-                    token,
-                    key="dummy_key_for_unverified_jwt",
-                    options={"verify_signature": False}
-                )
-                logger.warning("Token decoded without verification - security risk!")
         
-        # Log the payload structure for debugging
-        logger.info(f"Token payload keys: {list(payload.keys())}")
+        payload = await verify_token(token)
         
         # Extract user ID from payload - Supabase uses 'sub' for user ID
         user_id = payload.get("sub")
@@ -71,18 +75,33 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        logger.info(f"Token verified for user ID: {user_id}")
+        logger.debug("Token verified for user ID: %s", user_id)
         return {"id": user_id, "token": token}
+    except HTTPException:
+        raise
     except JWTError as e:
-        logger.error(f"JWT verification error: {str(e)}")
+        logger.error("JWT verification error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Could not validate credentials: {str(e)}",
             headers={"WWW-Authenticate": "Bearer"},
         )
     except Exception as e:
-        logger.error(f"Unexpected error in auth dependency: {str(e)}")
+        logger.error("Unexpected error in auth dependency: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Authentication error: {str(e)}",
-        )
\ No newline at end of file
+        )
+
+async def verify_internal_api_key(api_key: Optional[str] = Depends(internal_api_key_header)):
+    """Only allow internal callers presenting INTERNAL_API_KEY"""
+    if not settings.INTERNAL_API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Internal API is not configured",
+        )
+    if not api_key or not secrets.compare_digest(api_key, settings.INTERNAL_API_KEY):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid internal API key",
+        )
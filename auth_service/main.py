@@ -1,10 +1,52 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import os
+from auth_service.core.cache_backend import get_cache_backend
 from auth_service.core.config import settings
+from auth_service.core.http import start_http_client, close_http_client
+from auth_service.core.jwks import get_jwks_source
+from auth_service.core.refresh_tokens import get_refresh_token_manager
+from auth_service.core.responses import FastJSONResponse
+from auth_service.core.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from auth_service.core.revocation import get_revocation_list
+from auth_service.core.security import close_password_hasher
+from auth_service.core.log import RequestContextMiddleware, start_logging, stop_logging
+from auth_service.core.tracing import TracingMiddleware, get_trace_exporter, instrument_response_validation
 from auth_service.api.api_v1.api import api_router
 from auth_service.core.exceptions import add_exception_handlers
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared upstream resources on startup and release them on shutdown"""
+    start_logging()
+    await start_http_client()
+    cache_backend = get_cache_backend()
+    await cache_backend.start()
+    # Fail at startup, not on the first login, if the store can't serve these workers
+    get_refresh_token_manager()
+    revocation_list = get_revocation_list()
+    await revocation_list.start()
+    jwks_source = get_jwks_source()
+    if jwks_source is not None:
+        await jwks_source.start()
+    trace_exporter = get_trace_exporter()
+    if trace_exporter is not None:
+        trace_exporter.start()
+    try:
+        yield
+    finally:
+        if trace_exporter is not None:
+            await trace_exporter.stop()
+        if jwks_source is not None:
+            await jwks_source.stop()
+        await revocation_list.stop()
+        await cache_backend.close()
+        await close_http_client()
+        close_password_hasher()
+        stop_logging()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description="Authentication microservice for Wiz platform",
@@ -12,6 +54,8 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse if settings.FAST_RESPONSES else JSONResponse,
 )
 
 # Get the PORT from environment variable (Render sets this)
@@ -33,6 +77,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Time every request per route
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Break each request down into spans and report them in Server-Timing
+if settings.TRACING_ENABLED:
+    instrument_response_validation()
+    app.add_middleware(TracingMiddleware)
+
+# Tag every request with an id for the logs
+app.add_middleware(RequestContextMiddleware)
+
 # Add API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -52,6 +108,12 @@ async def health_check():
     """Health check endpoint for Render"""
     return {"status": "healthy"}
 
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus scrape endpoint"""
+        return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
 # This is only used when running locally
 if __name__ == "__main__":
     import uvicorn
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 class Token(BaseModel):
@@ -20,6 +20,9 @@ class TokenPayload(BaseModel):
     sub: Optional[str] = None
     exp: Optional[int] = None
 
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -55,4 +58,17 @@ class GoogleAuthRequest(BaseModel):
     redirect_uri: Optional[str] = None
 
 class GoogleAuthUrlRequest(BaseModel):
-    redirect_uri: str
\ No newline at end of file
+    redirect_uri: str
+
+class IntrospectionRequest(BaseModel):
+    tokens: List[str] = Field(..., min_length=1)
+
+class TokenIntrospection(BaseModel):
+    active: bool
+    sub: Optional[str] = None
+    exp: Optional[int] = None
+    claims: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class IntrospectionResponse(BaseModel):
+    results: List[TokenIntrospection]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 from uuid import UUID
 
@@ -33,3 +33,27 @@ class UserResponse(BaseModel):
         if not self.email or '@' not in self.email:
             self.email = "user@example.com"
 
+class ProfileWebhookPayload(BaseModel):
+    """Supabase database webhook payload for user_profiles changes"""
+    type: str
+    table: str
+    schema_name: Optional[str] = Field(default=None, alias="schema")
+    record: Optional[Dict[str, Any]] = None
+    old_record: Optional[Dict[str, Any]] = None
+
+class UserBatchRequest(BaseModel):
+    ids: List[UUID] = Field(..., min_length=1)
+
+class UserProfileResponse(BaseModel):
+    id: UUID
+    first_name: str = ""
+    last_name: str = ""
+    phone_number: Optional[str] = None
+    avatar_url: Optional[str] = None
+    role: str = "user"
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class UserBatchResponse(BaseModel):
+    users: List[UserProfileResponse]
+    missing: List[UUID]
@@ -0,0 +1,197 @@
+"""Serverless entry point (Vercel / AWS Lambda) for the full auth service.
+
+The service is imported when this module loads, which on Lambda is the
+init phase: it runs before the first invocation is timed and is captured
+by provisioned concurrency and SnapStart. Each import stage is timed; the
+cost is logged once and reported on the first response as a ``coldstart``
+Server-Timing entry. Routers are imported with the app rather than per
+route: they cost a few tens of milliseconds next to fastapi and jose,
+and deferring them would only move that cost into a request.
+
+Runtimes freeze the process between invocations and never shut it down,
+so the app runs without its lifespan and each part of it is handled here
+instead (see ``start_services``).
+"""
+from typing import Dict, Optional
+import asyncio
+import importlib
+import logging
+import sys
+import time
+from mangum import Mangum
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Imported in this order so the report attributes cost to each layer
+IMPORT_STAGES = (
+    "pydantic",
+    "fastapi",
+    "httpx",
+    "jose.jwt",
+    "auth_service.core.config",
+    "auth_service.main",
+)
+
+import_report: Dict[str, float] = {}
+_app = None
+_services_started = False
+_services_lock: Optional[asyncio.Lock] = None
+_last_compacted = 0.0
+
+def load_app():
+    """Import the service app, recording how long each stage took"""
+    global _app
+    if _app is not None:
+        return _app
+
+    for module in IMPORT_STAGES:
+        already_loaded = module in sys.modules
+        start = time.perf_counter()
+        importlib.import_module(module)
+        if not already_loaded:
+            import_report[module] = (time.perf_counter() - start) * 1000
+
+    from auth_service.core.log import configure_direct_logging
+    configure_direct_logging()
+    check_settings()
+
+    _app = sys.modules["auth_service.main"].app
+    logger.info(
+        "Cold start imports took %.1f ms (%s)",
+        sum(import_report.values()),
+        ", ".join(f"{module} {ms:.1f} ms" for module, ms in import_report.items()),
+    )
+    return _app
+
+def check_settings() -> None:
+    """Refuse state kept per instance, as multi-worker uvicorn refuses it per worker.
+
+    Requests land on any instance, each with its own memory and disk, so
+    refresh tokens must live in the shared cache backend.
+    """
+    from auth_service.core.refresh_tokens import refresh_token_store_kind
+
+    kind = refresh_token_store_kind()
+    if kind != "cache":
+        raise ValueError(
+            f"REFRESH_TOKEN_STORE={kind} keeps refresh tokens per instance; "
+            "serverless deployments need a shared CACHE_BACKEND (redis or tiered)"
+        )
+
+async def start_services() -> None:
+    """Start what the lifespan would have, on the first request.
+
+    - Logging writes straight to stdout; a writer thread would be frozen.
+    - The upstream HTTP client is created on first use and kept for warm
+      invocations.
+    - The cache backend's pub/sub listener runs on Mangum's event loop,
+      which is reused across invocations, so it reads messages whenever the
+      instance is thawed. A reconnect after a long freeze clears the local
+      copies, like any lost subscription.
+    - The revocation snapshot (REVOCATION_SNAPSHOT_PATH) and the entries
+      stored in a shared cache backend are loaded once, and the list is
+      compacted by ``before_request``. Later revocations from other
+      instances arrive over the cache backend.
+    - JWKS keys are loaded now and reloaded by ``before_request`` once they
+      are older than JWKS_REFRESH_INTERVAL_SECONDS; a background timer may
+      not fire while the process is frozen.
+    - Traces are exported by ``after_request`` at the end of each
+      invocation, which adds the export to its duration. Leave TRACE_EXPORT
+      unset, or lower TRACE_EXPORT_SAMPLE_RATE, to avoid that.
+    """
+    global _services_started, _services_lock
+    if _services_started:
+        return
+    if _services_lock is None:
+        _services_lock = asyncio.Lock()
+    async with _services_lock:
+        if _services_started:
+            return
+        from auth_service.core.cache_backend import get_cache_backend
+        from auth_service.core.jwks import get_jwks_source
+        from auth_service.core.refresh_tokens import get_refresh_token_manager
+        from auth_service.core.revocation import get_revocation_list
+
+        await get_cache_backend().start()
+        get_refresh_token_manager()
+        revocation_list = get_revocation_list()
+        try:
+            restored = revocation_list.restore()
+            if restored:
+                logger.info("Restored %s revoked tokens", restored)
+        except Exception as e:
+            logger.error("Could not restore revocation snapshot: %s", e)
+        try:
+            loaded = await revocation_list.load_shared()
+            if loaded:
+                logger.info("Loaded %s revoked tokens from the cache backend", loaded)
+        except Exception as e:
+            logger.error("Could not load revoked tokens: %s", e)
+        jwks_source = get_jwks_source()
+        if jwks_source is not None:
+            try:
+                await jwks_source.load()
+            except Exception as e:
+                logger.error("Initial JWKS load failed: %s", e)
+        _services_started = True
+
+async def before_request() -> None:
+    """Do the periodic work that background tasks would do in a server"""
+    global _last_compacted
+    from auth_service.core.jwks import get_jwks_source
+    from auth_service.core.revocation import get_revocation_list
+
+    revocation_list = get_revocation_list()
+    if time.time() - _last_compacted >= revocation_list.compact_interval:
+        _last_compacted = time.time()
+        revocation_list.compact()
+
+    jwks_source = get_jwks_source()
+    if jwks_source is not None:
+        await jwks_source.refresh_if_stale()
+
+async def after_request() -> None:
+    """Export the traces of this invocation before the process is frozen"""
+    from auth_service.core.tracing import get_trace_exporter
+
+    trace_exporter = get_trace_exporter()
+    if trace_exporter is not None:
+        await trace_exporter.flush()
+
+async def app(scope, receive, send):
+    """ASGI app that starts the service's background parts on its first request"""
+    service = load_app()
+    if scope["type"] != "http":
+        await service(scope, receive, send)
+        return
+
+    if _services_started:
+        await before_request()
+        try:
+            await service(scope, receive, send)
+        finally:
+            await after_request()
+        return
+
+    start = time.perf_counter()
+    await start_services()
+    cold_start_ms = sum(import_report.values()) + (time.perf_counter() - start) * 1000
+
+    async def send_with_cold_start(message):
+        if message["type"] == "http.response.start":
+            message["headers"] = list(message.get("headers", [])) + [
+                (b"server-timing", f"coldstart;dur={cold_start_ms:.1f}".encode("latin-1"))
+            ]
+        await send(message)
+
+    try:
+        await service(scope, receive, send_with_cold_start)
+    finally:
+        await after_request()
+
+# Import during the init phase rather than in the first invocation
+load_app()
+
+# Lambda-style handler; Mangum reuses one event loop across warm invocations
+handler = Mangum(app, lifespan="off")
@@ -1,12 +1,14 @@
 from typing import Optional, Dict, Any
 import httpx
 from auth_service.core.config import settings
+from auth_service.core.http import send_upstream
+from auth_service.core.singleflight import SingleFlight
 from auth_service.schemas.auth import (
     UserLogin, UserSignUp, MagicLinkRequest, 
     PasswordResetRequest, PasswordResetConfirm,
     GoogleAuthRequest
 )
-from auth_service.core.exceptions import AuthException
+from auth_service.core.exceptions import AuthException, UpstreamUnavailableException
 from fastapi import status
 import logging
 
@@ -21,6 +23,7 @@ class AuthService:
             "apikey": self.supabase_key,
             "Content-Type": "application/json"
         }
+        self._flights = SingleFlight()
     
     async def _supabase_request(self, endpoint: str, method: str = "GET", data: Optional[Dict[str, Any]] = None, auth_token: Optional[str] = None):
         """Make a request to Supabase API"""
@@ -30,42 +33,37 @@ class AuthService:
         if auth_token:
             headers["Authorization"] = f"Bearer {auth_token}"
         
-        logger.debug(f"Making {method} request to {url}")
+        logger.debug("Making %s request to %s", method, url)
         
-        async with httpx.AsyncClient() as client:
-            try:
-                if method == "GET":
-                    response = await client.get(url, headers=headers)
-                elif method == "POST":
-                    response = await client.post(url, headers=headers, json=data)
-                elif method == "PUT":
-                    response = await client.put(url, headers=headers, json=data)
-                elif method == "DELETE":
-                    response = await client.delete(url, headers=headers)
-                
-                logger.debug(f"Response status: {response.status_code}")
-                
-                if response.status_code >= 400:
-                    error_message = f"Error: {response.status_code}"
-                    try:
-                        error_data = response.json()
-                        error_message = str(error_data)
-                    except:
-                        error_message = f"Error: {response.status_code} - {response.text}"
-                    
-                    logger.error(f"Error in Supabase request: {error_message}")
-                    raise AuthException(
-                        status_code=response.status_code,
-                        detail=error_message
-                    )
+        try:
+            response = await send_upstream(method, url, endpoint, headers=headers, data=data)
+            
+            logger.debug("Response status: %s", response.status_code)
+            
+            if response.status_code >= 400:
+                error_message = f"Error: {response.status_code}"
+                try:
+                    error_data = response.json()
+                    error_message = str(error_data)
+                except:
+                    error_message = f"Error: {response.status_code} - {response.text}"
                 
-                return response.json()
-            except httpx.RequestError as e:
-                logger.error(f"Request error: {str(e)}")
+                logger.error("Error in Supabase request: %s", error_message)
                 raise AuthException(
-                    status_code=500,
-                    detail=f"Request error: {str(e)}"
+                    status_code=response.status_code,
+                    detail=error_message
                 )
+            
+            # e.g. logout answers 204 with no body
+            if response.status_code == 204 or not response.content:
+                return None
+            return response.json()
+        except httpx.RequestError as e:
+            logger.error("Request error: %s", e)
+            raise AuthException(
+                status_code=500,
+                detail=f"Request error: {str(e)}"
+            )
     
     async def signup(self, user_data: UserSignUp) -> Dict[str, Any]:
         """Register a new user"""
@@ -79,7 +77,7 @@ class AuthService:
             }
         }
         
-        result = await self._supabase_request("signup", "POST", auth_data)
+        result = await self._supabase_request("auth/v1/signup", "POST", auth_data)
         return result
     
     async def authenticate(self, email, password):
@@ -100,8 +98,10 @@ class AuthService:
             }
             
             return user
+        except UpstreamUnavailableException:
+            raise
         except Exception as e:
-            logger.error(f"Error in authenticate: {str(e)}")
+            logger.error("Error in authenticate: %s", e)
             return None
     
     async def send_magic_link(self, email: str, redirect_to: Optional[str] = None) -> None:
@@ -114,7 +114,7 @@ class AuthService:
         if redirect_to:
             data["redirect_to"] = redirect_to
             
-        await self._supabase_request("otp", "POST", data)
+        await self._supabase_request("auth/v1/otp", "POST", data)
     
     async def send_phone_otp(self, phone: str) -> None:
         """Send OTP to phone number"""
@@ -123,7 +123,7 @@ class AuthService:
             "type": "sms"
         }
         
-        await self._supabase_request("otp", "POST", data)
+        await self._supabase_request("auth/v1/otp", "POST", data)
     
     async def verify_phone_otp(self, phone: str, token: str) -> Dict[str, Any]:
         """Verify phone OTP"""
@@ -133,7 +133,7 @@ class AuthService:
             "type": "sms"
         }
         
-        result = await self._supabase_request("verify", "POST", data)
+        result = await self._supabase_request("auth/v1/verify", "POST", data)
         return result.get("user", {})
     
     async def request_password_reset(self, email: str) -> None:
@@ -142,21 +142,23 @@ class AuthService:
             "email": email
         }
         
-        await self._supabase_request("recover", "POST", data)
+        await self._supabase_request("auth/v1/recover", "POST", data)
     
     async def confirm_password_reset(self, token: str, password: str) -> None:
-        """Confirm password reset with token"""
+        """Confirm password reset with the token hash from the recovery email"""
         data = {
-            "token": token,
-            "password": password
+            "type": "recovery",
+            "token_hash": token
         }
         
-        await self._supabase_request("recover", "PUT", data)
+        # The recovery token signs the user in; the new password is set on that session
+        session = await self._supabase_request("auth/v1/verify", "POST", data)
+        await self._supabase_request("auth/v1/user", "PUT", {"password": password}, auth_token=session.get("access_token"))
 
     async def get_google_auth_url(self, redirect_uri):
         """Get Google OAuth URL for client-side redirect"""
         try:
-            logger.info(f"Getting Google auth URL with redirect: {redirect_uri}")
+            logger.info("Getting Google auth URL with redirect: %s", redirect_uri)
             
             # For Supabase, we need to construct the OAuth URL manually
             # since the /auth/v1/authorize endpoint might not be working as expected
@@ -165,19 +167,19 @@ class AuthService:
             # https://<your-project>.supabase.co/auth/v1/authorize?provider=google&redirect_to=<redirect_uri>
             oauth_url = f"{self.supabase_url}/auth/v1/authorize?provider=google&redirect_to={redirect_uri}"
             
-            logger.info(f"Generated OAuth URL: {oauth_url}")
+            logger.info("Generated OAuth URL: %s", oauth_url)
             
             return {"url": oauth_url}
         except Exception as e:
-            logger.error(f"Error in get_google_auth_url: {str(e)}")
+            logger.error("Error in get_google_auth_url: %s", e)
             raise
     
     async def handle_google_callback(self, code, redirect_uri=None):
         """Handle Google OAuth callback"""
         try:
             logger.info("Processing Google authentication callback")
-            logger.info(f"Code length: {len(code)}")
-            logger.info(f"Redirect URI: {redirect_uri}")
+            logger.info("Code length: %s", len(code))
+            logger.info("Redirect URI: %s", redirect_uri)
             
             # Exchange the authorization code for tokens
             data = {
@@ -190,16 +192,20 @@ class AuthService:
             if redirect_uri:
                 data["redirect_uri"] = redirect_uri
             
-            # Make the token exchange request
-            result = await self._supabase_request("auth/v1/token", "POST", data)
+            # Make the token exchange request; a code can only be redeemed once,
+            # so concurrent callbacks with the same code share one exchange
+            result = await self._flights.do(
+                ("google_code", code),
+                lambda: self._supabase_request("auth/v1/token", "POST", data),
+            )
             
             logger.info("Google authentication successful")
             return result
         except Exception as e:
-            logger.error(f"Error in handle_google_callback: {str(e)}")
+            logger.error("Error in handle_google_callback: %s", e)
             raise
     
-    async def logout(self, user_id: str) -> None:
-        """Logout user"""
-        await self._supabase_request("logout", "POST")
+    async def logout(self, access_token: str) -> None:
+        """End the Supabase session the access token belongs to"""
+        await self._supabase_request("auth/v1/logout", "POST", auth_token=access_token)
 
@@ -1,6 +1,7 @@
 from typing import Dict, Any
-import httpx
 from auth_service.core.config import settings
+from auth_service.core.http import send_upstream
+from auth_service.core.singleflight import SingleFlight
 from auth_service.core.exceptions import AuthException
 
 class SocialAuthService:
@@ -11,26 +12,35 @@ class SocialAuthService:
             "apikey": self.supabase_key,
             "Content-Type": "application/json"
         }
+        self._flights = SingleFlight()
     
     async def authenticate_google(self, id_token: str) -> Dict[str, Any]:
         """Authenticate with Google OAuth"""
+        # Concurrent sign-ins with the same ID token share one exchange
+        return await self._flights.do(
+            ("google_id_token", id_token),
+            lambda: self._exchange_id_token(id_token),
+        )
+    
+    async def _exchange_id_token(self, id_token: str) -> Dict[str, Any]:
+        """Exchange a Google ID token for a Supabase session"""
         data = {
             "id_token": id_token,
             "provider": "google"
         }
         
-        url = f"{self.supabase_url}/auth/v1/token?grant_type=id_token"
+        endpoint = "auth/v1/token?grant_type=id_token"
+        url = f"{self.supabase_url}/{endpoint}"
+        
+        response = await send_upstream("POST", url, endpoint, headers=self.headers, data=data)
+        
+        if response.status_code >= 400:
+            error_data = response.json()
+            raise AuthException(
+                status_code=response.status_code,
+                detail=error_data.get("message", "Google authentication error")
+            )
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=self.headers, json=data)
-            
-            if response.status_code >= 400:
-                error_data = response.json()
-                raise AuthException(
-                    status_code=response.status_code,
-                    detail=error_data.get("message", "Google authentication error")
-                )
-            
-            result = response.json()
-            return result.get("user", {})
+        result = response.json()
+        return result.get("user", {})
 
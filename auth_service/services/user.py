@@ -1,8 +1,15 @@
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional, Set, Tuple
+import asyncio
 import httpx
+import time
+from urllib.parse import quote
+from auth_service.core.cache import ProfileCache
+from auth_service.core.cache_backend import get_cache_backend
 from auth_service.core.config import settings
+from auth_service.core.http import send_upstream
+from auth_service.core.singleflight import SingleFlight
 from auth_service.schemas.user import UserProfile
-from auth_service.core.exceptions import AuthException
+from auth_service.core.exceptions import AuthException, UpstreamUnavailableException
 import logging
 import json
 from datetime import datetime
@@ -21,61 +28,71 @@ class UserService:
         }
         # Use the correct table name from your schema
         self.profile_table = "user_profiles"
+        self.profile_cache = ProfileCache(
+            max_size=settings.PROFILE_CACHE_MAX_SIZE,
+            ttl=settings.PROFILE_CACHE_TTL_SECONDS,
+            stale_ttl=settings.PROFILE_CACHE_STALE_TTL_SECONDS,
+        )
+        self._revalidating: Set[str] = set()
+        self._flights = SingleFlight()
+        self._background_tasks: Set[asyncio.Task] = set()
+        
+        # With a shared backend, profiles fetched by any worker are reused by
+        # all of them and each worker's profile_cache acts as its L1
+        backend = get_cache_backend()
+        self.shared_cache = backend if backend.shared else None
+        if self.shared_cache is not None:
+            self.shared_cache.on_invalidate("profile", self.profile_cache.invalidate, clear=self.profile_cache.clear)
     
-    async def _supabase_request(self, endpoint: str, method: str = "GET", data: Optional[Dict[str, Any]] = None, auth_token: Optional[str] = None):
+    async def _supabase_request(self, endpoint: str, method: str = "GET", data: Optional[Dict[str, Any]] = None, auth_token: Optional[str] = None, prefer: Optional[str] = None):
         """Make a request to Supabase API"""
         url = f"{self.supabase_url}/{endpoint}"
         
         headers = self.headers.copy()
         if auth_token:
             headers["Authorization"] = f"Bearer {auth_token}"
+        if prefer:
+            headers["Prefer"] = prefer
         
-        logger.debug(f"Making {method} request to {url}")
+        logger.debug("Making %s request to %s", method, url)
         
-        async with httpx.AsyncClient() as client:
-            try:
-                if method == "GET":
-                    response = await client.get(url, headers=headers)
-                elif method == "POST":
-                    response = await client.post(url, headers=headers, json=data)
-                elif method == "PUT":
-                    response = await client.put(url, headers=headers, json=data)
-                elif method == "PATCH":
-                    response = await client.patch(url, headers=headers, json=data)
-                elif method == "DELETE":
-                    response = await client.delete(url, headers=headers)
-                
-                logger.debug(f"Response status: {response.status_code}")
-                
-                if response.status_code >= 400:
-                    try:
-                        error_data = response.json()
-                        error_message = json.dumps(error_data)
-                    except:
-                        error_message = f"Error: {response.status_code} - {response.text}"
-                    
-                    logger.error(f"Error in Supabase request: {error_message}")
-                    raise AuthException(
-                        status_code=response.status_code,
-                        detail=error_message
-                    )
+        try:
+            response = await send_upstream(method, url, endpoint, headers=headers, data=data)
+            
+            logger.debug("Response status: %s", response.status_code)
+            
+            if response.status_code >= 400:
+                try:
+                    error_data = response.json()
+                    error_message = json.dumps(error_data)
+                except:
+                    error_message = f"Error: {response.status_code} - {response.text}"
                 
-                return response.json()
-            except httpx.RequestError as e:
-                logger.error(f"Request error: {str(e)}")
+                logger.error("Error in Supabase request: %s", error_message)
                 raise AuthException(
-                    status_code=500,
-                    detail=f"Request error: {str(e)}"
+                    status_code=response.status_code,
+                    detail=error_message
                 )
+            
+            # PostgREST answers writes without return=representation with an empty body
+            if not response.content:
+                return None
+            return response.json()
+        except httpx.RequestError as e:
+            logger.error("Request error: %s", e)
+            raise AuthException(
+                status_code=500,
+                detail=f"Request error: {str(e)}"
+            )
     
     def _extract_email_from_token(self, token: str) -> str:
         """Extract email from JWT token"""
         try:
-            # Decode the token without verification
-            decoded = jose_jwt.decode(token, options={"verify_signature": False})
+            # Read the claims without verification (the token was verified by get_current_user)
+            decoded = jose_jwt.get_unverified_claims(token)
             
             # Log the token structure for debugging
-            logger.debug(f"JWT token payload: {json.dumps(decoded)}")
+            logger.debug("JWT token payload: %s", decoded)
             
             # Check various possible locations for the email
             # 1. Direct email claim
@@ -103,51 +120,172 @@ class UserService:
             # 5. Try to get email from auth endpoint
             return ""
         except Exception as e:
-            logger.error(f"Error extracting email from token: {str(e)}")
+            logger.error("Error extracting email from token: %s", e)
             return ""
     
     async def _get_user_email_from_auth(self, auth_token: str) -> str:
         """Get user email from Supabase auth endpoint"""
         try:
-            # Try to get user data from Supabase auth endpoint
-            user_data = await self._supabase_request("auth/v1/user", "GET", auth_token=auth_token)
+            # Try to get user data from Supabase auth endpoint, sharing concurrent lookups
+            user_data = await self._flights.do(
+                ("auth_user", auth_token),
+                lambda: self._supabase_request("auth/v1/user", "GET", auth_token=auth_token),
+            )
             if user_data and "email" in user_data:
                 return user_data["email"]
             return ""
         except Exception as e:
-            logger.error(f"Error getting user email from auth: {str(e)}")
+            logger.error("Error getting user email from auth: %s", e)
             return ""
     
+    async def _fetch_profile(self, user_id: str, auth_token: Optional[str] = None) -> Dict[str, Any]:
+        """Fetch a user's profile row from Supabase, creating it if missing"""
+        profile_endpoint = f"rest/v1/{self.profile_table}?id=eq.{user_id}&select=*"
+        profiles = await self._supabase_request(profile_endpoint, "GET", auth_token=auth_token)
+        
+        if profiles and len(profiles) > 0:
+            return profiles[0]
+        
+        # Profile doesn't exist, create it in the same round trip that returns it.
+        # Concurrent creators are ignored so a row made meanwhile (e.g. by the
+        # signup trigger) is never overwritten with blanks.
+        logger.info("Profile not found for user %s, creating one", user_id)
+        now = datetime.utcnow().isoformat()
+        profile_data = {
+            "id": user_id,
+            "first_name": "",
+            "last_name": "",
+            "phone_number": "",
+            "avatar_url": "",
+            "created_at": now,
+            "updated_at": now
+        }
+        created = await self._upsert_profile(profile_data, auth_token, merge=False)
+        if created:
+            return created
+        
+        # Lost the race to another creator, read the row it made
+        profiles = await self._supabase_request(profile_endpoint, "GET", auth_token=auth_token)
+        return profiles[0] if profiles else profile_data
+    
+    async def _upsert_profile(self, profile_data: Dict[str, Any], auth_token: Optional[str] = None, merge: bool = True) -> Optional[Dict[str, Any]]:
+        """Insert or update a profile row in one request and return the stored row"""
+        resolution = "merge-duplicates" if merge else "ignore-duplicates"
+        rows = await self._supabase_request(
+            f"rest/v1/{self.profile_table}?on_conflict=id",
+            "POST",
+            data=profile_data,
+            auth_token=auth_token,
+            prefer=f"resolution={resolution},return=representation",
+        )
+        return rows[0] if rows else None
+    
+    async def create_profile(self, user_id: str, first_name: Optional[str] = None, last_name: Optional[str] = None, phone_number: Optional[str] = None, auth_token: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Create a new user's profile row, leaving an existing one untouched"""
+        now = datetime.utcnow().isoformat()
+        profile_data = {
+            "id": user_id,
+            "first_name": first_name or "",
+            "last_name": last_name or "",
+            "phone_number": phone_number or "",
+            "avatar_url": "",
+            "created_at": now,
+            "updated_at": now
+        }
+        return await self._upsert_profile(profile_data, auth_token, merge=False)
+    
+    async def _get_shared_profiles(self, user_ids: List[str]) -> Dict[str, Tuple[Dict[str, Any], bool]]:
+        """Get ``{user_id: (profile, is_fresh)}`` from the shared cache, copying hits into the local one"""
+        if self.shared_cache is None or not user_ids:
+            return {}
+        
+        values = await self.shared_cache.get_many([f"profile:{user_id}" for user_id in user_ids])
+        ttl = self.profile_cache.ttl
+        max_age = ttl + self.profile_cache.stale_ttl
+        now = time.time()
+        found = {}
+        for user_id, value in zip(user_ids, values):
+            if value is None:
+                continue
+            entry = json.loads(value)
+            age = max(0.0, now - entry["stored_at"])
+            if age > max_age:
+                continue
+            self.profile_cache.set(user_id, entry["profile"], age=age)
+            found[user_id] = (entry["profile"], age <= ttl)
+        return found
+    
+    async def _set_shared_profiles(self, profiles: Dict[str, Dict[str, Any]]) -> None:
+        """Publish freshly fetched profiles to the shared cache and the other workers"""
+        if self.shared_cache is None or not profiles:
+            return
+        
+        now = time.time()
+        ttl = self.profile_cache.ttl + self.profile_cache.stale_ttl
+        await self.shared_cache.set_many([
+            (f"profile:{user_id}", json.dumps({"stored_at": now, "profile": profile}).encode("utf-8"), ttl)
+            for user_id, profile in profiles.items()
+        ])
+        await self.shared_cache.invalidate("profile", *profiles)
+    
+    async def _load_profile(self, user_id: str, auth_token: Optional[str] = None) -> Dict[str, Any]:
+        """Fetch a profile into the cache, coalescing concurrent fetches for the same user"""
+        async def load():
+            profile = await self._fetch_profile(user_id, auth_token)
+            self.profile_cache.set(user_id, profile)
+            await self._set_shared_profiles({user_id: profile})
+            return profile
+        
+        profile = await self._flights.do(("profile", user_id), load)
+        return dict(profile)
+    
+    async def _revalidate_profile(self, user_id: str, auth_token: Optional[str] = None) -> None:
+        """Refresh a stale cached profile in the background"""
+        try:
+            await self._load_profile(user_id, auth_token)
+        except Exception as e:
+            # Keep serving the stale entry until it ages out
+            logger.warning("Error revalidating profile for user %s: %s", user_id, e)
+        finally:
+            self._revalidating.discard(user_id)
+    
+    async def _get_profile(self, user_id: str, auth_token: Optional[str] = None) -> Dict[str, Any]:
+        """Get a user's profile, serving from cache when possible"""
+        profile, fresh = self.profile_cache.get(user_id)
+        if profile is None:
+            shared = await self._get_shared_profiles([user_id])
+            if user_id in shared:
+                profile, fresh = shared[user_id]
+        if profile is not None:
+            if not fresh and user_id not in self._revalidating:
+                self._revalidating.add(user_id)
+                task = asyncio.create_task(self._revalidate_profile(user_id, auth_token))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+            return profile
+        
+        return await self._load_profile(user_id, auth_token)
+    
+    async def invalidate_profiles(self, user_ids: List[str]) -> None:
+        """Drop users' cached profiles in every worker"""
+        for user_id in user_ids:
+            self.profile_cache.invalidate(user_id)
+        if self.shared_cache is not None and user_ids:
+            await self.shared_cache.delete(*(f"profile:{user_id}" for user_id in user_ids))
+            await self.shared_cache.invalidate("profile", *user_ids)
+    
     async def get_user_by_id(self, user_id: str, auth_token: Optional[str] = None) -> Dict[str, Any]:
         """Get user by ID"""
         try:
-            logger.info(f"Fetching user with ID: {user_id}")
+            logger.info("Fetching user with ID: %s", user_id)
             
             # First, get the user's profile from the user_profiles table
-            profile_endpoint = f"rest/v1/{self.profile_table}?id=eq.{user_id}&select=*"
-            
             try:
-                profiles = await self._supabase_request(profile_endpoint, "GET", auth_token=auth_token)
-                
-                if not profiles or len(profiles) == 0:
-                    # Profile doesn't exist, create one
-                    logger.info(f"Profile not found for user {user_id}, creating one")
-                    now = datetime.utcnow().isoformat()
-                    profile_data = {
-                        "id": user_id,
-                        "first_name": "",
-                        "last_name": "",
-                        "phone_number": "",
-                        "avatar_url": "",
-                        "created_at": now,
-                        "updated_at": now
-                    }
-                    await self._supabase_request(f"rest/v1/{self.profile_table}", "POST", data=profile_data, auth_token=auth_token)
-                    profile = profile_data
-                else:
-                    profile = profiles[0]
+                profile = await self._get_profile(user_id, auth_token)
+            except UpstreamUnavailableException:
+                raise
             except Exception as e:
-                logger.error(f"Error fetching profile: {str(e)}")
+                logger.error("Error fetching profile: %s", e)
                 now = datetime.utcnow().isoformat()
                 profile = {
                     "first_name": "",
@@ -158,47 +296,135 @@ class UserService:
                     "updated_at": now
                 }
             
-            # For the user's email, try multiple methods
-            email = "user@example.com"  # Default valid email
-            
-            if auth_token:
-                # Method 1: Extract from token
-                token_email = self._extract_email_from_token(auth_token)
-                if token_email:
-                    email = token_email
-                    logger.info(f"Extracted email from token: {email}")
-                else:
-                    # Method 2: Get from auth endpoint
-                    auth_email = await self._get_user_email_from_auth(auth_token)
-                    if auth_email:
-                        email = auth_email
-                        logger.info(f"Got email from auth endpoint: {email}")
-                    else:
-                        logger.warning("Could not extract email from token or auth endpoint")
-            
-            # Ensure we have valid datetime strings
-            now = datetime.utcnow().isoformat()
-            created_at = profile.get("created_at") or now
-            updated_at = profile.get("updated_at") or now
-            
-            # Combine user and profile data
-            return {
-                "id": user_id,
-                "email": email,
-                "first_name": profile.get("first_name", ""),
-                "last_name": profile.get("last_name", ""),
-                "phone_number": profile.get("phone_number", ""),
-                "avatar_url": profile.get("avatar_url", ""),
-                "role": "user",
-                "is_verified": True,  # Assume verified since they have a token
-                "created_at": created_at,
-                "updated_at": updated_at,
-                "last_login": now
-            }
+            return await self._build_user(user_id, profile, auth_token)
         except Exception as e:
-            logger.error(f"Error getting user by ID: {str(e)}")
+            logger.error("Error getting user by ID: %s", e)
             raise
     
+    async def _build_user(self, user_id: str, profile: Dict[str, Any], auth_token: Optional[str] = None) -> Dict[str, Any]:
+        """Combine a profile row with the user's email into a user response"""
+        # For the user's email, try multiple methods
+        email = "user@example.com"  # Default valid email
+        
+        if auth_token:
+            # Method 1: Extract from token
+            token_email = self._extract_email_from_token(auth_token)
+            if token_email:
+                email = token_email
+                logger.info("Extracted email from token: %s", email)
+            else:
+                # Method 2: Get from auth endpoint
+                auth_email = await self._get_user_email_from_auth(auth_token)
+                if auth_email:
+                    email = auth_email
+                    logger.info("Got email from auth endpoint: %s", email)
+                else:
+                    logger.warning("Could not extract email from token or auth endpoint")
+        
+        # Ensure we have valid datetime strings
+        now = datetime.utcnow().isoformat()
+        created_at = profile.get("created_at") or now
+        updated_at = profile.get("updated_at") or now
+        
+        # Combine user and profile data
+        return {
+            "id": user_id,
+            "email": email,
+            "first_name": profile.get("first_name", ""),
+            "last_name": profile.get("last_name", ""),
+            "phone_number": profile.get("phone_number", ""),
+            "avatar_url": profile.get("avatar_url", ""),
+            "role": "user",
+            "is_verified": True,  # Assume verified since they have a token
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "last_login": now
+        }
+    
+    async def _fetch_profiles_chunk(self, user_ids: List[str], auth_token: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Fetch several profile rows with a single PostgREST in.() query"""
+        id_list = ",".join(user_ids)
+        endpoint = f"rest/v1/{self.profile_table}?id=in.({id_list})&select=*"
+        return await self._supabase_request(endpoint, "GET", auth_token=auth_token) or []
+    
+    async def get_users_by_ids(self, user_ids: List[str], auth_token: Optional[str] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Get profiles for many users, returning (profiles in request order, missing ids)"""
+        ordered_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        
+        profiles: Dict[str, Dict[str, Any]] = {}
+        to_fetch = []
+        for user_id in ordered_ids:
+            profile, fresh = self.profile_cache.get(user_id)
+            if profile is not None and fresh:
+                profiles[user_id] = profile
+            else:
+                to_fetch.append(user_id)
+        
+        # Profiles other workers fetched recently
+        for user_id, (profile, fresh) in (await self._get_shared_profiles(to_fetch)).items():
+            if fresh:
+                profiles[user_id] = profile
+        to_fetch = [user_id for user_id in to_fetch if user_id not in profiles]
+        
+        chunk_size = max(1, settings.USER_BATCH_CHUNK_SIZE)
+        chunks = [to_fetch[i:i + chunk_size] for i in range(0, len(to_fetch), chunk_size)]
+        logger.info("Fetching %s of %s profiles in %s queries", len(to_fetch), len(ordered_ids), len(chunks))
+        
+        fetched = {}
+        for rows in await asyncio.gather(*(self._fetch_profiles_chunk(chunk, auth_token) for chunk in chunks)):
+            for row in rows:
+                user_id = str(row.get("id"))
+                fetched[user_id] = row
+                self.profile_cache.set(user_id, row)
+        profiles.update(fetched)
+        await self._set_shared_profiles(fetched)
+        
+        found = []
+        missing = []
+        for user_id in ordered_ids:
+            profile = profiles.get(user_id)
+            if profile is None:
+                missing.append(user_id)
+                continue
+            found.append({
+                "id": user_id,
+                "first_name": profile.get("first_name") or "",
+                "last_name": profile.get("last_name") or "",
+                "phone_number": profile.get("phone_number"),
+                "avatar_url": profile.get("avatar_url"),
+                "role": profile.get("role") or "user",
+                "created_at": profile.get("created_at"),
+                "updated_at": profile.get("updated_at"),
+            })
+        return found, missing
+    
+    async def iter_profile_pages(self, page_size: int = 1000, auth_token: Optional[str] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Page through every profile row in id order, bypassing the cache.
+        
+        Pages are keyed on the last id seen (``id=gt.<id>``) rather than an
+        OFFSET, so each query is an index range scan however deep the export
+        is. The next page is requested as soon as the current one arrives,
+        overlapping its round trip with whatever the caller does with the
+        current one; at most two pages are held at a time.
+        """
+        async def fetch(after: Optional[str]) -> List[Dict[str, Any]]:
+            endpoint = f"rest/v1/{self.profile_table}?select=*&order=id.asc&limit={page_size}"
+            if after is not None:
+                endpoint += f"&id=gt.{quote(after, safe='')}"
+            return await self._supabase_request(endpoint, "GET", auth_token=auth_token) or []
+        
+        next_page: Optional[asyncio.Task] = asyncio.create_task(fetch(None))
+        try:
+            while next_page is not None:
+                page = await next_page
+                # A short page is the last one
+                next_page = asyncio.create_task(fetch(str(page[-1]["id"]))) if len(page) == page_size else None
+                if page:
+                    yield page
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+    
     async def update_user(self, user_id: str, profile_data: UserProfile, auth_token: Optional[str] = None) -> Dict[str, Any]:
         """Update user profile"""
         try:
@@ -209,11 +435,26 @@ class UserService:
             # Update the profile in the user_profiles table
             profile_endpoint = f"rest/v1/{self.profile_table}?id=eq.{user_id}"
             
-            await self._supabase_request(profile_endpoint, "PATCH", data=update_data, auth_token=auth_token)
+            try:
+                # Get the updated row back in the same response
+                rows = await self._supabase_request(
+                    profile_endpoint, "PATCH", data=update_data, auth_token=auth_token,
+                    prefer="return=representation"
+                )
+                if rows:
+                    profile = rows[0]
+                else:
+                    # No profile row yet, create it with the new values
+                    update_data["id"] = user_id
+                    profile = await self._upsert_profile(update_data, auth_token) or update_data
+            except Exception:
+                await self.invalidate_profiles([user_id])
+                raise
             
-            # Get the updated user
-            return await self.get_user_by_id(user_id, auth_token)
+            self.profile_cache.set(user_id, profile)
+            await self._set_shared_profiles({user_id: profile})
+            return await self._build_user(user_id, profile, auth_token)
         except Exception as e:
-            logger.error(f"Error updating user: {str(e)}")
+            logger.error("Error updating user: %s", e)
             raise
 
@@ -0,0 +1,219 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+import asyncio
+import csv
+import json
+import logging
+import time
+from pydantic import ValidationError
+from auth_service.core.exceptions import AuthException, UpstreamUnavailableException
+from auth_service.schemas.auth import UserSignUp
+from auth_service.services.auth import AuthService
+from auth_service.services.user import UserService
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# A parsed row: (row number, fields) or (row number, error message)
+Row = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Optional[bytes]]:
+    """Split a byte stream into lines without holding more than one partial line.
+
+    Lines longer than ``max_line_bytes`` are dropped as they arrive and
+    reported as a single None.
+    """
+    pending = b""
+    skipping = False
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if skipping:
+                # The rest of an over-long line
+                skipping = False
+                continue
+            yield line.rstrip(b"\r")
+        if len(pending) > max_line_bytes:
+            if not skipping:
+                yield None
+            skipping = True
+            pending = b""
+    if pending and not skipping:
+        yield pending.rstrip(b"\r")
+
+async def iter_jsonl_rows(lines: AsyncIterator[Optional[bytes]]) -> AsyncIterator[Row]:
+    """Parse one JSON object per line, skipping blank lines"""
+    row_number = 0
+    async for line in lines:
+        if line is not None and not line.strip():
+            continue
+        row_number += 1
+        if line is None:
+            yield row_number, None, "Line too long"
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            yield row_number, None, "Invalid JSON"
+            continue
+        if not isinstance(data, dict):
+            yield row_number, None, "Expected a JSON object"
+            continue
+        yield row_number, data, None
+
+async def iter_csv_rows(lines: AsyncIterator[Optional[bytes]]) -> AsyncIterator[Row]:
+    """Parse CSV with a header row; quoted fields may span lines"""
+    header: Optional[List[str]] = None
+    row_number = 0
+    record = ""
+    async for line in lines:
+        if line is None:
+            row_number += 1
+            record = ""
+            yield row_number, None, "Line too long"
+            continue
+        try:
+            text = line.decode("utf-8-sig" if header is None and not record else "utf-8")
+        except UnicodeDecodeError:
+            row_number += 1
+            record = ""
+            yield row_number, None, "Invalid UTF-8"
+            continue
+
+        record = f"{record}\n{text}" if record else text
+        # An odd number of quotes means a quoted field continues on the next line
+        if record.count('"') % 2:
+            continue
+        if not record.strip():
+            record = ""
+            continue
+
+        values = next(csv.reader([record]))
+        record = ""
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row_number += 1
+        if len(values) != len(header):
+            yield row_number, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        # Empty cells are missing values, not empty strings
+        yield row_number, {name: value for name, value in zip(header, values) if value != ""}, None
+
+    if record:
+        yield row_number + 1, None, "Unterminated quoted field"
+
+class UserImporter:
+    """Signs up users from a stream of rows with a bounded number in flight.
+
+    Rows are read only as fast as workers free up, so memory stays flat no
+    matter how large the input is: at most ``concurrency`` rows are being
+    processed and nothing is kept once its result has been yielded. Each
+    valid row is signed up through GoTrue and gets a profile row (kept if
+    one already exists). Rows refused locally because the upstream is
+    overloaded are retried after the advertised delay.
+    """
+
+    def __init__(
+        self,
+        auth_service: AuthService,
+        user_service: UserService,
+        concurrency: int = 8,
+        progress_every: int = 1000,
+        max_attempts: int = 3,
+    ):
+        self.auth_service = auth_service
+        self.user_service = user_service
+        self.concurrency = max(1, concurrency)
+        self.progress_every = progress_every
+        self.max_attempts = max_attempts
+
+    async def _signup(self, user: UserSignUp) -> Dict[str, Any]:
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return await self.auth_service.signup(user)
+            except UpstreamUnavailableException as e:
+                if attempt == self.max_attempts:
+                    raise
+                await asyncio.sleep(float((e.headers or {}).get("Retry-After", 1)))
+
+    async def import_row(self, row_number: int, data: Optional[Dict[str, Any]], error: Optional[str]) -> Dict[str, Any]:
+        """Sign up one row and create its profile, returning the row's result"""
+        if error is not None:
+            return {"row": row_number, "status": "invalid", "error": error}
+        try:
+            user = UserSignUp.model_validate(data)
+        except ValidationError as e:
+            # Never echo the input back, it holds the password
+            errors = [{"loc": list(item["loc"]), "msg": item["msg"]} for item in e.errors()]
+            return {"row": row_number, "status": "invalid", "errors": errors}
+
+        try:
+            result = await self._signup(user)
+        except AuthException as e:
+            status = "exists" if e.status_code == 422 and "already" in str(e.detail).lower() else "failed"
+            return {"row": row_number, "status": status, "email": user.email, "status_code": e.status_code, "error": e.detail}
+
+        # GoTrue returns a session, or just the user when email confirmation is on
+        created = result.get("user") or result
+        user_id = created.get("id")
+        try:
+            await self.user_service.create_profile(
+                user_id,
+                first_name=user.first_name,
+                last_name=user.last_name,
+                phone_number=user.phone_number,
+                auth_token=result.get("access_token"),
+            )
+        except AuthException as e:
+            return {"row": row_number, "status": "profile_failed", "id": user_id, "email": user.email, "error": e.detail}
+        return {"row": row_number, "status": "created", "id": user_id, "email": user.email}
+
+    async def run(self, rows: AsyncIterator[Row]) -> AsyncIterator[Dict[str, Any]]:
+        """Import every row, yielding per-row results, periodic progress and a summary"""
+        counts: Dict[str, int] = {}
+        started = time.monotonic()
+        pending: Set[asyncio.Task] = set()
+
+        def progress() -> Dict[str, Any]:
+            done = sum(counts.values())
+            elapsed = time.monotonic() - started
+            return {
+                "rows": done,
+                **counts,
+                "elapsed_seconds": round(elapsed, 3),
+                "rows_per_second": round(done / elapsed, 1) if elapsed > 0 else 0.0,
+            }
+
+        def finished(tasks: Set[asyncio.Task]) -> List[Dict[str, Any]]:
+            results = []
+            for task in tasks:
+                result = task.result()
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+                results.append(result)
+                if self.progress_every and sum(counts.values()) % self.progress_every == 0:
+                    results.append({"progress": progress()})
+            return results
+
+        try:
+            async for row in rows:
+                if len(pending) >= self.concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for result in finished(done):
+                        yield result
+                pending.add(asyncio.create_task(self.import_row(*row)))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for result in finished(done):
+                    yield result
+        finally:
+            # Client went away or the body broke off: stop the rows still in flight
+            for task in pending:
+                task.cancel()
+
+        summary = progress()
+        logger.info("User import finished: %s", summary)
+        yield {"summary": summary}
@@ -0,0 +1,181 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+class BenchResult:
+    """Throughput and allocation figures for one benchmark"""
+
+    __slots__ = ("name", "ops_per_sec", "stdev_pct", "bytes_per_op", "blocks_per_op")
+
+    def __init__(self, name: str, ops_per_sec: float, stdev_pct: float, bytes_per_op: float, blocks_per_op: float):
+        self.name = name
+        self.ops_per_sec = ops_per_sec
+        self.stdev_pct = stdev_pct
+        self.bytes_per_op = bytes_per_op
+        self.blocks_per_op = blocks_per_op
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "ops_per_sec": round(self.ops_per_sec, 1),
+            "stdev_pct": round(self.stdev_pct, 2),
+            "bytes_per_op": round(self.bytes_per_op, 1),
+            "blocks_per_op": round(self.blocks_per_op, 2),
+        }
+
+class Runner:
+    """Times sync and async callables and tracks their allocations.
+
+    Each benchmark is calibrated to run for about ``target_time`` seconds
+    per round and the best of ``rounds`` is reported, which is the most
+    reproducible figure on a noisy machine. Allocations are measured in a
+    separate pass under tracemalloc: ``bytes_per_op`` is the mean peak of
+    memory allocated during one call, ``blocks_per_op`` the memory blocks
+    still alive afterwards (non-zero means the call retains state).
+    """
+
+    def __init__(self, target_time: float = 0.2, rounds: int = 5, alloc_ops: int = 200, only: Optional[List[str]] = None):
+        self.target_time = target_time
+        self.rounds = rounds
+        self.alloc_ops = alloc_ops
+        self.only = only
+        self.results: List[BenchResult] = []
+        self._loop = asyncio.new_event_loop()
+
+    def close(self) -> None:
+        self._loop.close()
+
+    def _selected(self, name: str) -> bool:
+        return not self.only or any(pattern in name for pattern in self.only)
+
+    def _time_batch(self, fn: Callable[[], Any], is_async: bool, n: int) -> float:
+        if is_async:
+            async def batch():
+                for _ in range(n):
+                    await fn()
+            start = time.perf_counter()
+            self._loop.run_until_complete(batch())
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return time.perf_counter() - start
+
+    def bench(self, name: str, fn: Callable[[], Any]) -> None:
+        """Benchmark a sync callable"""
+        self._run(name, fn, is_async=False)
+
+    def bench_async(self, name: str, fn: Callable[[], Awaitable[Any]]) -> None:
+        """Benchmark a coroutine function, awaited back to back on one event loop"""
+        self._run(name, fn, is_async=True)
+
+    def _measure_allocations(self, fn: Callable[[], Any], is_async: bool):
+        peaks = []
+
+        async def measure_async():
+            for _ in range(self.alloc_ops):
+                current, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                await fn()
+                peaks.append(tracemalloc.get_traced_memory()[1] - current)
+
+        def measure_sync():
+            for _ in range(self.alloc_ops):
+                current, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                fn()
+                peaks.append(tracemalloc.get_traced_memory()[1] - current)
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            if is_async:
+                self._loop.run_until_complete(measure_async())
+            else:
+                measure_sync()
+            gc.collect()
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        # The peaks list itself grows by one block per op
+        retained = sum(stat.count_diff for stat in after.compare_to(before, "filename")) - len(peaks)
+        return statistics.mean(peaks), max(0, retained) / self.alloc_ops
+
+    def _run(self, name: str, fn: Callable[[], Any], is_async: bool) -> None:
+        if not self._selected(name):
+            return
+
+        # Warm up, then grow the batch until one round takes long enough
+        self._time_batch(fn, is_async, 10)
+        n = 10
+        while True:
+            elapsed = self._time_batch(fn, is_async, n)
+            if elapsed >= self.target_time / 4 or n >= 10_000_000:
+                break
+            n *= 4
+        n = max(1, int(n * self.target_time / max(elapsed, 1e-9)))
+
+        rates = []
+        gc.collect()
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for _ in range(self.rounds):
+                rates.append(n / self._time_batch(fn, is_async, n))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        best = max(rates)
+        stdev_pct = statistics.pstdev(rates) / statistics.mean(rates) * 100 if len(rates) > 1 else 0.0
+
+        bytes_per_op, blocks_per_op = self._measure_allocations(fn, is_async)
+
+        result = BenchResult(name, best, stdev_pct, bytes_per_op, blocks_per_op)
+        self.results.append(result)
+        print(
+            f"{name:<48} {result.ops_per_sec:>12,.0f} ops/s  ±{result.stdev_pct:4.1f}%"
+            f"  {result.bytes_per_op:>9,.0f} B/op  {result.blocks_per_op:>6.2f} blocks/op"
+        )
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "benchmarks": {result.name: result.to_dict() for result in self.results},
+        }
+
+def save_baseline(path: str, data: Dict[str, Any]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def compare_to_baseline(path: str, data: Dict[str, Any], threshold: float) -> List[str]:
+    """Print a comparison and return the names of benchmarks slower than ``threshold``"""
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)["benchmarks"]
+
+    regressions = []
+    print(f"\n{'benchmark':<48} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, current in data["benchmarks"].items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<48} {'-':>12} {current['ops_per_sec']:>12,.0f} {'new':>8}")
+            continue
+        change = current["ops_per_sec"] / previous["ops_per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:<48} {previous['ops_per_sec']:>12,.0f} {current['ops_per_sec']:>12,.0f}"
+            f" {change:>+8.1%}{flag}"
+        )
+    return regressions
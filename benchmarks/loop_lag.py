@@ -0,0 +1,109 @@
+"""Event-loop latency while passwords are being hashed.
+
+A ticker coroutine asks to wake up every millisecond and records how late
+it actually runs; that lateness is what every other request on the loop
+would wait. The same batch of concurrent hashes and verifications is run
+once inline (calling the sync helpers from a coroutine, as a route would)
+and once through the async pool.
+
+    python -m benchmarks.loop_lag
+    python -m benchmarks.loop_lag --concurrency 16 --bcrypt-rounds 12
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def _ticker(stop: asyncio.Event, lags: list, interval: float = 0.001) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+async def _measure(name: str, work) -> None:
+    lags = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(stop, lags))
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    calls = await work()
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await ticker
+    print(
+        f"{name:<10} {calls / elapsed:>8.1f} calls/s"
+        f"  loop lag p50 {statistics.median(lags) * 1000:>7.2f} ms"
+        f"  p99 {_percentile(lags, 0.99) * 1000:>7.2f} ms"
+        f"  max {max(lags) * 1000:>7.2f} ms"
+    )
+
+async def _run(concurrency: int, batches: int) -> None:
+    from auth_service.core.security import (
+        get_password_hash,
+        get_password_hash_async,
+        get_password_hasher,
+        verify_password,
+        verify_password_async,
+    )
+
+    stored = get_password_hash("bench-password")
+
+    async def inline_call(i: int) -> None:
+        await asyncio.sleep(0)
+        if i % 2:
+            verify_password("bench-password", stored)
+        else:
+            get_password_hash("bench-password")
+
+    async def pooled_call(i: int) -> None:
+        if i % 2:
+            await verify_password_async("bench-password", stored)
+        else:
+            await get_password_hash_async("bench-password")
+
+    def batch(call):
+        async def work():
+            for _ in range(batches):
+                await asyncio.gather(*(call(i) for i in range(concurrency)))
+            return batches * concurrency
+        return work
+
+    hasher = get_password_hasher()
+    # Start the workers outside the measurement
+    await verify_password_async("bench-password", stored)
+    print(f"{concurrency} concurrent calls x {batches} batches, {hasher.workers} {hasher.executor_kind} workers\n")
+
+    await _measure("inline", batch(inline_call))
+    await _measure("pool", batch(pooled_call))
+    hasher.close()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8, help="hashing calls started together")
+    parser.add_argument("--batches", type=int, default=3, help="batches of concurrent calls")
+    parser.add_argument("--bcrypt-rounds", type=int, default=10, help="bcrypt cost factor")
+    parser.add_argument("--executor", choices=("process", "thread"), default="process")
+    args = parser.parse_args(argv)
+
+    # Settings are read at import time
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("SUPABASE_KEY", "bench-anon-key")
+    os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-supabase-secret")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-secret")
+    os.environ["PASSWORD_BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ["PASSWORD_HASH_EXECUTOR"] = args.executor
+    os.environ.setdefault("PASSWORD_HASH_MAX_QUEUE", str(args.concurrency))
+
+    asyncio.run(_run(args.concurrency, args.batches))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
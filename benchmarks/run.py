@@ -0,0 +1,257 @@
+"""Microbenchmarks for the service's hot functions.
+
+Runs offline: no Supabase or network access is needed.
+
+    python -m benchmarks.run                          # run everything
+    python -m benchmarks.run -k get_current_user      # only matching benchmarks
+    python -m benchmarks.run --save baseline.json     # record a baseline
+    python -m benchmarks.run --compare baseline.json  # fail on >10% slowdowns
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+# Settings are read at import time; give the benchmarks a self-contained config
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench-anon-key")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-supabase-secret")
+os.environ.setdefault("JWT_SECRET_KEY", "bench-secret")
+os.environ.setdefault("JWT_ADDITIONAL_KEYS", "bench-retired:bench-retired-secret")
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from jose import jwt
+from pydantic import ValidationError
+from starlette.requests import Request
+
+from auth_service.core.config import settings
+from auth_service.core.exceptions import (
+    AuthException,
+    auth_exception_handler,
+    general_exception_handler,
+    validation_exception_handler,
+)
+from auth_service.core import revocation
+from auth_service.core.responses import user_response_adapter
+from auth_service.core.revocation import RevocationList
+from auth_service.core.security import create_access_token, get_key_ring, supabase_issuer
+from auth_service.dependencies.auth import get_current_user, token_cache
+from auth_service.schemas.user import UserResponse
+from auth_service.services.user import UserService
+from benchmarks.harness import Runner, compare_to_baseline, save_baseline
+
+USER_ID = str(uuid.UUID(int=1))
+
+# Keep log records being created (that's part of the cost) but don't print them
+logging.getLogger().addHandler(logging.NullHandler())
+
+def _claims(**extra):
+    claims = {"sub": USER_ID, "exp": int(time.time()) + 3600, "email": "bench@example.com"}
+    claims.update(extra)
+    return claims
+
+def _rsa_token():
+    """Register an RS256 key the way the JWKS source does and sign a token with it"""
+    try:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+    except ImportError:
+        return None
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+    get_key_ring().add_key(public_pem, "RS256", kid="bench-rsa", issuer="https://idp.example.com", primary=False)
+    return jwt.encode(
+        _claims(iss="https://idp.example.com"),
+        private_pem,
+        algorithm="RS256",
+        headers={"kid": "bench-rsa"},
+    )
+
+def _tokens():
+    """One token per KeyRing routing path"""
+    tokens = {
+        "own_kid": create_access_token(USER_ID),
+        "retired_kid": jwt.encode(
+            _claims(iss=settings.JWT_ISSUER),
+            "bench-retired-secret",
+            algorithm=settings.JWT_ALGORITHM,
+            headers={"kid": "bench-retired"},
+        ),
+        "supabase_iss": jwt.encode(
+            _claims(iss=supabase_issuer(), role="authenticated"),
+            settings.SUPABASE_JWT_SECRET,
+            algorithm=settings.JWT_ALGORITHM,
+        ),
+        "default_key": jwt.encode(
+            _claims(),
+            settings.JWT_SECRET_KEY,
+            algorithm=settings.JWT_ALGORITHM,
+        ),
+    }
+    rsa_token = _rsa_token()
+    if rsa_token is not None:
+        tokens["jwks_rs256"] = rsa_token
+    return tokens
+
+def bench_get_current_user(runner: Runner) -> None:
+    tokens = _tokens()
+
+    # Verification paths, with the token cache out of the way
+    max_size = token_cache.max_size
+    token_cache.max_size = 0
+    try:
+        for path, token in tokens.items():
+            runner.bench_async(f"get_current_user[{path}]", lambda token=token: get_current_user(token))
+
+        bad = tokens["own_kid"][:-4] + "AAAA"
+
+        async def invalid_signature():
+            try:
+                await get_current_user(bad)
+            except HTTPException:
+                pass
+
+        runner.bench_async("get_current_user[invalid_signature]", invalid_signature)
+    finally:
+        token_cache.max_size = max_size
+
+    token_cache.clear()
+    runner.bench_async("get_current_user[cache_hit]", lambda: get_current_user(tokens["own_kid"]))
+    runner.bench_async(
+        "get_current_user[cache_hit_bearer_prefix]",
+        lambda: get_current_user("Bearer " + tokens["own_kid"]),
+    )
+
+    # The revocation prefilter with a realistic number of revoked tokens
+    revocations = _revocation_list(10000)
+    default_revocations = revocation.get_revocation_list()
+    revocation._revocation_list = revocations
+    try:
+        runner.bench_async("get_current_user[cache_hit_10k_revoked]", lambda: get_current_user(tokens["own_kid"]))
+    finally:
+        revocation._revocation_list = default_revocations
+    not_revoked = uuid.uuid4().hex
+    runner.bench("RevocationList.is_revoked[10k_revoked]", lambda: revocations.is_revoked(not_revoked))
+
+def _revocation_list(size: int) -> RevocationList:
+    """A revocation list holding ``size`` unexpired entries, loaded from a snapshot"""
+    exp = int(time.time()) + 3600
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "revoked.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "revoked": {uuid.uuid4().hex: exp for _ in range(size)}}, f)
+        revocations = RevocationList(settings.REVOCATION_BLOOM_CAPACITY, settings.REVOCATION_BLOOM_ERROR_RATE)
+        revocations.restore(path)
+    return revocations
+
+def bench_create_access_token(runner: Runner) -> None:
+    runner.bench("create_access_token", lambda: create_access_token(USER_ID))
+
+def bench_extract_email(runner: Runner) -> None:
+    service = UserService()
+    direct = jwt.encode(_claims(), "x", algorithm="HS256")
+    metadata = jwt.encode(
+        {"sub": USER_ID, "user_metadata": {"email": "bench@example.com", "full_name": "Bench"}},
+        "x",
+        algorithm="HS256",
+    )
+    missing = jwt.encode({"sub": USER_ID}, "x", algorithm="HS256")
+    runner.bench("extract_email_from_token[email_claim]", lambda: service._extract_email_from_token(direct))
+    runner.bench("extract_email_from_token[user_metadata]", lambda: service._extract_email_from_token(metadata))
+    runner.bench("extract_email_from_token[missing]", lambda: service._extract_email_from_token(missing))
+
+def bench_user_response(runner: Runner) -> None:
+    data = {
+        "id": USER_ID,
+        "email": "bench@example.com",
+        "first_name": "Bench",
+        "last_name": "Mark",
+        "phone_number": "+15555550100",
+        "avatar_url": "https://example.com/avatar.png",
+        "role": "user",
+        "is_verified": True,
+        "created_at": "2024-01-01T00:00:00+00:00",
+        "updated_at": "2024-01-02T00:00:00+00:00",
+        "last_login": None,
+    }
+    user = UserResponse.model_validate(data)
+    runner.bench("UserResponse.model_validate", lambda: UserResponse.model_validate(data))
+    runner.bench("UserResponse.model_dump(json)", lambda: user.model_dump(mode="json"))
+    runner.bench("UserResponse.model_dump_json", user.model_dump_json)
+
+    # What FastAPI does with a returned dict versus the FAST_RESPONSES path
+    runner.bench(
+        "UserResponse[response_model_roundtrip]",
+        lambda: json.dumps(jsonable_encoder(UserResponse.model_validate(data))).encode(),
+    )
+    runner.bench(
+        "UserResponse[fast_response]",
+        lambda: user_response_adapter.dump_json(user_response_adapter.validate_python(data)),
+    )
+
+def bench_exception_handlers(runner: Runner) -> None:
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""})
+    auth_error = AuthException(status_code=401, detail="Invalid credentials", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        UserResponse.model_validate({"id": "not-a-uuid", "email": "bench@example.com"})
+    except ValidationError as e:
+        validation_error = RequestValidationError(e.errors())
+    unexpected = RuntimeError("boom")
+
+    runner.bench_async("auth_exception_handler", lambda: auth_exception_handler(request, auth_error))
+    runner.bench_async("validation_exception_handler", lambda: validation_exception_handler(request, validation_error))
+    runner.bench_async("general_exception_handler", lambda: general_exception_handler(request, unexpected))
+
+BENCHMARKS = (
+    bench_get_current_user,
+    bench_create_access_token,
+    bench_extract_email,
+    bench_user_response,
+    bench_exception_handlers,
+)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="only", action="append", help="only run benchmarks whose name contains this")
+    parser.add_argument("--time", type=float, default=0.2, help="seconds per timing round")
+    parser.add_argument("--rounds", type=int, default=5, help="timing rounds per benchmark (best is reported)")
+    parser.add_argument("--save", metavar="PATH", help="write results as a baseline JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    runner = Runner(target_time=args.time, rounds=args.rounds, only=args.only)
+    try:
+        for bench in BENCHMARKS:
+            bench(runner)
+    finally:
+        runner.close()
+
+    data = runner.to_json()
+    if args.save:
+        save_baseline(args.save, data)
+        print(f"\nBaseline written to {args.save}")
+    if args.compare:
+        regressions = compare_to_baseline(args.compare, data, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+"""In-memory stand-in for the subset of Redis the auth service uses.
+
+Speaks RESP2 over TCP and supports strings with expiry (``GET``, ``MGET``,
+``SET`` with ``EX``/``PX``/``NX``/``XX``, ``DEL``, ``EXISTS``, ``INCR``,
+``INCRBY``, ``DECR``, ``DECRBY``, ``EXPIRE``, ``PEXPIRE``, ``TTL``,
+``PTTL``), ``MULTI``/``EXEC``/``DISCARD``, ``PUBLISH``/``SUBSCRIBE``/
+``UNSUBSCRIBE``, plus ``PING``, ``AUTH``, ``SELECT``, ``KEYS``, ``DBSIZE``,
+``FLUSHDB`` and ``FLUSHALL``. Commands run one at a time on the event loop,
+so transactions are atomic just like in Redis.
+
+Run it and point one or more service workers at it:
+
+    python -m emulator.redis --port 6379
+    CACHE_BACKEND=tiered CACHE_REDIS_URL=redis://127.0.0.1:6379/0 uvicorn auth_service.main:app --workers 4
+
+``--latency`` takes the same specs as the Supabase emulator (e.g.
+``uniform:1-3``) and delays every command by a sample from it.
+"""
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import argparse
+import asyncio
+import fnmatch
+import time
+from emulator.supabase import parse_latency
+
+class ReplyError(Exception):
+    """Sent to the client as an error reply"""
+
+# Sent for commands that write their own replies (SUBSCRIBE, UNSUBSCRIBE)
+_NO_REPLY = object()
+
+WRONG_TYPE_INTEGER = "ERR value is not an integer or out of range"
+
+def encode_reply(reply: Any) -> bytes:
+    """Encode a reply: str as a status, bytes as a bulk string, lists as arrays"""
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, ReplyError):
+        return b"-%s\r\n" % str(reply).encode()
+    if isinstance(reply, bool):
+        reply = int(reply)
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, str):
+        return b"+%s\r\n" % reply.encode()
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(encode_reply(item) for item in reply)
+    raise TypeError(f"Cannot encode reply {reply!r}")
+
+async def read_command(reader: asyncio.StreamReader) -> List[bytes]:
+    """Read one command, either a RESP array or an inline command"""
+    line = await reader.readuntil(b"\r\n")
+    if not line.startswith(b"*"):
+        return line.split()
+    args = []
+    for _ in range(int(line[1:-2])):
+        header = await reader.readuntil(b"\r\n")
+        size = int(header[1:-2])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+class _Client:
+    __slots__ = ("writer", "db", "authenticated", "transaction", "channels", "closing")
+
+    def __init__(self, writer: asyncio.StreamWriter, authenticated: bool):
+        self.writer = writer
+        self.db = 0
+        self.authenticated = authenticated
+        self.transaction: Optional[List[List[bytes]]] = None
+        self.channels: Set[bytes] = set()
+        self.closing = False
+
+class RedisEmulator:
+    """Keyspaces, subscriptions and command handlers"""
+
+    # The only commands Redis allows on a connection in subscribe mode
+    SUBSCRIBED_COMMANDS = frozenset({"SUBSCRIBE", "UNSUBSCRIBE", "PING", "QUIT"})
+
+    def __init__(self, password: Optional[str] = None, latency: Optional[Callable[[], float]] = None):
+        self.password = password
+        self.latency = latency
+        self.commands_processed = 0
+        self._dbs: Dict[int, Dict[bytes, Tuple[Optional[float], bytes]]] = {}
+        self._channels: Dict[bytes, Set[_Client]] = {}
+
+    async def start(self, host: str = "127.0.0.1", port: int = 6379) -> asyncio.AbstractServer:
+        """Listen for clients; port 0 picks a free port"""
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client = _Client(writer, authenticated=self.password is None)
+        try:
+            while not client.closing:
+                try:
+                    args = await read_command(reader)
+                except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+                    break
+                if not args:
+                    continue
+                if self.latency is not None:
+                    delay = self.latency()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                reply = self.execute(client, args)
+                if reply is not _NO_REPLY:
+                    writer.write(encode_reply(reply))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for channel in client.channels:
+                self._channels.get(channel, set()).discard(client)
+            writer.close()
+
+    def execute(self, client: _Client, args: List[bytes]) -> Any:
+        """Run one command for a client and return its reply"""
+        self.commands_processed += 1
+        name = args[0].decode("utf-8", "replace").upper()
+        if not client.authenticated and name not in ("AUTH", "QUIT"):
+            return ReplyError("NOAUTH Authentication required.")
+        if client.channels and name not in self.SUBSCRIBED_COMMANDS:
+            return ReplyError(f"ERR Can't execute '{name.lower()}': only (UN)SUBSCRIBE / PING / QUIT are allowed in this context")
+        if client.transaction is not None and name not in ("EXEC", "DISCARD", "MULTI"):
+            client.transaction.append(args)
+            return "QUEUED"
+
+        handler = getattr(self, f"_cmd_{name.lower()}", None)
+        if handler is None:
+            return ReplyError(f"ERR unknown command '{name}'")
+        try:
+            return handler(client, args[1:])
+        except ReplyError as e:
+            return e
+        except (IndexError, ValueError):
+            return ReplyError(f"ERR wrong number of arguments or syntax error for '{name.lower()}' command")
+
+    def _keyspace(self, client: _Client) -> Dict[bytes, Tuple[Optional[float], bytes]]:
+        return self._dbs.setdefault(client.db, {})
+
+    def _lookup(self, client: _Client, key: bytes) -> Optional[Tuple[Optional[float], bytes]]:
+        keyspace = self._keyspace(client)
+        entry = keyspace.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+            del keyspace[key]
+            return None
+        return entry
+
+    def _incr(self, client: _Client, key: bytes, amount: int) -> int:
+        entry = self._lookup(client, key)
+        expires_at, value = entry if entry is not None else (None, b"0")
+        try:
+            count = int(value) + amount
+        except ValueError:
+            raise ReplyError(WRONG_TYPE_INTEGER)
+        self._keyspace(client)[key] = (expires_at, str(count).encode())
+        return count
+
+    def _expire(self, client: _Client, key: bytes, seconds: float) -> int:
+        entry = self._lookup(client, key)
+        if entry is None:
+            return 0
+        self._keyspace(client)[key] = (time.monotonic() + seconds, entry[1])
+        return 1
+
+    def _ttl(self, client: _Client, key: bytes) -> float:
+        entry = self._lookup(client, key)
+        if entry is None:
+            return -2
+        if entry[0] is None:
+            return -1
+        return max(0.0, entry[0] - time.monotonic())
+
+    # Connection
+
+    def _cmd_ping(self, client: _Client, args: List[bytes]) -> Any:
+        if client.channels:
+            return [b"pong", args[0] if args else b""]
+        return args[0] if args else "PONG"
+
+    def _cmd_auth(self, client: _Client, args: List[bytes]) -> Any:
+        if self.password is None:
+            raise ReplyError("ERR AUTH called without any password configured for the default user")
+        if args[-1].decode() != self.password:
+            raise ReplyError("WRONGPASS invalid username-password pair or user is disabled.")
+        client.authenticated = True
+        return "OK"
+
+    def _cmd_select(self, client: _Client, args: List[bytes]) -> Any:
+        client.db = int(args[0])
+        return "OK"
+
+    def _cmd_quit(self, client: _Client, args: List[bytes]) -> Any:
+        client.closing = True
+        return "OK"
+
+    # Keys
+
+    def _cmd_get(self, client: _Client, args: List[bytes]) -> Any:
+        entry = self._lookup(client, args[0])
+        return entry[1] if entry is not None else None
+
+    def _cmd_mget(self, client: _Client, args: List[bytes]) -> Any:
+        if not args:
+            raise IndexError
+        return [self._cmd_get(client, [key]) for key in args]
+
+    def _cmd_set(self, client: _Client, args: List[bytes]) -> Any:
+        key, value = args[0], args[1]
+        expires_at = None
+        condition = None
+        options = iter(option.upper() for option in args[2:])
+        for option in options:
+            if option == b"EX":
+                expires_at = time.monotonic() + int(next(options))
+            elif option == b"PX":
+                expires_at = time.monotonic() + int(next(options)) / 1000
+            elif option in (b"NX", b"XX"):
+                condition = option
+            else:
+                raise ReplyError("ERR syntax error")
+
+        exists = self._lookup(client, key) is not None
+        if (condition == b"NX" and exists) or (condition == b"XX" and not exists):
+            return None
+        self._keyspace(client)[key] = (expires_at, value)
+        return "OK"
+
+    def _cmd_del(self, client: _Client, args: List[bytes]) -> Any:
+        if not args:
+            raise IndexError
+        keyspace = self._keyspace(client)
+        removed = 0
+        for key in args:
+            if self._lookup(client, key) is not None:
+                del keyspace[key]
+                removed += 1
+        return removed
+
+    def _cmd_exists(self, client: _Client, args: List[bytes]) -> Any:
+        if not args:
+            raise IndexError
+        return sum(1 for key in args if self._lookup(client, key) is not None)
+
+    def _cmd_keys(self, client: _Client, args: List[bytes]) -> Any:
+        pattern = args[0].decode("utf-8", "replace")
+        return [
+            key for key in list(self._keyspace(client))
+            if self._lookup(client, key) is not None and fnmatch.fnmatchcase(key.decode("utf-8", "replace"), pattern)
+        ]
+
+    def _cmd_incr(self, client: _Client, args: List[bytes]) -> Any:
+        return self._incr(client, args[0], 1)
+
+    def _cmd_incrby(self, client: _Client, args: List[bytes]) -> Any:
+        return self._incr(client, args[0], int(args[1]))
+
+    def _cmd_decr(self, client: _Client, args: List[bytes]) -> Any:
+        return self._incr(client, args[0], -1)
+
+    def _cmd_decrby(self, client: _Client, args: List[bytes]) -> Any:
+        return self._incr(client, args[0], -int(args[1]))
+
+    def _cmd_expire(self, client: _Client, args: List[bytes]) -> Any:
+        return self._expire(client, args[0], int(args[1]))
+
+    def _cmd_pexpire(self, client: _Client, args: List[bytes]) -> Any:
+        return self._expire(client, args[0], int(args[1]) / 1000)
+
+    def _cmd_ttl(self, client: _Client, args: List[bytes]) -> Any:
+        ttl = self._ttl(client, args[0])
+        return ttl if ttl < 0 else round(ttl)
+
+    def _cmd_pttl(self, client: _Client, args: List[bytes]) -> Any:
+        ttl = self._ttl(client, args[0])
+        return ttl if ttl < 0 else round(ttl * 1000)
+
+    def _cmd_dbsize(self, client: _Client, args: List[bytes]) -> Any:
+        keyspace = self._keyspace(client)
+        return sum(1 for key in list(keyspace) if self._lookup(client, key) is not None)
+
+    def _cmd_flushdb(self, client: _Client, args: List[bytes]) -> Any:
+        self._keyspace(client).clear()
+        return "OK"
+
+    def _cmd_flushall(self, client: _Client, args: List[bytes]) -> Any:
+        self._dbs.clear()
+        return "OK"
+
+    # Transactions
+
+    def _cmd_multi(self, client: _Client, args: List[bytes]) -> Any:
+        if client.transaction is not None:
+            raise ReplyError("ERR MULTI calls can not be nested")
+        client.transaction = []
+        return "OK"
+
+    def _cmd_exec(self, client: _Client, args: List[bytes]) -> Any:
+        if client.transaction is None:
+            raise ReplyError("ERR EXEC without MULTI")
+        queued, client.transaction = client.transaction, None
+        return [self.execute(client, command) for command in queued]
+
+    def _cmd_discard(self, client: _Client, args: List[bytes]) -> Any:
+        if client.transaction is None:
+            raise ReplyError("ERR DISCARD without MULTI")
+        client.transaction = None
+        return "OK"
+
+    # Pub/sub
+
+    def _cmd_publish(self, client: _Client, args: List[bytes]) -> Any:
+        channel, message = args[0], args[1]
+        subscribers = self._channels.get(channel, set())
+        payload = encode_reply([b"message", channel, message])
+        for subscriber in subscribers:
+            subscriber.writer.write(payload)
+        return len(subscribers)
+
+    def _cmd_subscribe(self, client: _Client, args: List[bytes]) -> Any:
+        if not args:
+            raise IndexError
+        for channel in args:
+            client.channels.add(channel)
+            self._channels.setdefault(channel, set()).add(client)
+            client.writer.write(encode_reply([b"subscribe", channel, len(client.channels)]))
+        return _NO_REPLY
+
+    def _cmd_unsubscribe(self, client: _Client, args: List[bytes]) -> Any:
+        channels = args or sorted(client.channels)
+        if not channels:
+            client.writer.write(encode_reply([b"unsubscribe", None, 0]))
+        for channel in channels:
+            client.channels.discard(channel)
+            self._channels.get(channel, set()).discard(client)
+            client.writer.write(encode_reply([b"unsubscribe", channel, len(client.channels)]))
+        return _NO_REPLY
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Redis stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password", help="require AUTH with this password")
+    parser.add_argument("--latency", help="per-command latency spec in milliseconds, e.g. uniform:1-3")
+    args = parser.parse_args()
+
+    async def main():
+        emulator = RedisEmulator(args.password, parse_latency(args.latency) if args.latency else None)
+        server = await emulator.start(args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,549 @@
+"""In-memory stand-in for the Supabase APIs the auth service calls.
+
+Emulates GoTrue (``signup``, ``token``, ``user``, ``otp``, ``verify``,
+``recover``, ``logout``) and PostgREST for ``rest/v1/user_profiles`` with
+enough fidelity to run the service end to end offline and under load.
+Auth routes are served only under ``/auth/v1``, as Supabase does. No email
+is sent: the token hash a recovery email would link to is kept in
+``recovery_tokens``.
+
+Run it and point the service at it:
+
+    python -m emulator.supabase --port 54321
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_JWT_SECRET=<EMULATOR_JWT_SECRET> uvicorn auth_service.main:app
+
+Fault injection is configured through EMULATOR_* environment variables:
+
+    EMULATOR_LATENCY="lognormal:20,0.5"             # default for every route
+    EMULATOR_LATENCY_ROUTES="otp=uniform:150-400"   # per route class (auth, otp, rest), ";"-separated
+    EMULATOR_ERROR_RATE=0.01                        # fraction of requests answered with EMULATOR_ERROR_STATUS
+    EMULATOR_RATE_LIMITS="otp=30/60;auth=1000/1"    # requests/seconds per route class and client
+
+Latency specs are in milliseconds: ``fixed:20``, ``uniform:10-50``,
+``normal:30,10`` (mean, stdev) or ``lognormal:20,0.5`` (median, sigma).
+"""
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import secrets
+import time
+import uuid
+from jose import jwt
+from pydantic_settings import BaseSettings
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+class EmulatorSettings(BaseSettings):
+    # Must match the service's SUPABASE_JWT_SECRET
+    EMULATOR_JWT_SECRET: str = "super-secret-jwt-token-with-at-least-32-characters-long"
+    # Defaults to f"{base_url}/auth/v1" like Supabase
+    EMULATOR_ISSUER: Optional[str] = None
+    EMULATOR_ACCESS_TOKEN_TTL_SECONDS: int = 3600
+    # Every OTP, magic link and recovery token is this code
+    EMULATOR_OTP_CODE: str = "123456"
+
+    EMULATOR_LATENCY: str = "fixed:0"
+    EMULATOR_LATENCY_ROUTES: str = ""
+    EMULATOR_ERROR_RATE: float = 0.0
+    EMULATOR_ERROR_STATUS: int = 503
+    EMULATOR_RATE_LIMITS: str = ""
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Parse a latency spec into a sampler returning seconds"""
+    kind, _, args = spec.strip().partition(":")
+    kind = kind.strip().lower()
+    if kind in ("", "none", "fixed"):
+        value = float(args or 0) / 1000
+        return lambda: value
+    if kind == "uniform":
+        low, _, high = args.partition("-")
+        low_s, high_s = float(low) / 1000, float(high) / 1000
+        return lambda: random.uniform(low_s, high_s)
+    if kind == "normal":
+        mean, _, stdev = args.partition(",")
+        mean_s, stdev_s = float(mean) / 1000, float(stdev) / 1000
+        return lambda: max(0.0, random.gauss(mean_s, stdev_s))
+    if kind == "lognormal":
+        median, _, sigma = args.partition(",")
+        mu, sigma_f = math.log(float(median) / 1000), float(sigma)
+        return lambda: random.lognormvariate(mu, sigma_f)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+def route_class(path: str) -> str:
+    """Classify a request path as 'auth', 'otp' or 'rest' (as the service does)"""
+    path = path.strip("/")
+    if path.startswith("rest/"):
+        return "rest"
+    if path.rsplit("/", 1)[-1] in ("otp", "verify", "recover"):
+        return "otp"
+    return "auth"
+
+def _parse_route_specs(value: str) -> Dict[str, str]:
+    specs = {}
+    for item in value.split(";"):
+        name, _, spec = item.partition("=")
+        if name.strip() and spec.strip():
+            specs[name.strip()] = spec.strip()
+    return specs
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _gotrue_error(status_code: int, error_code: str, message: str) -> JSONResponse:
+    return JSONResponse({"code": status_code, "error_code": error_code, "msg": message}, status_code=status_code)
+
+def _grant_error(description: str) -> JSONResponse:
+    return JSONResponse({"error": "invalid_grant", "error_description": description}, status_code=400)
+
+def _postgrest_error(status_code: int, message: str, code: str = "PGRST100") -> JSONResponse:
+    return JSONResponse({"code": code, "details": None, "hint": None, "message": message}, status_code=status_code)
+
+class FixedWindowLimiter:
+    """Per-client fixed-window counters, like GoTrue's per-IP limits"""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self._counts: Dict[Tuple[str, int], int] = {}
+
+    def allow(self, client: str) -> Tuple[bool, int]:
+        index = int(time.time() // self.window)
+        key = (client, index)
+        count = self._counts.get(key, 0) + 1
+        self._counts[key] = count
+        if len(self._counts) > 100_000:
+            self._counts = {k: v for k, v in self._counts.items() if k[1] == index}
+        retry_after = max(1, math.ceil((index + 1) * self.window - time.time()))
+        return count <= self.limit, retry_after
+
+class SupabaseEmulator:
+    """GoTrue + PostgREST emulator state and routes"""
+
+    PROFILE_TABLE = "user_profiles"
+
+    def __init__(self, settings: Optional[EmulatorSettings] = None):
+        self.settings = settings or EmulatorSettings()
+        self.users: Dict[str, Dict[str, Any]] = {}
+        self.users_by_email: Dict[str, str] = {}
+        self.users_by_phone: Dict[str, str] = {}
+        self.passwords: Dict[str, str] = {}
+        self.refresh_tokens: Dict[str, str] = {}
+        # Recovery email token hash -> user id
+        self.recovery_tokens: Dict[str, str] = {}
+        self.sessions: Dict[str, set] = {}
+        self.profiles: Dict[str, Dict[str, Any]] = {}
+
+        self._latency = parse_latency(self.settings.EMULATOR_LATENCY)
+        self._route_latency = {
+            name: parse_latency(spec)
+            for name, spec in _parse_route_specs(self.settings.EMULATOR_LATENCY_ROUTES).items()
+        }
+        self._limiters = {}
+        for name, spec in _parse_route_specs(self.settings.EMULATOR_RATE_LIMITS).items():
+            limit, _, window = spec.partition("/")
+            self._limiters[name] = FixedWindowLimiter(int(limit), float(window or 1))
+
+    # Fault injection
+
+    async def _inject(self, request: Request) -> Optional[Response]:
+        cls = route_class(request.url.path)
+        limiter = self._limiters.get(cls)
+        if limiter is not None:
+            client = request.client.host if request.client else "unknown"
+            allowed, retry_after = limiter.allow(client)
+            if not allowed:
+                response = _gotrue_error(429, "over_request_rate_limit", "Request rate limit reached")
+                response.headers["Retry-After"] = str(retry_after)
+                return response
+
+        delay = self._route_latency.get(cls, self._latency)()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.settings.EMULATOR_ERROR_RATE and random.random() < self.settings.EMULATOR_ERROR_RATE:
+            status_code = self.settings.EMULATOR_ERROR_STATUS
+            return JSONResponse({"code": status_code, "msg": "Injected failure"}, status_code=status_code)
+        return None
+
+    def _wrap(self, handler):
+        async def endpoint(request: Request) -> Response:
+            if not request.headers.get("apikey"):
+                return _gotrue_error(401, "no_api_key", "No API key found in request")
+            injected = await self._inject(request)
+            if injected is not None:
+                return injected
+            return await handler(request)
+        return endpoint
+
+    # Users and sessions
+
+    def _issuer(self, request: Request) -> str:
+        return self.settings.EMULATOR_ISSUER or f"{str(request.base_url).rstrip('/')}/auth/v1"
+
+    def _create_user(self, email: Optional[str] = None, phone: Optional[str] = None,
+                     password: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None,
+                     provider: str = "email") -> Dict[str, Any]:
+        now = _now_iso()
+        user = {
+            "id": str(uuid.uuid4()),
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": email or "",
+            "phone": phone or "",
+            "email_confirmed_at": now if email else None,
+            "phone_confirmed_at": now if phone else None,
+            "app_metadata": {"provider": provider, "providers": [provider]},
+            "user_metadata": metadata or {},
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.users[user["id"]] = user
+        if email:
+            self.users_by_email[email.lower()] = user["id"]
+        if phone:
+            self.users_by_phone[phone] = user["id"]
+        if password is not None:
+            self.passwords[user["id"]] = hashlib.sha256(password.encode()).hexdigest()
+        # Mirror the signup trigger that creates an empty profile row
+        self.profiles[user["id"]] = {
+            "id": user["id"],
+            "first_name": (metadata or {}).get("first_name") or "",
+            "last_name": (metadata or {}).get("last_name") or "",
+            "phone_number": (metadata or {}).get("phone_number") or phone or "",
+            "avatar_url": "",
+            "created_at": now,
+            "updated_at": now,
+        }
+        return user
+
+    def _session(self, request: Request, user: Dict[str, Any]) -> Dict[str, Any]:
+        now = int(time.time())
+        ttl = self.settings.EMULATOR_ACCESS_TOKEN_TTL_SECONDS
+        session_id = str(uuid.uuid4())
+        claims = {
+            "iss": self._issuer(request),
+            "sub": user["id"],
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": user["email"],
+            "phone": user["phone"],
+            "app_metadata": user["app_metadata"],
+            "user_metadata": user["user_metadata"],
+            "session_id": session_id,
+            "iat": now,
+            "exp": now + ttl,
+        }
+        access_token = jwt.encode(claims, self.settings.EMULATOR_JWT_SECRET, algorithm="HS256")
+        refresh_token = secrets.token_urlsafe(16)
+        self.refresh_tokens[refresh_token] = user["id"]
+        self.sessions.setdefault(user["id"], set()).add(session_id)
+        user["last_sign_in_at"] = _now_iso()
+        return {
+            "access_token": access_token,
+            "token_type": "bearer",
+            "expires_in": ttl,
+            "expires_at": now + ttl,
+            "refresh_token": refresh_token,
+            "user": user,
+        }
+
+    def _user_from_bearer(self, request: Request) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        authorization = request.headers.get("authorization", "")
+        if not authorization.lower().startswith("bearer "):
+            return None, None
+        try:
+            claims = jwt.decode(
+                authorization[7:],
+                self.settings.EMULATOR_JWT_SECRET,
+                algorithms=["HS256"],
+                options={"verify_aud": False},
+            )
+        except Exception:
+            return None, None
+        user = self.users.get(claims.get("sub"))
+        if user is None or claims.get("session_id") not in self.sessions.get(user["id"], ()):
+            return None, None
+        return user, claims
+
+    async def _json(self, request: Request) -> Dict[str, Any]:
+        try:
+            body = await request.json()
+        except ValueError:
+            return {}
+        return body if isinstance(body, dict) else {}
+
+    # GoTrue
+
+    async def signup(self, request: Request) -> Response:
+        body = await self._json(request)
+        email, password = body.get("email"), body.get("password")
+        if not email or not password:
+            return _gotrue_error(400, "validation_failed", "Signup requires a valid password")
+        if email.lower() in self.users_by_email:
+            return _gotrue_error(422, "user_already_exists", "User already registered")
+        user = self._create_user(email=email, password=password, metadata=body.get("data") or {})
+        return JSONResponse(self._session(request, user))
+
+    async def token(self, request: Request) -> Response:
+        grant_type = request.query_params.get("grant_type")
+        body = await self._json(request)
+        grant_type = grant_type or body.get("grant_type")
+
+        if grant_type == "password":
+            user_id = self.users_by_email.get((body.get("email") or "").lower())
+            password = body.get("password") or ""
+            if user_id is None or self.passwords.get(user_id) != hashlib.sha256(password.encode()).hexdigest():
+                return _grant_error("Invalid login credentials")
+            return JSONResponse(self._session(request, self.users[user_id]))
+
+        if grant_type == "refresh_token":
+            user_id = self.refresh_tokens.pop(body.get("refresh_token") or "", None)
+            if user_id is None:
+                return _grant_error("Invalid Refresh Token: Refresh Token Not Found")
+            return JSONResponse(self._session(request, self.users[user_id]))
+
+        if grant_type in ("id_token", "authorization_code"):
+            # Any ID token or code is accepted; the email comes from the token when it has one
+            credential = body.get("id_token") or body.get("code") or ""
+            if not credential:
+                return _grant_error("Missing id_token or code")
+            try:
+                email = jwt.get_unverified_claims(credential).get("email")
+            except Exception:
+                email = None
+            email = email or f"google-{hashlib.sha256(credential.encode()).hexdigest()[:12]}@example.com"
+            user_id = self.users_by_email.get(email.lower())
+            user = self.users[user_id] if user_id else self._create_user(email=email, provider="google")
+            return JSONResponse(self._session(request, user))
+
+        return _gotrue_error(400, "validation_failed", f"Unsupported grant type: {grant_type}")
+
+    async def get_user(self, request: Request) -> Response:
+        user, _ = self._user_from_bearer(request)
+        if user is None:
+            return _gotrue_error(401, "bad_jwt", "invalid JWT: unable to parse or verify signature")
+        if request.method == "PUT":
+            body = await self._json(request)
+            if body.get("password"):
+                self.passwords[user["id"]] = hashlib.sha256(body["password"].encode()).hexdigest()
+            if isinstance(body.get("data"), dict):
+                user["user_metadata"].update(body["data"])
+            user["updated_at"] = _now_iso()
+        return JSONResponse(user)
+
+    async def otp(self, request: Request) -> Response:
+        body = await self._json(request)
+        if not body.get("email") and not body.get("phone"):
+            return _gotrue_error(400, "validation_failed", "You must provide either an email or phone number")
+        return JSONResponse({})
+
+    async def verify(self, request: Request) -> Response:
+        body = await self._json(request)
+        if body.get("token_hash"):
+            user_id = self.recovery_tokens.pop(body["token_hash"], None) if body.get("type") == "recovery" else None
+            if user_id is None:
+                return _gotrue_error(403, "otp_expired", "Email link is invalid or has expired")
+            return JSONResponse(self._session(request, self.users[user_id]))
+        if body.get("token") != self.settings.EMULATOR_OTP_CODE:
+            return _gotrue_error(403, "otp_expired", "Token has expired or is invalid")
+        phone, email = body.get("phone"), body.get("email")
+        if phone:
+            user_id = self.users_by_phone.get(phone)
+            user = self.users[user_id] if user_id else self._create_user(phone=phone, provider="phone")
+        elif email:
+            user_id = self.users_by_email.get(email.lower())
+            user = self.users[user_id] if user_id else self._create_user(email=email)
+        else:
+            return _gotrue_error(400, "validation_failed", "Verify requires a phone or email")
+        return JSONResponse(self._session(request, user))
+
+    async def recover(self, request: Request) -> Response:
+        body = await self._json(request)
+        if not body.get("email"):
+            return _gotrue_error(400, "validation_failed", "Password recovery requires an email")
+        # Unknown addresses get the same answer, so accounts can't be enumerated
+        user_id = self.users_by_email.get(body["email"].lower())
+        if user_id is not None:
+            self.recovery_tokens[secrets.token_hex(28)] = user_id
+        return JSONResponse({})
+
+    async def logout(self, request: Request) -> Response:
+        user, claims = self._user_from_bearer(request)
+        if user is None:
+            return _gotrue_error(401, "no_authorization", "This endpoint requires a Bearer token")
+        self.sessions.get(user["id"], set()).discard(claims.get("session_id"))
+        return Response(status_code=204)
+
+    # PostgREST
+
+    @staticmethod
+    def _matches(row: Dict[str, Any], column: str, expression: str) -> bool:
+        op, _, operand = expression.partition(".")
+        value = row.get(column)
+        if op == "in":
+            return str(value) in {item.strip().strip('"') for item in operand.strip("()").split(",")}
+        if op == "is":
+            return value is None if operand == "null" else str(value).lower() == operand
+        if value is None:
+            return False
+        value = str(value)
+        if op == "eq":
+            return value == operand
+        if op == "neq":
+            return value != operand
+        if op == "gt":
+            return value > operand
+        if op == "gte":
+            return value >= operand
+        if op == "lt":
+            return value < operand
+        if op == "lte":
+            return value <= operand
+        raise ValueError(f"Unsupported operator: {op}")
+
+    def _filter_rows(self, request: Request) -> List[Dict[str, Any]]:
+        filters = [
+            (column, expression)
+            for column, expression in request.query_params.multi_items()
+            if column not in ("select", "order", "limit", "offset", "on_conflict")
+        ]
+        return [
+            row for row in self.profiles.values()
+            if all(self._matches(row, column, expression) for column, expression in filters)
+        ]
+
+    @staticmethod
+    def _prefer(request: Request) -> Dict[str, str]:
+        prefs = {}
+        for item in request.headers.get("prefer", "").split(","):
+            key, _, value = item.strip().partition("=")
+            if key:
+                prefs[key] = value
+        return prefs
+
+    def _select(self, request: Request, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        columns = request.query_params.get("select", "*")
+        if columns.strip() == "*":
+            return [dict(row) for row in rows]
+        names = [column.strip() for column in columns.split(",")]
+        return [{name: row.get(name) for name in names} for row in rows]
+
+    async def profiles_endpoint(self, request: Request) -> Response:
+        if request.path_params["table"] != self.PROFILE_TABLE:
+            return _postgrest_error(404, f'relation "public.{request.path_params["table"]}" does not exist', "42P01")
+        try:
+            if request.method == "GET":
+                return self._get_profiles(request)
+            if request.method == "POST":
+                return await self._upsert_profiles(request)
+            if request.method == "PATCH":
+                return await self._patch_profiles(request)
+            return self._delete_profiles(request)
+        except ValueError as e:
+            return _postgrest_error(400, str(e))
+
+    def _get_profiles(self, request: Request) -> Response:
+        rows = self._filter_rows(request)
+        order = request.query_params.get("order")
+        if order:
+            column, _, direction = order.partition(".")
+            rows.sort(key=lambda row: str(row.get(column) or ""), reverse=direction.startswith("desc"))
+        offset = int(request.query_params.get("offset", 0))
+        limit = request.query_params.get("limit")
+        rows = rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+        return JSONResponse(self._select(request, rows))
+
+    async def _upsert_profiles(self, request: Request) -> Response:
+        body = await request.json()
+        rows = body if isinstance(body, list) else [body]
+        prefer = self._prefer(request)
+        upsert = "on_conflict" in request.query_params or "resolution" in prefer
+        stored = []
+        for row in rows:
+            row_id = str(row.get("id") or uuid.uuid4())
+            existing = self.profiles.get(row_id)
+            if existing is not None:
+                if not upsert:
+                    return _postgrest_error(409, "duplicate key value violates unique constraint", "23505")
+                if prefer.get("resolution") == "ignore-duplicates":
+                    continue
+                existing.update(row)
+                stored.append(existing)
+            else:
+                new_row = dict(row, id=row_id)
+                self.profiles[row_id] = new_row
+                stored.append(new_row)
+        if prefer.get("return") == "representation":
+            return JSONResponse(self._select(request, stored), status_code=201)
+        return Response(status_code=201)
+
+    async def _patch_profiles(self, request: Request) -> Response:
+        body = await request.json()
+        rows = self._filter_rows(request)
+        for row in rows:
+            row.update(body)
+        if self._prefer(request).get("return") == "representation":
+            return JSONResponse(self._select(request, rows))
+        return Response(status_code=204)
+
+    def _delete_profiles(self, request: Request) -> Response:
+        rows = self._filter_rows(request)
+        for row in rows:
+            self.profiles.pop(row["id"], None)
+        if self._prefer(request).get("return") == "representation":
+            return JSONResponse(self._select(request, rows))
+        return Response(status_code=204)
+
+    async def health(self, request: Request) -> Response:
+        return JSONResponse({
+            "users": len(self.users),
+            "profiles": len(self.profiles),
+        })
+
+    def routes(self) -> List[Route]:
+        auth_routes = [
+            ("signup", self.signup, ["POST"]),
+            ("token", self.token, ["POST"]),
+            ("user", self.get_user, ["GET", "PUT"]),
+            ("otp", self.otp, ["POST"]),
+            ("verify", self.verify, ["POST"]),
+            ("recover", self.recover, ["POST"]),
+            ("logout", self.logout, ["POST"]),
+        ]
+        routes = [Route("/_emulator/health", self.health, methods=["GET"])]
+        for path, handler, methods in auth_routes:
+            routes.append(Route(f"/auth/v1/{path}", self._wrap(handler), methods=methods))
+        routes.append(Route(
+            "/rest/v1/{table}",
+            self._wrap(self.profiles_endpoint),
+            methods=["GET", "POST", "PATCH", "DELETE"],
+        ))
+        return routes
+
+def create_app(settings: Optional[EmulatorSettings] = None) -> Starlette:
+    """Build the emulator ASGI app; its state lives on ``app.state.emulator``"""
+    emulator = SupabaseEmulator(settings)
+    app = Starlette(routes=emulator.routes())
+    app.state.emulator = emulator
+    return app
+
+app = create_app()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the Supabase emulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,79 @@
+"""Shared fixtures: the service wired to the in-repo Supabase emulator.
+
+Module-level singletons (limiters, caches, the upstream client) outlive a
+single test, so every test runs on one session-wide event loop, as they
+would in one worker process.
+"""
+import asyncio
+import os
+
+# Settings are read at import time
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+os.environ.setdefault("SUPABASE_KEY", "test-anon-key")
+# The emulator's default signing secret
+os.environ.setdefault("SUPABASE_JWT_SECRET", "super-secret-jwt-token-with-at-least-32-characters-long")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key")
+os.environ.setdefault("INTERNAL_API_KEY", "test-internal-key")
+os.environ.setdefault("LOG_JSON", "false")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("PASSWORD_BCRYPT_ROUNDS", "4")
+os.environ.setdefault("PASSWORD_HASH_EXECUTOR", "thread")
+# Tests spread requests over client addresses as a proxy would report them
+os.environ.setdefault("RATE_LIMIT_TRUST_FORWARDED_FOR", "true")
+
+import httpx
+import pytest
+
+from auth_service.core import http
+from emulator.redis import RedisEmulator
+from emulator.supabase import EmulatorSettings, create_app
+
+@pytest.fixture(scope="session")
+def session_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+@pytest.fixture
+def run(session_loop):
+    """Run a coroutine to completion on the session loop"""
+    return session_loop.run_until_complete
+
+@pytest.fixture
+def supabase(run):
+    """A fresh Supabase emulator behind the service's upstream client"""
+    emulator_app = create_app()
+    http._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=emulator_app))
+    yield emulator_app.state.emulator
+    run(http.close_http_client())
+
+@pytest.fixture
+def emulate(run):
+    """Put a Supabase emulator with the given fault settings behind the upstream client"""
+    def start(**settings):
+        emulator_app = create_app(EmulatorSettings(**settings))
+        http._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=emulator_app))
+        return emulator_app.state.emulator
+
+    yield start
+    run(http.close_http_client())
+
+@pytest.fixture
+def redis_url(run):
+    """URL of a fresh Redis emulator listening on a free port"""
+    server = run(RedisEmulator().start("127.0.0.1", 0))
+    host, port = server.sockets[0].getsockname()[:2]
+    yield f"redis://{host}:{port}/0"
+    server.close()
+    run(server.wait_closed())
+
+@pytest.fixture
+def client(supabase):
+    """An HTTP client for the service app"""
+    from auth_service.main import app
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver")
+
+@pytest.fixture
+def internal_headers():
+    return {"X-Internal-API-Key": os.environ["INTERNAL_API_KEY"]}
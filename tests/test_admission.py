@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from auth_service.core import admission, http, resilience
+from auth_service.core.admission import AdaptiveConcurrencyLimiter
+from auth_service.core.config import settings
+from auth_service.core.exceptions import UpstreamUnavailableException
+
+PROFILES = "rest/v1/user_profiles"
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    # Limiters and breakers are per process; start each test from scratch
+    monkeypatch.setattr(admission, "_limiters", {})
+    monkeypatch.setattr(resilience, "_breakers", {})
+
+def _fetch(endpoint=PROFILES):
+    url = f"{settings.SUPABASE_URL}/{endpoint}"
+    return http.send_upstream("GET", url, endpoint, headers={"apikey": settings.SUPABASE_KEY})
+
+def test_queue_timeout_sheds_the_caller(run):
+    limiter = AdaptiveConcurrencyLimiter("test", initial_limit=1, min_limit=1, queue_timeout=0.02)
+
+    async def scenario():
+        await limiter.acquire()
+        with pytest.raises(UpstreamUnavailableException):
+            await limiter.acquire()
+
+    run(scenario())
+    assert limiter.in_flight == 1
+    assert limiter.queued == 0
+    assert limiter.shed == 1
+
+def test_full_queue_sheds_without_waiting(run):
+    limiter = AdaptiveConcurrencyLimiter("test", initial_limit=1, min_limit=1, max_queue=1, queue_timeout=1)
+
+    async def scenario():
+        await limiter.acquire()
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamUnavailableException):
+            await limiter.acquire()
+        limiter.release()
+        await waiting
+
+    run(scenario())
+    assert limiter.in_flight == 1
+    assert limiter.shed == 1
+
+def test_slot_granted_to_a_cancelled_caller_is_handed_on(run):
+    limiter = AdaptiveConcurrencyLimiter("test", initial_limit=1, min_limit=1, queue_timeout=1)
+
+    async def scenario():
+        await limiter.acquire()
+        first = asyncio.ensure_future(limiter.acquire())
+        second = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+
+        # The slot goes to the first waiter, which is cancelled before it runs
+        limiter.release()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.wait_for(second, 0.5)
+
+    run(scenario())
+    assert limiter.in_flight == 1
+    assert limiter.queued == 0
+
+def test_slow_upstream_sheds_callers_over_the_limit(run, emulate, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_INITIAL_LIMIT", 1)
+    monkeypatch.setattr(settings, "ADMISSION_MIN_LIMIT", 1)
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_TIMEOUT_SECONDS", 0.02)
+    emulate(EMULATOR_LATENCY="fixed:100")
+
+    async def scenario():
+        return await asyncio.gather(_fetch(), _fetch(), return_exceptions=True)
+
+    first, second = run(scenario())
+    assert first.status_code == 200
+    assert isinstance(second, UpstreamUnavailableException)
+    # Shedding says nothing about the upstream's health
+    assert resilience.get_circuit_breaker(PROFILES).state == resilience.CircuitBreaker.CLOSED
+    limiter = admission.get_admission_limiter("rest")
+    assert limiter.in_flight == 0
+    assert limiter.shed == 1
+
+def test_limit_backs_off_on_upstream_errors(run, emulate):
+    # 500 isn't retried, so each call is one sample
+    emulate(EMULATOR_ERROR_RATE=1.0, EMULATOR_ERROR_STATUS=500)
+
+    async def scenario():
+        for _ in range(3):
+            response = await _fetch()
+            assert response.status_code == 500
+
+    run(scenario())
+    limiter = admission.get_admission_limiter("rest")
+    assert limiter.limit == pytest.approx(settings.ADMISSION_INITIAL_LIMIT * limiter.backoff ** 3)
+    assert limiter.in_flight == 0
+
+def test_limit_never_drops_below_the_minimum():
+    limiter = AdaptiveConcurrencyLimiter("test", initial_limit=4, min_limit=2)
+    for _ in range(20):
+        limiter.in_flight += 1
+        limiter.release(dropped=True)
+    assert limiter.limit == 2
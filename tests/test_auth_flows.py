@@ -0,0 +1,131 @@
+import uuid
+
+def _signup_body(email, password="Passw0rd!"):
+    return {"email": email, "password": password, "first_name": "Ada", "last_name": "Lovelace"}
+
+def _login(client, email, password, ip):
+    return client.post(
+        "/api/v1/auth/login",
+        data={"username": email, "password": password},
+        headers={"X-Forwarded-For": ip},
+    )
+
+def test_emulator_serves_auth_only_under_prefix(run, supabase):
+    from auth_service.core.http import get_http_client
+
+    async def call():
+        client = get_http_client()
+        root = await client.post("http://supabase.test/signup", json=_signup_body("root@example.com"), headers={"apikey": "k"})
+        prefixed = await client.post("http://supabase.test/auth/v1/signup", json=_signup_body("root@example.com"), headers={"apikey": "k"})
+        return root.status_code, prefixed.status_code
+
+    assert run(call()) == (404, 200)
+
+def test_signup_then_login(run, client):
+    email = f"{uuid.uuid4().hex}@example.com"
+
+    async def call():
+        async with client:
+            signup = await client.post("/api/v1/auth/signup", json=_signup_body(email))
+            login = await _login(client, email, "Passw0rd!", "198.51.100.1")
+            return signup, login
+
+    signup, login = run(call())
+    assert signup.status_code == 200
+    assert signup.json()["user"]["user"]["email"] == email
+    assert login.status_code == 200
+    assert login.json()["access_token"]
+
+def test_password_reset_flow(run, client, supabase):
+    email = f"{uuid.uuid4().hex}@example.com"
+
+    async def call():
+        async with client:
+            await client.post("/api/v1/auth/signup", json=_signup_body(email))
+            requested = await client.post("/api/v1/auth/reset-password", json={"email": email}, headers={"X-Forwarded-For": "198.51.100.2"})
+            # The token hash the recovery email would link to
+            (token,) = supabase.recovery_tokens
+            confirmed = await client.post("/api/v1/auth/reset-password-confirm", json={"token": token, "password": "N3w-passw0rd"})
+            reused = await client.post("/api/v1/auth/reset-password-confirm", json={"token": token, "password": "Other-passw0rd"})
+            old = await _login(client, email, "Passw0rd!", "198.51.100.2")
+            new = await _login(client, email, "N3w-passw0rd", "198.51.100.2")
+            return requested, confirmed, reused, old, new
+
+    requested, confirmed, reused, old, new = run(call())
+    assert requested.status_code == 200
+    assert confirmed.status_code == 200
+    assert reused.status_code == 400
+    assert old.status_code == 401
+    assert new.status_code == 200
+
+def test_refresh_rotates_and_rejects_reuse(run, client):
+    email = f"{uuid.uuid4().hex}@example.com"
+    headers = {"X-Forwarded-For": "198.51.100.3"}
+
+    async def call():
+        async with client:
+            await client.post("/api/v1/auth/signup", json=_signup_body(email))
+            login = await _login(client, email, "Passw0rd!", "198.51.100.3")
+            token = login.json()["refresh_token"]
+            rotated = await client.post("/api/v1/auth/refresh", json={"refresh_token": token}, headers=headers)
+            reused = await client.post("/api/v1/auth/refresh", json={"refresh_token": token}, headers=headers)
+            after_reuse = await client.post(
+                "/api/v1/auth/refresh",
+                json={"refresh_token": rotated.json()["refresh_token"]},
+                headers=headers,
+            )
+            return rotated, reused, after_reuse
+
+    rotated, reused, after_reuse = run(call())
+    assert rotated.status_code == 200
+    assert reused.status_code == 401
+    assert after_reuse.status_code == 401
+
+def test_logout_revokes_our_tokens(run, client):
+    email = f"{uuid.uuid4().hex}@example.com"
+
+    async def call():
+        async with client:
+            await client.post("/api/v1/auth/signup", json=_signup_body(email))
+            tokens = (await _login(client, email, "Passw0rd!", "198.51.100.4")).json()
+            auth = {"Authorization": f"Bearer {tokens['access_token']}"}
+            logout = await client.post("/api/v1/auth/logout", headers=auth)
+            me = await client.get("/api/v1/users/me", headers=auth)
+            refresh = await client.post(
+                "/api/v1/auth/refresh",
+                json={"refresh_token": tokens["refresh_token"]},
+                headers={"X-Forwarded-For": "198.51.100.4"},
+            )
+            return logout, me, refresh
+
+    logout, me, refresh = run(call())
+    assert logout.status_code == 200
+    assert me.status_code == 401
+    assert refresh.status_code == 401
+
+def test_logout_ends_the_supabase_session(run, client, supabase):
+    email = f"{uuid.uuid4().hex}@example.com"
+
+    async def call():
+        async with client:
+            signup = await client.post("/api/v1/auth/signup", json=_signup_body(email))
+            session = signup.json()["user"]
+            logout = await client.post("/api/v1/auth/logout", headers={"Authorization": f"Bearer {session['access_token']}"})
+            return session["user"]["id"], logout
+
+    user_id, logout = run(call())
+    assert logout.status_code == 200
+    assert not supabase.sessions[user_id]
+
+def test_logout_succeeds_when_upstream_logout_fails(run, client, supabase):
+    email = f"{uuid.uuid4().hex}@example.com"
+
+    async def call():
+        async with client:
+            signup = await client.post("/api/v1/auth/signup", json=_signup_body(email))
+            session = signup.json()["user"]
+            # Supabase no longer knows the session
+            supabase.sessions.clear()
+            return await client.post("/api/v1/auth/logout", headers={"Authorization": f"Bearer {session['access_token']}"})
+
+    assert run(call()).status_code == 200
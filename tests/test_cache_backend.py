@@ -0,0 +1,114 @@
+import asyncio
+
+from auth_service.core.cache_backend import RedisBackend, TieredBackend
+from auth_service.core.config import settings
+
+async def _subscribed(*backends):
+    """Start the backends and wait until their subscriptions are live"""
+    for backend in backends:
+        await backend.start()
+    redis = [getattr(backend, "l2", backend) for backend in backends]
+    for _ in range(200):
+        if all(backend._pubsub_writer is not None for backend in redis):
+            break
+        await asyncio.sleep(0.01)
+    # Let the server read the SUBSCRIBE commands
+    await asyncio.sleep(0.05)
+
+async def _eventually(predicate):
+    for _ in range(200):
+        if predicate():
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+def _worker(redis_url, name):
+    backend = RedisBackend(redis_url)
+    backend.instance_id = name
+    return backend
+
+def test_invalidation_reaches_other_workers_only(run, redis_url):
+    a, b = _worker(redis_url, "worker-a"), _worker(redis_url, "worker-b")
+    seen = {"a": [], "b": []}
+    a.on_invalidate("profile", seen["a"].append)
+    b.on_invalidate("profile", seen["b"].append)
+
+    async def scenario():
+        try:
+            await _subscribed(a, b)
+            await a.invalidate("profile", "user-1", "user-2")
+            return await _eventually(lambda: len(seen["b"]) == 2)
+        finally:
+            await a.close()
+            await b.close()
+
+    assert run(scenario())
+    assert seen["b"] == ["user-1", "user-2"]
+    # A worker already dropped its own copies
+    assert seen["a"] == []
+
+def test_invalidation_is_scoped_to_its_namespace(run, redis_url):
+    a, b = _worker(redis_url, "worker-a"), _worker(redis_url, "worker-b")
+    profiles, revoked = [], []
+    b.on_invalidate("profile", profiles.append)
+    b.on_invalidate("revoked", revoked.append)
+
+    async def scenario():
+        try:
+            await _subscribed(a, b)
+            await a.invalidate("revoked", "jti-1:1900000000")
+            return await _eventually(lambda: revoked)
+        finally:
+            await a.close()
+            await b.close()
+
+    assert run(scenario())
+    assert revoked == ["jti-1:1900000000"]
+    assert profiles == []
+
+def test_tiered_write_drops_other_workers_l1(run, redis_url):
+    a = TieredBackend(RedisBackend(redis_url), l1_ttl=60)
+    b = TieredBackend(RedisBackend(redis_url), l1_ttl=60)
+    a.instance_id, b.instance_id = "worker-a", "worker-b"
+
+    async def scenario():
+        try:
+            await _subscribed(a, b)
+            await a.set("profile:1", b"old")
+            # b now serves its L1 copy for up to a minute
+            assert await b.get("profile:1") == b"old"
+            await a.set("profile:1", b"new")
+            dropped = await _eventually(lambda: b.l1.stats()["size"] == 0)
+            return dropped, await b.get("profile:1"), await a.get("profile:1")
+        finally:
+            await a.close()
+            await b.close()
+
+    assert run(scenario()) == (True, b"new", b"new")
+
+def test_lost_subscription_clears_local_copies(run, redis_url):
+    backend = TieredBackend(RedisBackend(redis_url), l1_ttl=60)
+
+    async def scenario():
+        await backend.l1.set("profile:1", b"cached")
+        # What the listener reports after reconnecting
+        backend.l2._dispatch(settings.CACHE_INVALIDATION_CHANNEL, None)
+        return await backend.l1.get("profile:1")
+
+    assert run(scenario()) is None
+
+def test_pool_waits_for_free_connections(run, redis_url):
+    # Built outside any running loop, like the module-level services
+    backend = RedisBackend(redis_url, pool_size=2)
+    assert backend._slots is None
+
+    async def scenario():
+        try:
+            counts = await asyncio.gather(*(backend.incr("pool", 1) for _ in range(20)))
+            return counts, backend.stats()["connections"]
+        finally:
+            await backend.close()
+
+    counts, connections = run(scenario())
+    assert sorted(counts) == list(range(1, 21))
+    assert connections <= 2
@@ -0,0 +1,105 @@
+import json
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import JWTError, jwk, jwt
+
+from auth_service.core.jwks import JWKSKeySource
+from auth_service.core.security import KeyRing
+
+ISSUER = "https://issuer.test/auth/v1"
+
+def _rsa_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+def _public_jwk(private_key, kid, **fields):
+    pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    key_data = jwk.construct(pem, "RS256").to_dict()
+    key_data.update(kid=kid, **fields)
+    return key_data
+
+def _token(private_key, kid):
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    claims = {"sub": "user-1", "iss": ISSUER, "exp": int(time.time()) + 60}
+    return jwt.encode(claims, pem, algorithm="RS256", headers={"kid": kid})
+
+def _source(tmp_path, keys, **options):
+    path = tmp_path / "jwks.json"
+    path.write_text(json.dumps({"keys": keys}))
+    source = JWKSKeySource(KeyRing(), issuer=ISSUER, path=str(path), **options)
+    return source, path
+
+def _count_fetches(source, monkeypatch):
+    fetches = []
+    fetch = source._fetch
+
+    async def counting():
+        fetches.append(1)
+        return await fetch()
+
+    monkeypatch.setattr(source, "_fetch", counting)
+    return fetches
+
+def test_load_registers_signing_keys_only(run, tmp_path):
+    key = _rsa_key()
+    source, _ = _source(tmp_path, [
+        _public_jwk(key, "sig-1"),
+        _public_jwk(key, "enc-1", use="enc"),
+        {k: v for k, v in _public_jwk(key, "").items() if k != "kid"},
+    ])
+
+    assert run(source.load()) == 1
+    assert source.key_ring.kids() == ["sig-1"]
+    assert source.key_ring.decode(_token(key, "sig-1"))["sub"] == "user-1"
+
+def test_unknown_kid_refetch_is_rate_limited(run, tmp_path, monkeypatch):
+    old, new = _rsa_key(), _rsa_key()
+    source, path = _source(tmp_path, [_public_jwk(old, "old")], min_refetch_interval=30)
+    run(source.load())
+    fetches = _count_fetches(source, monkeypatch)
+    path.write_text(json.dumps({"keys": [_public_jwk(new, "new")]}))
+    token = _token(new, "new")
+
+    # Just loaded: tokens with unknown kids can't force a refetch yet
+    run(source.ensure_key_for(token))
+    assert fetches == []
+    assert not source.key_ring.has_kid("new")
+
+    source._last_attempt -= 30
+    run(source.ensure_key_for(token))
+    run(source.ensure_key_for(_token(new, "unknown")))
+    assert fetches == [1]
+    assert source.key_ring.decode(token)["sub"] == "user-1"
+
+def test_known_kid_never_refetches(run, tmp_path, monkeypatch):
+    key = _rsa_key()
+    source, _ = _source(tmp_path, [_public_jwk(key, "k1")], min_refetch_interval=0)
+    run(source.load())
+    fetches = _count_fetches(source, monkeypatch)
+
+    run(source.ensure_key_for(_token(key, "k1")))
+    assert fetches == []
+
+def test_rotated_out_keys_are_removed(run, tmp_path):
+    old, new = _rsa_key(), _rsa_key()
+    source, path = _source(tmp_path, [_public_jwk(old, "old"), _public_jwk(new, "new")])
+    run(source.load())
+    old_token = _token(old, "old")
+    assert source.key_ring.decode(old_token)["sub"] == "user-1"
+
+    path.write_text(json.dumps({"keys": [_public_jwk(new, "new")]}))
+    run(source.load())
+
+    assert source.key_ring.kids() == ["new"]
+    with pytest.raises(JWTError):
+        source.key_ring.decode(old_token)
+    assert source.key_ring.decode(_token(new, "new"))["sub"] == "user-1"
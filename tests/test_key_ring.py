@@ -0,0 +1,95 @@
+import time
+
+import pytest
+from jose import jwt
+
+from auth_service.core.jwks import JWKSKeySource
+from auth_service.core.security import KeyNotFoundError, KeyRing
+
+SECRET = "a-test-secret-that-is-long-enough-for-hs256"
+
+def _ring():
+    ring = KeyRing()
+    ring.add_key(SECRET, "HS256", kid="k1", issuer="https://issuer.test", default=True)
+    return ring
+
+def _token(headers=None, **claims):
+    claims.setdefault("sub", "user-1")
+    claims.setdefault("exp", int(time.time()) + 60)
+    return jwt.encode(claims, SECRET, algorithm="HS256", headers=headers)
+
+def test_routes_by_kid_then_issuer_then_default():
+    ring = _ring()
+    assert ring.decode(_token({"kid": "k1"}))["sub"] == "user-1"
+    assert ring.decode(_token(iss="https://issuer.test"))["sub"] == "user-1"
+    assert ring.decode(_token())["sub"] == "user-1"
+    with pytest.raises(KeyNotFoundError):
+        ring.select(_token(iss="https://other.test"))
+
+@pytest.mark.parametrize("token", [
+    _token({"kid": ["k1"]}),
+    _token({"kid": {"id": "k1"}}),
+    _token(iss=["https://issuer.test"]),
+])
+def test_malformed_kid_or_issuer_is_key_not_found(token):
+    with pytest.raises(KeyNotFoundError):
+        _ring().select(token)
+
+def test_jwks_refetch_ignores_malformed_kid(run, tmp_path):
+    path = tmp_path / "jwks.json"
+    path.write_text('{"keys": []}')
+    source = JWKSKeySource(_ring(), issuer="https://issuer.test", path=str(path))
+    run(source.ensure_key_for(_token({"kid": ["k2"]})))
+    assert source.last_loaded == 0
+
+def test_malformed_kid_is_a_401(run, client):
+    async def call():
+        async with client:
+            return await client.get(
+                "/api/v1/users/me",
+                headers={"Authorization": f"Bearer {_token({'kid': ['x']})}"},
+            )
+
+    assert run(call()).status_code == 401
+
+def test_introspection_isolates_a_malformed_token(run, client, internal_headers, monkeypatch):
+    from auth_service.dependencies import auth as auth_dependencies
+
+    good = _token({"kid": "k1"})
+    monkeypatch.setattr(auth_dependencies, "get_key_ring", _ring)
+
+    async def call():
+        async with client:
+            return await client.post(
+                "/api/v1/auth/introspect",
+                json={"tokens": [good, _token({"kid": ["x"]}), "not-a-jwt"]},
+                headers=internal_headers,
+            )
+
+    response = run(call())
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0]["active"] and results[0]["sub"] == "user-1"
+    assert [r["active"] for r in results[1:]] == [False, False]
+
+def test_introspection_survives_unexpected_errors(run, client, internal_headers, monkeypatch):
+    from auth_service.api.api_v1.endpoints import auth as auth_endpoints
+
+    async def broken(token):
+        if token == "boom":
+            raise TypeError("unhashable type: 'list'")
+        return {"sub": "user-1", "exp": 1}
+
+    monkeypatch.setattr(auth_endpoints, "verify_token", broken)
+
+    async def call():
+        async with client:
+            return await client.post(
+                "/api/v1/auth/introspect",
+                json={"tokens": ["fine", "boom"]},
+                headers=internal_headers,
+            )
+
+    response = run(call())
+    assert response.status_code == 200
+    assert [r["active"] for r in response.json()["results"]] == [True, False]
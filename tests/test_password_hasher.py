@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import threading
+
+import pytest
+
+from auth_service.core.exceptions import ServiceOverloadedException
+from auth_service.core.security import PasswordHasher, _verify_and_update, get_password_hash
+
+def test_process_pool_workers_are_spawned(run):
+    hasher = PasswordHasher(workers=1, max_queue=0, executor="process")
+
+    async def scenario():
+        hashed = await hasher.run(get_password_hash, "Passw0rd!")
+        return hashed, await hasher.run(_verify_and_update, "Passw0rd!", hashed)
+
+    try:
+        hashed, (valid, _) = run(scenario())
+        assert hasher._executor._mp_context.get_start_method() == "spawn"
+    finally:
+        hasher.close()
+    assert valid
+    assert hasher.in_flight == 0
+
+def test_full_queue_is_refused(run):
+    hasher = PasswordHasher(workers=1, max_queue=1, executor="thread")
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    async def scenario():
+        running = asyncio.ensure_future(hasher.run(block))
+        queued = asyncio.ensure_future(hasher.run(block))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(ServiceOverloadedException):
+                await hasher.run(block)
+        finally:
+            release.set()
+            await asyncio.gather(running, queued)
+
+    try:
+        run(scenario())
+    finally:
+        hasher.close()
+    assert hasher.rejected == 1
+
+def test_close_after_the_loop_is_gone_logs_nothing(caplog):
+    hasher = PasswordHasher(workers=1, max_queue=4, executor="thread")
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    loop = asyncio.new_event_loop()
+
+    async def submit():
+        # One call running, two waiting for the worker
+        return [asyncio.ensure_future(hasher.run(block)) for _ in range(3)]
+
+    calls = loop.run_until_complete(submit())
+    loop.run_until_complete(asyncio.sleep(0))
+    assert started.wait(5)
+    for call in calls:
+        call.cancel()
+    loop.run_until_complete(asyncio.gather(*calls, return_exceptions=True))
+    loop.close()
+
+    with caplog.at_level(logging.ERROR, logger="concurrent.futures"):
+        # Cancels the waiting calls and lets the running one finish
+        executor = hasher._executor
+        hasher.close()
+        release.set()
+        executor.shutdown(wait=True)
+    assert not caplog.records
@@ -0,0 +1,155 @@
+from starlette.requests import Request
+
+from auth_service.core.cache_backend import MemoryBackend, RedisBackend
+from auth_service.core.config import Settings, settings
+from auth_service.core.rate_limit import SharedRateLimiter, SlidingWindowRateLimiter, client_ip, parse_policy
+
+NOW = 1_000_000.0
+
+def test_phone_verify_is_limited_per_phone(run, client):
+    (_, ip_limit, _), (_, phone_limit, _) = parse_policy(settings.RATE_LIMIT_PHONE_VERIFY)
+    assert phone_limit < ip_limit
+
+    async def call():
+        async with client:
+            responses = []
+            # Spread over addresses so only the per-phone limit can trip, and
+            # vary the formatting, which must not count as another number
+            for i in range(phone_limit + 1):
+                phone = "+1 555 010 0001" if i % 2 else "+15550100001"
+                responses.append(await client.post(
+                    "/api/v1/auth/phone/verify",
+                    json={"phone": phone, "token": "000000"},
+                    headers={"X-Forwarded-For": f"203.0.113.{i}"},
+                ))
+            return responses
+
+    responses = run(call())
+    assert [r.status_code for r in responses[:-1]] == [400] * phone_limit
+    assert responses[-1].status_code == 429
+    assert int(responses[-1].headers["Retry-After"]) >= 1
+
+def test_refresh_is_limited_per_ip(run, client):
+    ((_, limit, _),) = parse_policy(settings.RATE_LIMIT_REFRESH)
+
+    async def call():
+        async with client:
+            return [
+                await client.post(
+                    "/api/v1/auth/refresh",
+                    json={"refresh_token": "not-a-token"},
+                    headers={"X-Forwarded-For": "203.0.113.200"},
+                )
+                for _ in range(limit + 1)
+            ]
+
+    responses = run(call())
+    assert {r.status_code for r in responses[:-1]} == {401}
+    assert responses[-1].status_code == 429
+    assert "Retry-After" in responses[-1].headers
+
+def _request(forwarded_for):
+    return Request({
+        "type": "http",
+        "headers": [(b"x-forwarded-for", forwarded_for.encode("latin-1"))],
+        "client": ("192.0.2.1", 50000),
+    })
+
+def test_forwarded_for_is_ignored_unless_trusted(monkeypatch):
+    assert Settings.model_fields["RATE_LIMIT_TRUST_FORWARDED_FOR"].default is False
+
+    monkeypatch.setattr(settings, "RATE_LIMIT_TRUST_FORWARDED_FOR", False)
+    assert client_ip(_request("203.0.113.7")) == "192.0.2.1"
+
+    monkeypatch.setattr(settings, "RATE_LIMIT_TRUST_FORWARDED_FOR", True)
+    assert client_ip(_request("198.51.100.1, 203.0.113.7")) == "203.0.113.7"
+
+def test_sliding_window_rejects_without_counting():
+    limiter = SlidingWindowRateLimiter(shards=2)
+    rules = [("login:ip:a", 3, 60.0)]
+    assert [limiter.hit(rules, now=NOW) for _ in range(3)] == [0.0] * 3
+    retry_after = limiter.hit(rules, now=NOW)
+    assert 0 < retry_after <= 60
+    # Rejected attempts don't extend the wait
+    assert limiter.hit(rules, now=NOW) == retry_after
+    assert limiter.hit(rules, now=NOW + retry_after) == 0.0
+
+def test_sliding_window_weights_the_previous_window():
+    limiter = SlidingWindowRateLimiter(shards=2)
+    rules = [("login:ip:a", 4, 60.0)]
+    for _ in range(4):
+        limiter.hit(rules, now=NOW)
+    # Early in the next window most of the previous four still count
+    start = (NOW // 60 + 1) * 60
+    assert limiter.hit(rules, now=start + 10) > 0
+    # A quarter in, they weigh 3 and one more fits
+    assert limiter.hit(rules, now=start + 15) == 0.0
+    assert limiter.hit(rules, now=start + 15) > 0
+
+def test_sliding_window_checks_every_rule_before_counting():
+    limiter = SlidingWindowRateLimiter(shards=2)
+    ip, email = ("login:ip:a", 10, 60.0), ("login:email:x", 1, 60.0)
+    assert limiter.hit([ip, email], now=NOW) == 0.0
+    assert limiter.hit([ip, email], now=NOW) > 0
+    # The rejected attempt did not use up the per-IP allowance
+    assert limiter.hit([ip], now=NOW) == 0.0
+    assert limiter.size() == 2
+
+def test_sliding_window_keys_are_bounded():
+    limiter = SlidingWindowRateLimiter(shards=4, max_keys_per_shard=10)
+    for i in range(1000):
+        limiter.hit([(f"login:ip:{i}", 5, 60.0)], now=NOW)
+    assert limiter.size() <= 40
+
+def test_shared_limiter_enforces_one_limit_across_workers(run, redis_url):
+    workers = [SharedRateLimiter(RedisBackend(redis_url)) for _ in range(2)]
+    rules = [("login:email:x", 4, 60.0)]
+
+    async def scenario():
+        try:
+            return [await workers[i % 2].hit(rules, now=NOW) for i in range(6)]
+        finally:
+            for worker in workers:
+                await worker.backend.close()
+
+    results = run(scenario())
+    assert results[:4] == [0.0] * 4
+    assert all(retry_after > 0 for retry_after in results[4:])
+
+def test_shared_limiter_takes_back_rejected_attempts(run):
+    backend = MemoryBackend()
+    limiter = SharedRateLimiter(backend)
+    rules = [("login:ip:a", 2, 60.0)]
+
+    async def scenario():
+        for _ in range(5):
+            await limiter.hit(rules, now=NOW)
+        return await backend.get(f"rate_limit:login:ip:a:{int(NOW // 60)}")
+
+    assert run(scenario()) == b"2"
+
+def test_backend_outage_falls_back_to_local_limits(run, client):
+    from auth_service.core import rate_limit
+
+    # Nothing listens on port 1, so every counter update fails
+    rate_limit._shared_rate_limiter = SharedRateLimiter(RedisBackend("redis://127.0.0.1:1/0", retry_interval=0))
+    ((_, limit, _),) = parse_policy(settings.RATE_LIMIT_REFRESH)
+
+    async def call():
+        async with client:
+            return [
+                await client.post(
+                    "/api/v1/auth/refresh",
+                    json={"refresh_token": "not-a-token"},
+                    headers={"X-Forwarded-For": "203.0.113.201"},
+                )
+                for _ in range(limit + 1)
+            ]
+
+    try:
+        responses = run(call())
+    finally:
+        rate_limit._shared_rate_limiter = None
+    assert {r.status_code for r in responses[:-1]} == {401}
+    assert responses[-1].status_code == 429
+    assert int(responses[-1].headers["Retry-After"]) >= 1
@@ -0,0 +1,135 @@
+import pytest
+
+from auth_service.core import refresh_tokens
+from auth_service.core.cache_backend import CacheBackendError, RedisBackend
+from auth_service.core.exceptions import UpstreamUnavailableException
+from auth_service.core.refresh_tokens import (
+    CacheRefreshTokenStore,
+    InMemoryRefreshTokenStore,
+    InvalidRefreshTokenError,
+    RefreshTokenManager,
+    SQLiteRefreshTokenStore,
+)
+
+TTL = 3600
+
+@pytest.fixture(params=["memory", "sqlite", "cache"])
+def manager(request, run, tmp_path):
+    """A manager over each store kind"""
+    if request.param == "memory":
+        yield RefreshTokenManager(InMemoryRefreshTokenStore(), TTL)
+    elif request.param == "sqlite":
+        store = SQLiteRefreshTokenStore(str(tmp_path / "refresh_tokens.db"))
+        yield RefreshTokenManager(store, TTL)
+        store.close()
+    else:
+        backend = RedisBackend(request.getfixturevalue("redis_url"))
+        yield RefreshTokenManager(CacheRefreshTokenStore(backend, TTL), TTL)
+        run(backend.close())
+
+def test_rotation_issues_a_new_token(run, manager):
+    async def scenario():
+        token = await manager.issue("user-1")
+        user_id, rotated = await manager.rotate(token)
+        return token, user_id, rotated
+
+    token, user_id, rotated = run(scenario())
+    assert user_id == "user-1"
+    assert rotated != token
+
+def test_reuse_revokes_the_family(run, manager):
+    async def scenario():
+        first = await manager.issue("user-1")
+        other_family = await manager.issue("user-1")
+        _, second = await manager.rotate(first)
+        with pytest.raises(InvalidRefreshTokenError, match="already been used"):
+            await manager.rotate(first)
+        # The thief's replay also kills the token the legitimate client holds
+        with pytest.raises(InvalidRefreshTokenError):
+            await manager.rotate(second)
+        # Other sessions of the same user are unaffected
+        return await manager.rotate(other_family)
+
+    user_id, _ = run(scenario())
+    assert user_id == "user-1"
+
+def test_revoke_user(run, manager):
+    async def scenario():
+        tokens = [await manager.issue("user-1") for _ in range(3)]
+        kept = await manager.issue("user-2")
+        await manager.revoke_user("user-1")
+        for token in tokens:
+            with pytest.raises(InvalidRefreshTokenError):
+                await manager.rotate(token)
+        await manager.rotate(kept)
+        # Sessions started after the logout work again
+        await manager.rotate(await manager.issue("user-1"))
+
+    run(scenario())
+
+def test_unknown_and_expired_tokens(run, manager):
+    async def scenario():
+        with pytest.raises(InvalidRefreshTokenError):
+            await manager.rotate("not-a-token")
+        expired = RefreshTokenManager(manager.store, ttl_seconds=-1)
+        token = await expired.issue("user-1")
+        with pytest.raises(InvalidRefreshTokenError):
+            await manager.rotate(token)
+
+    run(scenario())
+
+def test_cache_store_is_shared_between_workers(run, redis_url):
+    workers = [RedisBackend(redis_url), RedisBackend(redis_url)]
+    first, second = (RefreshTokenManager(CacheRefreshTokenStore(backend, TTL), TTL) for backend in workers)
+
+    async def scenario():
+        token = await first.issue("user-1")
+        _, rotated = await second.rotate(token)
+        # Replaying on the worker that issued the token is still caught
+        with pytest.raises(InvalidRefreshTokenError, match="already been used"):
+            await first.rotate(token)
+        with pytest.raises(InvalidRefreshTokenError):
+            await first.rotate(rotated)
+
+    try:
+        run(scenario())
+    finally:
+        for backend in workers:
+            run(backend.close())
+
+def test_cache_store_outage_is_a_503(run):
+    backend = RedisBackend("redis://127.0.0.1:1/0", timeout=0.1)
+    manager = RefreshTokenManager(CacheRefreshTokenStore(backend, TTL), TTL)
+    with pytest.raises(UpstreamUnavailableException):
+        run(manager.issue("user-1"))
+
+def test_cache_store_outage_during_rotate_is_a_503(run, redis_url):
+    backend = RedisBackend(redis_url)
+    manager = RefreshTokenManager(CacheRefreshTokenStore(backend, TTL), TTL)
+    token = run(manager.issue("user-1"))
+    run(backend.close())
+    # The server went away; the token must not be reported as invalid
+    backend.port = 1
+    with pytest.raises(UpstreamUnavailableException):
+        run(manager.rotate(token))
+
+def test_cache_store_write_failure_is_a_503(run, redis_url, monkeypatch):
+    backend = RedisBackend(redis_url)
+    manager = RefreshTokenManager(CacheRefreshTokenStore(backend, TTL), TTL)
+
+    async def fail(items):
+        raise CacheBackendError("connection reset")
+
+    # Only the record write fails, after the generation counter was read
+    monkeypatch.setattr(backend, "write_many", fail)
+    try:
+        with pytest.raises(UpstreamUnavailableException):
+            run(manager.issue("user-1"))
+    finally:
+        run(backend.close())
+
+def test_memory_store_refuses_several_workers(monkeypatch):
+    monkeypatch.setattr(refresh_tokens.settings, "REFRESH_TOKEN_STORE", "memory")
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    with pytest.raises(ValueError, match="single worker"):
+        refresh_tokens.create_refresh_token_store()
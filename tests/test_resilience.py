@@ -0,0 +1,139 @@
+import asyncio
+import time
+
+import pytest
+
+from auth_service.core import admission, http, resilience
+from auth_service.core.config import settings
+from auth_service.core.exceptions import UpstreamUnavailableException
+from auth_service.core.resilience import CircuitBreaker, RetryBudget
+
+PROFILES = "rest/v1/user_profiles"
+LOGIN = "auth/v1/token?grant_type=password"
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    # Breakers and the retry budget are per process; start each test from scratch
+    monkeypatch.setattr(admission, "_limiters", {})
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "_retry_budget", None)
+    monkeypatch.setattr(settings, "RETRY_BACKOFF_BASE_SECONDS", 0.001)
+
+def _send(method, endpoint, data=None):
+    url = f"{settings.SUPABASE_URL}/{endpoint}"
+    return http.send_upstream(method, url, endpoint, headers={"apikey": settings.SUPABASE_KEY}, data=data)
+
+def _count_requests():
+    requests = []
+
+    async def on_request(request):
+        requests.append(request.method)
+
+    http._client.event_hooks["request"].append(on_request)
+    return requests
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_breaker_lets_one_probe_through_when_half_open():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0)
+    _open(breaker)
+
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+def test_released_probe_lets_the_next_call_probe():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0)
+    _open(breaker)
+
+    assert breaker.allow()
+    breaker.cancel_probe()
+    assert breaker.allow()
+
+def test_breaker_opens_and_fails_fast(run, emulate):
+    # 500 isn't retried, so each call is one failure
+    emulate(EMULATOR_ERROR_RATE=1.0, EMULATOR_ERROR_STATUS=500)
+    requests = _count_requests()
+
+    async def scenario():
+        for _ in range(settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD):
+            response = await _send("GET", PROFILES)
+            assert response.status_code == 500
+        with pytest.raises(UpstreamUnavailableException) as error:
+            await _send("GET", PROFILES)
+        return error.value
+
+    error = run(scenario())
+    assert len(requests) == settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+    assert error.headers["Retry-After"] == str(int(settings.CIRCUIT_BREAKER_RECOVERY_SECONDS))
+
+def test_cancelled_probe_releases_the_half_open_slot(run, emulate):
+    emulate(EMULATOR_LATENCY="fixed:100")
+    breaker = resilience.get_circuit_breaker(PROFILES)
+    _open(breaker)
+    breaker.opened_at = time.monotonic() - breaker.recovery_timeout
+
+    async def scenario():
+        probe = asyncio.ensure_future(_send("GET", PROFILES))
+        await asyncio.sleep(0.01)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await _send("GET", PROFILES)
+
+    response = run(scenario())
+    assert response.status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_transient_errors_are_retried_for_idempotent_methods(run, emulate):
+    emulate(EMULATOR_ERROR_RATE=1.0, EMULATOR_ERROR_STATUS=503)
+    requests = _count_requests()
+
+    response = run(_send("GET", PROFILES))
+    assert response.status_code == 503
+    assert requests == ["GET"] * (1 + settings.RETRY_MAX_ATTEMPTS)
+
+def test_post_is_not_retried(run, emulate):
+    emulate(EMULATOR_ERROR_RATE=1.0, EMULATOR_ERROR_STATUS=503)
+    requests = _count_requests()
+
+    response = run(_send("POST", LOGIN, {"email": "ada@example.com", "password": "secret"}))
+    assert response.status_code == 503
+    assert requests == ["POST"]
+
+def test_retries_stop_when_the_budget_is_spent(run, emulate, monkeypatch):
+    monkeypatch.setattr(resilience, "_retry_budget", RetryBudget(ratio=0.5, min_per_second=0))
+    emulate(EMULATOR_ERROR_RATE=1.0, EMULATOR_ERROR_STATUS=503)
+    requests = _count_requests()
+
+    async def scenario():
+        # Two calls deposit one token between them: a single retry
+        await _send("GET", PROFILES)
+        await _send("GET", PROFILES)
+
+    run(scenario())
+    assert len(requests) == 3
+
+def test_retry_budget_refills_with_requests_and_time():
+    budget = RetryBudget(ratio=0.5, min_per_second=0)
+    assert not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+    budget = RetryBudget(ratio=0, min_per_second=1000)
+    budget.tokens = 0
+    time.sleep(0.01)
+    assert budget.withdraw()
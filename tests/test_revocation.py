@@ -0,0 +1,147 @@
+import time
+import uuid
+
+import httpx
+import pytest
+
+from auth_service.core import revocation
+from auth_service.core.cache_backend import RedisBackend
+from auth_service.core.config import settings
+from auth_service.core.revocation import BloomFilter, RevocationList
+
+def _exp(seconds=3600):
+    return int(time.time()) + seconds
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    items = [uuid.uuid4().hex for _ in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    others = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+    assert others < 300
+
+def test_filter_false_positive_falls_back_to_the_exact_set(run):
+    revoked = RevocationList(capacity=16)
+    run(revoked.revoke("jti-1", _exp()))
+    # A saturated filter matches every id
+    revoked._filter._bits[:] = b"\xff" * len(revoked._filter._bits)
+    assert not revoked.is_revoked("jti-2")
+    assert revoked.is_revoked("jti-1")
+    assert revoked.false_positives == 1
+
+def test_revoked_jti_survives_snapshot_and_restore(run, tmp_path):
+    path = str(tmp_path / "revoked.json")
+    before = RevocationList(snapshot_path=path)
+    run(before.revoke("jti-live", _exp()))
+    run(before.revoke("jti-soon", _exp(1)))
+    before.snapshot()
+
+    after = RevocationList(snapshot_path=path)
+    time.sleep(1.1)
+    # Entries whose token expired in the meantime are not brought back
+    assert after.restore() == 1
+    assert after.is_revoked("jti-live")
+    assert not after.is_revoked("jti-soon")
+
+def test_compaction_drops_expired_entries(run):
+    revoked = RevocationList(capacity=4)
+    for i in range(10):
+        run(revoked.revoke(f"jti-{i}", _exp(60 if i % 2 else 3600)))
+    assert len(revoked) == 10
+    assert revoked.compact(now=time.time() + 120) == 5
+    assert len(revoked) == 5
+    assert all(revoked.is_revoked(f"jti-{i}") == (i % 2 == 0) for i in range(10))
+
+def test_filter_grows_with_the_list(run):
+    revoked = RevocationList(capacity=8)
+    for i in range(100):
+        run(revoked.revoke(f"jti-{i}", _exp()))
+    assert revoked._filter.capacity >= 100
+    assert all(revoked.is_revoked(f"jti-{i}") for i in range(100))
+
+def test_logged_out_token_is_rejected_after_restart(run, client, tmp_path):
+    email = f"{uuid.uuid4().hex}@example.com"
+    path = str(tmp_path / "revoked.json")
+
+    async def log_out():
+        async with client:
+            await client.post("/api/v1/auth/signup", json={
+                "email": email, "password": "Passw0rd!", "first_name": "Ada", "last_name": "Lovelace",
+            })
+            login = await client.post(
+                "/api/v1/auth/login",
+                data={"username": email, "password": "Passw0rd!"},
+                headers={"X-Forwarded-For": "198.51.100.30"},
+            )
+            token = login.json()["access_token"]
+            await client.post("/api/v1/auth/logout", headers={"Authorization": f"Bearer {token}"})
+            return token
+
+    async def me(token):
+        from auth_service.main import app
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver") as fresh:
+            return await fresh.get("/api/v1/users/me", headers={"Authorization": f"Bearer {token}"})
+
+    token = run(log_out())
+    revocation.get_revocation_list().snapshot(path)
+    # A restarted worker only knows what the snapshot restores
+    restarted = RevocationList(snapshot_path=path)
+    previous, revocation._revocation_list = revocation._revocation_list, restarted
+    try:
+        run(restarted.start())
+        assert len(restarted) >= 1
+        assert run(me(token)).status_code == 401
+    finally:
+        run(restarted.stop())
+        revocation._revocation_list = previous
+
+def _worker(redis_url, name):
+    backend = RedisBackend(redis_url)
+    backend.instance_id = name
+    return backend
+
+def test_worker_started_later_loads_stored_revocations(run, redis_url):
+    early, late = _worker(redis_url, "worker-a"), _worker(redis_url, "worker-b")
+
+    async def scenario():
+        try:
+            await RevocationList(backend=early).revoke("jti-1", _exp())
+            # Never heard the broadcast
+            restarted = RevocationList(backend=late)
+            await restarted.start()
+            await restarted.stop()
+            return restarted
+        finally:
+            await early.close()
+            await late.close()
+
+    restarted = run(scenario())
+    assert restarted.is_revoked("jti-1")
+
+def test_lost_subscription_reloads_stored_revocations(run, redis_url):
+    a, b = _worker(redis_url, "worker-a"), _worker(redis_url, "worker-b")
+    listening = RevocationList(backend=b)
+
+    async def scenario():
+        try:
+            await RevocationList(backend=a).revoke("jti-2", _exp())
+            # What the listener reports after reconnecting
+            b._dispatch(settings.CACHE_INVALIDATION_CHANNEL, None)
+            await listening._reload
+        finally:
+            await a.close()
+            await b.close()
+
+    run(scenario())
+    assert listening.is_revoked("jti-2")
+
+def test_revoke_fails_loudly_when_the_store_is_down(run):
+    from auth_service.core.exceptions import UpstreamUnavailableException
+
+    revoked = RevocationList(backend=RedisBackend("redis://127.0.0.1:1/0", timeout=0.1))
+    with pytest.raises(UpstreamUnavailableException):
+        run(revoked.revoke("jti-3", _exp()))
+    # This worker still rejects the token
+    assert revoked.is_revoked("jti-3")
@@ -0,0 +1,108 @@
+import json
+import logging
+import time
+
+import httpx
+import pytest
+
+from auth_service.core import cache_backend, jwks, refresh_tokens, revocation, tracing
+from auth_service.core.cache_backend import MemoryBackend, RedisBackend
+from auth_service.core.jwks import JWKSKeySource
+from auth_service.core.revocation import RevocationList
+from auth_service.core.security import get_key_ring
+
+@pytest.fixture
+def serverless(supabase, redis_url, run, monkeypatch):
+    """The serverless entry point, as if the function had just initialized"""
+    # Instances share nothing else, so the entry point requires a shared backend
+    backend = RedisBackend(redis_url)
+    monkeypatch.setattr(cache_backend, "_backend", backend)
+    monkeypatch.setattr(refresh_tokens, "_manager", None)
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    from auth_service import serverless
+
+    root.handlers, root.level = handlers, level
+    monkeypatch.setattr(serverless, "_services_started", False)
+    monkeypatch.setattr(serverless, "_services_lock", None)
+    yield serverless
+    run(backend.close())
+
+def _client(serverless):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=serverless.app), base_url="http://testserver")
+
+def test_cold_start_is_reported_on_the_first_response_only(run, serverless):
+    async def call():
+        async with _client(serverless) as client:
+            return await client.get("/health"), await client.get("/health")
+
+    first, second = run(call())
+    assert first.status_code == second.status_code == 200
+    assert "coldstart;dur=" in first.headers["server-timing"]
+    assert "coldstart" not in second.headers.get("server-timing", "")
+
+def test_first_request_restores_revocations(run, serverless, tmp_path, monkeypatch):
+    path = tmp_path / "revoked.json"
+    path.write_text(json.dumps({"version": 1, "revoked": {"jti-1": int(time.time()) + 3600}}))
+    monkeypatch.setattr(revocation, "_revocation_list", RevocationList(snapshot_path=str(path)))
+
+    async def call():
+        async with _client(serverless) as client:
+            await client.get("/health")
+
+    run(call())
+    assert revocation.get_revocation_list().is_revoked("jti-1")
+
+def test_traces_are_exported_before_the_invocation_ends(run, serverless, monkeypatch):
+    exported = []
+
+    class Exporter:
+        def __init__(self):
+            self.buffer = []
+
+        def submit(self, trace):
+            self.buffer.append(trace)
+
+        async def flush(self):
+            exported.append(len(self.buffer))
+            self.buffer = []
+
+    monkeypatch.setattr(tracing, "_exporter", Exporter())
+
+    async def call():
+        async with _client(serverless) as client:
+            await client.get("/health")
+            await client.get("/health")
+
+    run(call())
+    assert exported == [1, 1]
+
+def test_jwks_keys_load_on_first_request_and_reload_when_stale(run, serverless, tmp_path, monkeypatch):
+    path = tmp_path / "jwks.json"
+    path.write_text(json.dumps({"keys": []}))
+    source = JWKSKeySource(get_key_ring(), issuer="http://issuer.test", path=str(path), refresh_interval=600)
+    monkeypatch.setattr(jwks, "_jwks_source", source)
+
+    async def call():
+        async with _client(serverless) as client:
+            await client.get("/health")
+            loaded = source.last_loaded
+            await client.get("/health")
+            fresh = source.last_loaded
+            # As if the instance had been frozen past the refresh interval
+            source.last_loaded -= 3600
+            source._last_attempt -= 3600
+            await client.get("/health")
+            return loaded, fresh, source.last_loaded
+
+    loaded, fresh, reloaded = run(call())
+    assert loaded > 0
+    assert fresh == loaded
+    assert reloaded >= loaded
+
+@pytest.mark.parametrize("store", ["auto", "memory", "sqlite"])
+def test_per_instance_refresh_store_is_refused(serverless, monkeypatch, store):
+    monkeypatch.setattr(cache_backend, "_backend", MemoryBackend())
+    monkeypatch.setattr(refresh_tokens.settings, "REFRESH_TOKEN_STORE", store)
+    with pytest.raises(ValueError, match="shared CACHE_BACKEND"):
+        serverless.check_settings()
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from auth_service.core.singleflight import SingleFlight
+
+def test_concurrent_callers_share_one_call(run):
+    flights = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def scenario():
+        return await asyncio.gather(*(flights.do("key", fetch) for _ in range(5)))
+
+    assert run(scenario()) == ["result"] * 5
+    assert len(calls) == 1
+    assert flights.in_flight() == 0
+
+def test_cancelling_one_caller_keeps_the_shared_call(run):
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def scenario():
+        first = asyncio.ensure_future(flights.do("key", fetch))
+        second = asyncio.ensure_future(flights.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert run(scenario()) == "result"
+
+def test_caller_after_last_cancel_starts_fresh_work(run):
+    flights = SingleFlight()
+    attempts = []
+
+    async def fetch():
+        attempts.append(1)
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            # e.g. closing an upstream connection
+            await asyncio.sleep(0.01)
+            raise
+        return "stale"
+
+    async def fresh():
+        return "fresh"
+
+    async def scenario():
+        first = asyncio.ensure_future(flights.do("key", fetch))
+        await asyncio.sleep(0)
+        shared = flights._calls["key"].task
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        # The cancelled task is still unwinding, but it is no longer shared
+        assert flights.in_flight() == 0
+        result = await flights.do("key", fresh)
+        await asyncio.gather(shared, return_exceptions=True)
+        return result
+
+    assert run(scenario()) == "fresh"
+    assert len(attempts) == 1
@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+import pytest
+from jose import JWTError, jwt
+
+from auth_service.core import cache
+from auth_service.core.cache import TokenCache
+from auth_service.core.security import create_access_token
+from auth_service.dependencies import auth as auth_dependencies
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+@pytest.fixture
+def token_cache(monkeypatch):
+    token_cache = TokenCache(max_size=10, max_ttl=300)
+    monkeypatch.setattr(auth_dependencies, "token_cache", token_cache)
+    return token_cache
+
+def test_entries_expire_at_max_ttl_before_a_later_exp(clock):
+    token_cache = TokenCache(max_size=10, max_ttl=300)
+    token_cache.set("token", {"sub": "user-1"}, exp=clock.now + 3600)
+
+    clock.now += 299
+    assert token_cache.get("token") == {"sub": "user-1"}
+    clock.now += 1
+    assert token_cache.get("token") is None
+
+def test_entries_expire_at_exp_before_max_ttl(clock):
+    token_cache = TokenCache(max_size=10, max_ttl=300)
+    token_cache.set("token", {"sub": "user-1"}, exp=clock.now + 60)
+
+    clock.now += 59
+    assert token_cache.get("token") is not None
+    clock.now += 1
+    assert token_cache.get("token") is None
+
+def test_expired_tokens_are_not_stored(clock):
+    token_cache = TokenCache(max_size=10, max_ttl=300)
+    token_cache.set("token", {"sub": "user-1"}, exp=clock.now)
+    assert token_cache.stats()["size"] == 0
+
+def test_least_recently_used_entry_is_evicted():
+    token_cache = TokenCache(max_size=2, max_ttl=300)
+    token_cache.set("a", {"sub": "a"})
+    token_cache.set("b", {"sub": "b"})
+    token_cache.get("a")
+    token_cache.set("c", {"sub": "c"})
+    assert token_cache.get("b") is None
+    assert token_cache.get("a") is not None
+    assert token_cache.get("c") is not None
+
+def test_cached_claims_are_copies():
+    token_cache = TokenCache(max_size=2, max_ttl=300)
+    token_cache.set("token", {"sub": "user-1"})
+    token_cache.get("token")["sub"] = "someone-else"
+    assert token_cache.get("token") == {"sub": "user-1"}
+
+def test_verified_tokens_are_cached(run, token_cache):
+    token = create_access_token("user-1")
+    assert run(auth_dependencies.verify_token(token))["sub"] == "user-1"
+    assert token_cache.get(token)["sub"] == "user-1"
+
+@pytest.mark.parametrize("token", [
+    jwt.encode({"sub": "user-1", "iss": "wiz-auth"}, "a-different-secret", algorithm="HS256"),
+    create_access_token("user-1", expires_delta=timedelta(seconds=-60)),
+    "not-a-jwt",
+])
+def test_failed_verifications_are_never_cached(run, token_cache, token):
+    for _ in range(2):
+        with pytest.raises(JWTError):
+            run(auth_dependencies.verify_token(token))
+    assert token_cache.stats()["size"] == 0
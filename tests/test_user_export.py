@@ -0,0 +1,62 @@
+import json
+import uuid
+
+from auth_service.core import http
+
+def _fill(supabase, count):
+    for i in range(count):
+        row_id = str(uuid.UUID(int=i + 1))
+        supabase.profiles[row_id] = {"id": row_id, "first_name": "Ada", "last_name": f"User{i}"}
+
+def _count_profile_fetches():
+    fetches = []
+
+    async def on_request(request):
+        if "/rest/v1/" in request.url.path:
+            fetches.append(request.url)
+
+    http._client.event_hooks["request"].append(on_request)
+    return fetches
+
+def test_export_streams_every_row_in_order(run, client, supabase, internal_headers):
+    _fill(supabase, 250)
+
+    async def call():
+        async with client:
+            return await client.get("/api/v1/admin/users/export?page_size=100", headers=internal_headers)
+
+    response = run(call())
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["last_name"] for row in rows] == [f"User{i}" for i in range(250)]
+
+def test_abandoned_export_stops_fetching_pages(run, supabase, internal_headers):
+    from auth_service.main import app
+
+    _fill(supabase, 2000)
+    fetches = _count_profile_fetches()
+    scope = {
+        "type": "http",
+        # Servers on ASGI 2.3 drop sends after a disconnect instead of failing them
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/v1/admin/users/export",
+        "raw_path": b"/api/v1/admin/users/export",
+        "query_string": b"page_size=100",
+        "root_path": "",
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in internal_headers.items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    run(app(scope, receive, send))
+    # The first page and the one prefetched behind it, not all 21
+    assert len(fetches) <= 3
@@ -0,0 +1,124 @@
+import json
+import logging
+import tracemalloc
+
+from auth_service.core import tracing
+from auth_service.core.config import settings
+
+def _rows(count, email=None):
+    for i in range(count):
+        row = {
+            "email": email or f"user{i}@example.com",
+            "password": "Passw0rd!",
+            "first_name": "Ada",
+            "last_name": f"User{i}",
+        }
+        yield (json.dumps(row) + "\n").encode("utf-8")
+
+async def _stream_import(app, headers, chunks, on_line):
+    """Drive the import endpoint over raw ASGI, handing each response line to ``on_line``.
+
+    httpx's ASGI transport buffers the whole response, which would hide
+    what the endpoint holds while it streams.
+    """
+    chunks = iter(chunks)
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/api/v1/admin/users/import",
+        "raw_path": b"/api/v1/admin/users/import",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+
+    async def receive():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.request", "body": chunk, "more_body": True}
+
+    status = {}
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+        elif message["type"] == "http.response.body":
+            for line in message.get("body", b"").splitlines():
+                on_line(json.loads(line))
+
+    await app(scope, receive, send)
+    return status["code"]
+
+class _CapturingExporter:
+    def __init__(self):
+        self.traces = []
+
+    def submit(self, trace):
+        self.traces.append(trace)
+
+def test_import_reports_each_row(run, client, internal_headers):
+    body = b"".join(_rows(3)) + b"{not json\n" + next(_rows(1))
+
+    async def call():
+        async with client:
+            return await client.post("/api/v1/admin/users/import", content=body, headers=internal_headers)
+
+    response = run(call())
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    statuses = {line["row"]: line["status"] for line in lines if "row" in line}
+    assert statuses == {1: "created", 2: "created", 3: "created", 4: "invalid", 5: "exists"}
+    assert lines[-1]["summary"]["rows"] == 5
+    assert "Passw0rd!" not in response.text
+
+def test_import_trace_keeps_bounded_spans(run, client, internal_headers, monkeypatch):
+    exporter = _CapturingExporter()
+    monkeypatch.setattr(tracing, "_exporter", exporter)
+    rows = settings.TRACE_MAX_SPANS * 2
+
+    async def call():
+        async with client:
+            return await client.post("/api/v1/admin/users/import", content=b"".join(_rows(rows)), headers=internal_headers)
+
+    assert run(call()).status_code == 200
+    (trace,) = exporter.traces
+    assert len(trace.spans) == settings.TRACE_MAX_SPANS
+    # Signup and profile creation per row, all still counted for Server-Timing
+    assert trace.dropped_spans == rows * 2 + 1 - settings.TRACE_MAX_SPANS
+    assert f'upstream;desc="{rows * 2} calls"' in trace.server_timing()
+
+def test_import_memory_stays_flat(run, supabase, internal_headers, monkeypatch):
+    from auth_service.main import app
+
+    # pytest keeps every captured record, which would be the growth measured
+    monkeypatch.setattr(logging.getLogger("auth_service.services.auth"), "disabled", True)
+
+    # Every row after the first hits an existing user, so the emulator's
+    # own state doesn't grow with the import
+    rows, warmup = 3000, 500
+    samples = {}
+
+    def on_line(line):
+        if line.get("row") in (warmup, rows):
+            samples[line["row"]] = tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.start()
+    try:
+        status = run(_stream_import(app, internal_headers, _rows(rows, email="same@example.com"), on_line))
+    finally:
+        tracemalloc.stop()
+
+    assert status == 200
+    assert samples[rows] - samples[warmup] < 256 * 1024
+
+def test_admin_routes_share_the_user_service():
+    # One ProfileCache and one invalidation handler per process
+    from auth_service.api.api_v1.endpoints import admin, auth, users
+
+    assert admin.user_service is users.user_service
+    assert admin.auth_service is auth.auth_service